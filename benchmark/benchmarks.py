@@ -0,0 +1,194 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import ssqn
+from lib import utils
+from lib.constant import *
+from lib.measurement_arrays import MeasurementArrays
+from benchmark.synthetic_data import generate_sample_locations, write_sample_locations
+
+STAGES = ["biomarkerQC", "surrogateQC", "sewage_flow", "water_quality", "sewageNormalization"]
+DETECTORS = ["iqr", "zscore", "ci", "lof", "svm", "rf"]
+
+
+class BenchmarkResult:
+
+    def __init__(self, name, rows, seconds, peak_memory):
+        self.name = name
+        self.rows = rows
+        self.seconds = seconds
+        self.peak_memory = peak_memory
+
+    def get_rows_per_second(self):
+        return self.rows / self.seconds if self.seconds > 0 else float("inf")
+
+    def to_dict(self):
+        return {"rows": self.rows, "seconds": self.seconds, "rows_per_second": self.get_rows_per_second(),
+                "peak_memory_mb": self.peak_memory / 2 ** 20}
+
+    def __str__(self):
+        return "{:<32} {:>8} rows {:>10.3f} s {:>12.1f} rows/s {:>9.1f} MB".format(
+            self.name, self.rows, self.seconds, self.get_rows_per_second(), self.peak_memory / 2 ** 20)
+
+
+class SewageQualityBenchmark:
+    """
+    Benchmarks of the quality control on synthetic sample locations: each stage of the vectorized engine,
+    each outlier detector of 'utils.detect_outliers' and the end-to-end 'run_quality_control'.
+    The time is the best of 'repeats' runs, the peak memory is measured in a separate run with tracemalloc.
+    """
+
+    def __init__(self, work_folder, num_locations=2, num_years=2, repeats=3, detector_calls=50, **generator_args):
+        self.work_folder = work_folder
+        self.repeats = repeats
+        self.detector_calls = detector_calls
+        self.sample_locations = generate_sample_locations(num_locations, num_years, **generator_args)
+        self.input_file = os.path.join(work_folder, "synthetic_input.parquet")
+        write_sample_locations(self.sample_locations, self.input_file)
+
+    def __create_sewage_quality(self, engine="vectorized"):
+        output_folder = os.path.join(self.work_folder, "output")
+        args = ssqn.create_argument_parser().parse_args(["-i", self.input_file, "-o", output_folder, "-r", "-q",
+                                                         "--no-plots", "--engine", engine])
+        sewage_quality = ssqn.create_sewage_quality(args)
+        sewage_quality.database.output_folder = os.path.join(self.work_folder, "database")
+        return sewage_quality
+
+    def __measure(self, name, rows, run, setup=lambda: None) -> BenchmarkResult:
+        seconds = float("inf")
+        for _ in range(self.repeats):
+            state = setup()
+            start = time.perf_counter()
+            run(state)
+            seconds = min(seconds, time.perf_counter() - start)
+        state = setup()
+        tracemalloc.start()
+        try:
+            run(state)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return BenchmarkResult(name, rows, seconds, peak_memory)
+
+    def run_stage_benchmarks(self) -> list:
+        sewage_quality = self.__create_sewage_quality()
+        prepared = [(sample_location, sewage_quality.prepare_measurements(sample_location, measurements))
+                    for sample_location, measurements in sewage_quality.sewage_samples]
+        rows = sum(measurements.shape[0] for _, measurements in prepared)
+        results = [self.__measure("setup", rows, lambda _: [sewage_quality.prepare_measurements(sample_location, measurements)
+                                                            for sample_location, measurements in self.sample_locations.items()])]
+
+        def create_arrays():
+            return [(sample_location, MeasurementArrays(measurements.copy())) for sample_location, measurements in prepared]
+
+        results.append(self.__measure("measurement_arrays", rows, lambda _: create_arrays()))
+        for stage_idx, stage in enumerate(STAGES):
+            def setup():
+                # the stage runs on the results of all previous stages
+                location_arrays = create_arrays()
+                for sample_location, arrays in location_arrays:
+                    for previous_stage in STAGES[:stage_idx]:
+                        getattr(sewage_quality, previous_stage).process_location(sample_location, arrays)
+                return location_arrays
+
+            def run(location_arrays):
+                for sample_location, arrays in location_arrays:
+                    getattr(sewage_quality, stage).process_location(sample_location, arrays)
+            results.append(self.__measure(stage, rows, run, setup))
+        return results
+
+    def run_detector_benchmarks(self) -> list:
+        measurements = next(iter(self.sample_locations.values()))
+        values = measurements[Columns.BIOMARKER_N1.value].dropna().to_numpy()
+        window_size = min(values.shape[0] - 1, 30)
+        positions = np.linspace(window_size, values.shape[0] - 1, self.detector_calls).astype(int)
+        max_size = utils.fitted_model_cache.max_size
+        # each call fits the models, as for new measurements
+        utils.fitted_model_cache.max_size = 0
+        results = []
+        try:
+            for detector in DETECTORS:
+                def run(_):
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        for position in positions:
+                            utils.detect_outliers([detector], values[position - window_size:position], values[position])
+                results.append(self.__measure("detect_outliers[{}]".format(detector), len(positions), run))
+            window_starts = np.maximum(np.arange(values.shape[0]) - window_size, 0)
+            window_ends = np.arange(values.shape[0])
+            for detector in ["iqr", "zscore", "ci"]:
+                results.append(self.__measure("detect_outliers_in_windows[{}]".format(detector), values.shape[0],
+                                              lambda _: utils.detect_outliers_in_windows([detector], values, window_starts,
+                                                                                         window_ends, values)))
+        finally:
+            utils.fitted_model_cache.max_size = max_size
+        return results
+
+    def run_end_to_end_benchmarks(self, engines=("vectorized",)) -> list:
+        rows = sum(measurements.shape[0] for measurements in self.sample_locations.values())
+        return [self.__measure("run_quality_control[{}]".format(engine), rows, lambda sewage_quality: sewage_quality.run_quality_control(),
+                               lambda: self.__create_sewage_quality(engine)) for engine in engines]
+
+    def run(self, engines=("vectorized",)) -> list:
+        return self.run_stage_benchmarks() + self.run_detector_benchmarks() + self.run_end_to_end_benchmarks(engines)
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the benchmarks whose throughput dropped by more than 'tolerance' (fraction) compared to the baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["rows_per_second"] < baseline[name]["rows_per_second"] * (1 - tolerance):
+            regressions.append("{}: {:.1f} rows/s (baseline {:.1f} rows/s)".format(name, result["rows_per_second"],
+                                                                                   baseline[name]["rows_per_second"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the sewage quality control on synthetic data")
+    parser.add_argument('--locations', metavar="INT", default=2, type=int, help="Number of synthetic sample locations. (default: 2)")
+    parser.add_argument('--years', metavar="FLOAT", default=2, type=float, help="Years of measurements per sample location. (default: 2)")
+    parser.add_argument('--samples_per_week', metavar="INT", default=2, type=int, help="Measurements per week. (default: 2)")
+    parser.add_argument('--missing_rate', metavar="FLOAT", default=0.05, type=float, help="Fraction of missing values. (default: 0.05)")
+    parser.add_argument('--comment_rate', metavar="FLOAT", default=0.05, type=float, help="Fraction of commented measurements. (default: 0.05)")
+    parser.add_argument('--outlier_rate', metavar="FLOAT", default=0.02, type=float, help="Fraction of outlier values. (default: 0.02)")
+    parser.add_argument('--seed', metavar="INT", default=0, type=int, help="Seed of the synthetic data. (default: 0)")
+    parser.add_argument('--repeats', metavar="INT", default=3, type=int, help="Repeats of each benchmark, the best time is reported. (default: 3)")
+    parser.add_argument('--detector_calls', metavar="INT", default=50, type=int, help="Calls of each outlier detector. (default: 50)")
+    parser.add_argument('--engines', metavar="ENGINE", nargs="+", default=["vectorized"], choices=["legacy", "vectorized"],
+                        help="Engines of the end-to-end benchmark. (default: vectorized)")
+    parser.add_argument('--save', metavar="FILE", type=str, help="Save the results as json file.")
+    parser.add_argument('--baseline', metavar="FILE", type=str, help="Compare the results to a saved json file and exit with 1 on regressions.")
+    parser.add_argument('--tolerance', metavar="FLOAT", default=0.2, type=float,
+                        help="Allowed throughput drop compared to the baseline. (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as work_folder:
+        benchmark = SewageQualityBenchmark(work_folder, args.locations, args.years, args.repeats, args.detector_calls,
+                                           samples_per_week=args.samples_per_week, missing_rate=args.missing_rate,
+                                           comment_rate=args.comment_rate, outlier_rate=args.outlier_rate, seed=args.seed)
+        results = dict()
+        for result in benchmark.run(args.engines):
+            print(result)
+            results[result.name] = result.to_dict()
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print("Regression: {}".format(regression), file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+from lib.constant import Columns
+
+# log offsets of the biomarkers to the common virus load
+BIOMARKER_LOG_OFFSETS = {Columns.BIOMARKER_N1.value: 0.0, Columns.BIOMARKER_N2.value: -0.7, Columns.BIOMARKER_N3.value: 1.0,
+                         Columns.BIOMARKER_E.value: 0.3, Columns.BIOMARKER_ORF.value: 0.2, Columns.BIOMARKER_RDRP.value: 0.4}
+DEFAULT_BIOMARKERS = [Columns.BIOMARKER_N1.value, Columns.BIOMARKER_N2.value, Columns.BIOMARKER_RDRP.value]
+
+
+def generate_measurements(num_years=2, samples_per_week=2, missing_rate=0.05, comment_rate=0.05, outlier_rate=0.02,
+                          biomarkers=None, rain_rate=0.3, start_date="2021-01-04", seed=0) -> pd.DataFrame:
+    """
+    Generates the measurements of a sample location in the 'Columns' schema, as read from the input files.
+    The biomarkers follow a common virus load wave, rain dilutes all values and increases the mean sewage flow.
+    :param num_years: years of measurements
+    :param samples_per_week: measurements per week (1 - 7)
+    :param missing_rate: fraction of missing values of each measured column
+    :param comment_rate: fraction of measurements with a lab or operation comment
+    :param outlier_rate: fraction of values of each measured column multiplied or divided by 10
+    :param biomarkers: measured biomarker columns, the other biomarker columns are empty
+    :param rain_rate: fraction of measurements on rainy days
+    """
+    rng = np.random.default_rng(seed)
+    biomarkers = DEFAULT_BIOMARKERS if biomarkers is None else biomarkers
+    num_weeks = int(round(num_years * 52))
+    weekdays = np.sort(rng.choice(5, size=min(samples_per_week, 5), replace=False)) if samples_per_week <= 5 \
+        else np.arange(samples_per_week)
+    day_offsets = (np.arange(num_weeks)[:, np.newaxis] * 7 + weekdays[np.newaxis, :]).ravel()
+    num_samples = day_offsets.shape[0]
+    dates = pd.Timestamp(start_date) + pd.to_timedelta(day_offsets, unit="D")
+
+    # virus load: seasonal waves and a random walk
+    virus_load = 3.5 + 1.2 * np.sin(2 * np.pi * day_offsets / 180) + np.cumsum(rng.normal(0, 0.05, num_samples))
+    is_rain = rng.random(num_samples) < rain_rate
+    dilution = np.where(is_rain, rng.uniform(1.5, 4.0, num_samples), rng.uniform(0.9, 1.1, num_samples))
+
+    measurements = pd.DataFrame()
+    measurements[Columns.DATE.value] = dates.strftime("%Y-%m-%d")
+    measurements[Columns.COMMENT_ANALYSIS.value] = pd.Series(["Probe {} verdünnt".format(i) for i in range(num_samples)]) \
+        .where(rng.random(num_samples) < comment_rate)
+    measurements[Columns.COMMENT_OPERATION.value] = pd.Series(["keine Probenabholung"] * num_samples) \
+        .where(rng.random(num_samples) < comment_rate / 5)
+    for biomarker in Columns.get_biomarker_columns():
+        if biomarker in biomarkers:
+            values = np.exp(virus_load + BIOMARKER_LOG_OFFSETS[biomarker] + rng.normal(0, 0.25, num_samples)) / dilution
+        else:
+            values = np.full(num_samples, np.NAN)
+        measurements[biomarker] = values
+    measurements[Columns.AMMONIUM.value] = rng.normal(45, 6, num_samples) / dilution
+    measurements[Columns.CONDUCTIVITY.value] = np.round(rng.normal(1400, 150, num_samples) / np.sqrt(dilution))
+    measurements[Columns.MEAN_SEWAGE_FLOW.value] = rng.normal(60, 5, num_samples) * dilution
+    measurements[Columns.CRASSPHAGE.value] = np.exp(rng.normal(np.log(3e5), 0.4, num_samples)) / dilution
+    measurements[Columns.PMMOV.value] = np.exp(rng.normal(np.log(2e5), 0.4, num_samples)) / dilution
+    measurements[Columns.TROCKENTAG.value] = np.where(is_rain, "Nein", "Ja")
+
+    for column in biomarkers + [Columns.AMMONIUM.value, Columns.CONDUCTIVITY.value, Columns.MEAN_SEWAGE_FLOW.value,
+                                Columns.CRASSPHAGE.value, Columns.PMMOV.value]:
+        values = measurements[column].to_numpy()
+        is_outlier = rng.random(num_samples) < outlier_rate
+        values[is_outlier] *= np.where(rng.random(num_samples) < 0.5, 10.0, 0.1)[is_outlier]
+        values[rng.random(num_samples) < missing_rate] = np.NAN
+        measurements[column] = values
+    return measurements
+
+
+def generate_sample_locations(num_locations=2, num_years=2, seed=0, **kwargs) -> dict:
+    """ Generates the measurements of 'num_locations' sample locations, see 'generate_measurements' """
+    return {"synthetic_location_{:03d}".format(location): generate_measurements(num_years=num_years, seed=seed + location, **kwargs)
+            for location in range(num_locations)}
+
+
+def write_sample_locations(sample_locations: dict, output_file: str):
+    """ Writes the sample locations as parquet input file for ssqn.py with the original input column names """
+    from lib.utils import column_map
+    input_columns = {value: key for key, value in column_map.items()}
+    frames = []
+    for sample_location, measurements in sample_locations.items():
+        frames.append(measurements.rename(columns=input_columns).assign(location=sample_location))
+    pd.concat(frames, ignore_index=True).to_parquet(output_file, index=False)
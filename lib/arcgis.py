@@ -1,34 +1,112 @@
 # Created by alex at 15.06.23
 # import sys
 import logging
-from arcgis.gis import GIS
-from arcgis.features import FeatureLayer
+from typing import List
+import numpy as np
+import pandas as pd
+from dateutil import tz
 from .config import Config
-from .sewage import SewageSample
+from .constant import Columns
+from .utils import column_map
+
+LOCATION_ATTRIBUTE = 'NAME'
+# Mix aus Königsbrunn + 20% Stadtbergen und dient als Referenzsstandort (nicht mit aufnehmen)
+EXCLUDED_LOCATIONS = ["A-LK_02_STADTBERGEN"]
+# BGL only after March 2023
+LATE_START_LOCATIONS = ["BGL_01", "BGL_02", "BGL_03", "BGL_04", "BGL_05"]
+LATE_START_DATE = '2023-03-01'
+string_attributes = ['BEM_LAB', 'BEM_PN', 'TRO_TAG']
+date_attributes = ['ENDE', 'ANFANG']
+query_attributes = [LOCATION_ATTRIBUTE] + date_attributes + [a for a in column_map if a != 'ANFANG']
+
+
+def convert_epoch_to_dates(timestamps: np.ndarray) -> pd.Series:
+    """ Converts epoch milliseconds (NaN if missing) to 'YYYY-mm-dd' strings in the local time zone """
+    dates = pd.to_datetime(pd.Series(timestamps, dtype=float), unit='ms', utc=True).dt.tz_convert(tz.tzlocal())
+    return dates.dt.strftime('%Y-%m-%d')
+
+
+def convert_feature_attributes(attributes: List[dict]) -> pd.DataFrame:
+    """
+    Converts the attributes of a batch of features into a data frame with one typed column per attribute:
+    the sample location, the measured columns and the collection date (end of the sampling, otherwise the begin).
+    """
+    features = pd.DataFrame()
+    features[LOCATION_ATTRIBUTE] = np.array([a.get(LOCATION_ATTRIBUTE) for a in attributes], dtype=object)
+    end_dates = convert_epoch_to_dates(np.array([a.get('ENDE') for a in attributes], dtype=float))
+    begin_dates = convert_epoch_to_dates(np.array([a.get('ANFANG') for a in attributes], dtype=float))
+    for attribute, column in column_map.items():
+        if attribute == 'ANFANG':
+            features[column] = end_dates.where(end_dates.notna(), begin_dates).to_numpy(dtype=object)
+        elif attribute in string_attributes:
+            features[column] = np.array([a.get(attribute) for a in attributes], dtype=object)
+        else:
+            features[column] = np.array([a.get(attribute) for a in attributes], dtype=float)
+    return features
+
+
+def filter_features(features: pd.DataFrame) -> pd.DataFrame:
+    """ Removes the features without sample location or collection date, the excluded locations and the BGL samples before March 2023 """
+    location = features[LOCATION_ATTRIBUTE]
+    collection_date = features[Columns.DATE.value]
+    has_location = location.notna() & (location != "")
+    has_collection_date = collection_date.notna()
+    for sample_location in location[has_location & ~has_collection_date].unique():
+        logging.warning("no collection date:\t{}".format(sample_location))
+    is_late_start_location = location.str.contains("|".join(LATE_START_LOCATIONS), regex=True, na=False)
+    is_used = has_location & has_collection_date & ~location.isin(EXCLUDED_LOCATIONS) & \
+        ~(is_late_start_location & (collection_date < LATE_START_DATE))
+    return features[is_used.to_numpy()]
+
+
+def query_feature_attributes(feature_layer, page_size=2000):
+    """
+    Queries the features of the layer page by page. Only the attributes used by the quality control are requested.
+    Yields the attributes of each page.
+    """
+    offset = 0
+    while True:
+        feature_set = feature_layer.query(where="1=1", out_fields=",".join(query_attributes), return_geometry=False,
+                                          result_offset=offset, result_record_count=page_size)
+        attributes = [feature.attributes for feature in feature_set.features]
+        if attributes:
+            yield attributes
+        if len(attributes) < page_size:
+            return
+        offset += len(attributes)
+
+
+def group_features_by_location(feature_attribute_pages) -> dict:
+    """ Converts the pages of feature attributes and returns the measurements per sample location """
+    converted_pages = [convert_feature_attributes(attributes) for attributes in feature_attribute_pages]
+    if not converted_pages:
+        return dict()
+    features = filter_features(pd.concat(converted_pages, ignore_index=True))
+    return {sample_location: measurements[list(column_map.values())].reset_index(drop=True)
+            for sample_location, measurements in features.groupby(LOCATION_ATTRIBUTE, sort=False)}
 
 
 class Arcgis:
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, page_size=2000):
         self.sewage_plants = dict()
         self.regions2plants = dict()
         self.sewage_samples = dict()
         self.config = config
+        self.page_size = page_size
         self.__connnect_gis(config.gis_url, config.gis_user, config.gis_password)
 
-    def obtain_sewage_samples(self):
+    def obtain_sewage_samples(self) -> dict:
+        """ Returns the measurements of each sample location as data frame """
         self.__get_messwerte()
         return self.sewage_samples
 
 
     def __connnect_gis(self, gis_url, user, password):
+        # the arcgis package is only required for the import from ARCGIS
+        from arcgis.gis import GIS
         logging.info("Connect to ARCGIS server...")
         self.gis = GIS(gis_url, user, password)
-        groups = self.gis.groups.search('title: LB Bayern (LBBY)')  # obtain group
-        group_content = groups[0].content()
-        test = FeatureLayer(
-            'https://services-eu1.arcgis.com/e0dlK9aWS0lF3hlT/arcgis/rest/services/Messtellen_mit_Messwerten_LBBY/FeatureServer/0')  # get content of group, used to get Ids for the data below
-        self.sample_features = test.query().features
         # test = self.gis.content.get('04862861793548b2ad383d1d7b4800d9')
         self.monitoring_daten = self.gis.content.get('d3b1c622cceb40e48353da110fde73b8')
         self.messstellen_bayern = self.gis.content.get('04862861793548b2ad383d1d7b4800d9')
@@ -46,33 +124,9 @@ class Arcgis:
 
 
     def __get_messwerte(self):
+        from arcgis.features import FeatureLayer
         logging.info("Obtain measurements...")
         messstellen_url = self.messstellen_bayern.layers[0].url
         messtellen_feature = FeatureLayer(messstellen_url)
-        names = set()
-        sample_features = messtellen_feature.query().features
-        for feature in sample_features:
-            test = feature.as_dict
-            names.add(test['attributes']['NAME'])
-            sewage_sample = SewageSample(feature.as_dict)
-            #            self.__map_sewage_location(sewage_sample)
-            # replace short location name with long name from sewage plant
-            if sewage_sample.location_name and not sewage_sample.location_name == "A-LK_02_STADTBERGEN":  # Mix aus Königsbrunn + 20% Stadtbergen und dient als Referenzsstandort (nicht mit aufnehmen)
-                if sewage_sample.has_collection_date():
-                    if sewage_sample.location_name in self.sewage_samples:
-                        if any(loc in sewage_sample.location_name for loc in
-                               ("BGL_01", "BGL_02", "BGL_03", "BGL_04", "BGL_05")):  # BGL only after March 2023
-                            if sewage_sample.collectionDate >= '2023-03-01':
-                                self.sewage_samples[sewage_sample.location_name].append(sewage_sample)
-                        else:
-                            self.sewage_samples[sewage_sample.location_name].append(sewage_sample)
-                    else:
-                        if any(loc in sewage_sample.location_name for loc in
-                               ("BGL_01", "BGL_02", "BGL_04", "BGL_05")):  # BGL only after March 2023
-                            if sewage_sample.collectionDate >= '2023-03-01':
-                                self.sewage_samples[sewage_sample.location_name] = [sewage_sample]
-                        else:
-                            self.sewage_samples[sewage_sample.location_name] = [sewage_sample]
-                else:
-                    print("no collection date:\t{}".format(sewage_sample.location_name))
-        logging.info("\t\t{} measurements obtained".format(len(self.sewage_samples)))
+        self.sewage_samples = group_features_by_location(query_feature_attributes(messtellen_feature, self.page_size))
+        logging.info("\t\t{} measurements obtained".format(sum(m.shape[0] for m in self.sewage_samples.values())))
@@ -1,20 +1,52 @@
 # Created by alex at 06.10.23
 
-from datetime import datetime
+import asyncio
+import functools
+import concurrent.futures
+from datetime import datetime, timedelta
 from requests.auth import HTTPBasicAuth
+from requests.adapters import HTTPAdapter
 import requests
 import json
-from base64 import b64encode
-import jwt
+import numpy as np
+from base64 import b64encode, urlsafe_b64decode
 import pandas as pd
 from .config import *
+from .constant import Columns
+from .utils import is_sample_location_selected
+
+
+def get_token_expiration(token: str) -> datetime:
+    """ Returns the expiration time 'exp' of the JWT token. The signature is not verified. """
+    payload = token.split(".")[1]
+    payload += "=" * (-len(payload) % 4)
+    return datetime.fromtimestamp(json.loads(urlsafe_b64decode(payload))['exp'])
 
 
 class BayVOC:
+    """
+    Client of the Bay-VOC REST API. The sewage samples are requested page by page and the pages are fetched
+    concurrently with asyncio over a pooled HTTP session. The JWT token is renewed shortly before it expires,
+    at most 'token_renewal_margin' or half of its lifetime before. With 'since' only the samples collected after the
+    given date are requested. The current time is returned by 'clock'.
+    """
+    token_renewal_margin = timedelta(seconds=60)
 
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, max_connections=None, page_size=None, timeout=60, clock=datetime.now):
         self.config = config
-        self.__authenticate()
+        self.max_connections = max_connections or config.sewage_max_connections
+        self.page_size = page_size or config.sewage_page_size
+        self.timeout = timeout
+        self.clock = clock
+        self.token = None
+        # number of tokens fetched, thus requests know whether the token was renewed after they started
+        self.token_generation = 0
+        self.token_time = None
+        self.expiration_time = None
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
         self.column_map = {
     'collectionDate': 'collectionDate',
     'bem_lab': 'bem_lab',
@@ -33,55 +65,146 @@ class BayVOC:
     'trockentag': 'trockentag'
 }
 
+    async def __run_request(self, executor, method, url, **kwargs) -> requests.Response:
+        # the pooled session is used by the worker threads of the executor, thus requests run concurrently
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(self.session.request, method, url,
+                                                                      timeout=self.timeout, **kwargs))
 
-
-    def __authenticate(self):
+    async def __authenticate(self, executor):
         try:
-            response = requests.post(self.config.authentication_endpoint,
-                                     json={
-                                         "username": self.config.bay_voc_username,
-                                         "password": self.config.bay_voc_password
-                                     }, auth=HTTPBasicAuth(self.config.basic_auth_username,
-                                                           self.config.basic_auth_password))
-            if response.status_code == 200:
-                print("new token requested")
-                auth_data = json.loads(response.text)
-                self.token = auth_data['jwttoken']
-                decoded_token = jwt.decode(self.token, options={"verify_signature": False})
-                self.expiration_time = datetime.fromtimestamp(decoded_token['exp'])
-            else:
-                logging.error("Authentication error")
-                logging.error(response.text)
-                exit(1)
+            response = await self.__run_request(executor, "POST", self.config.authentication_endpoint,
+                                                json={
+                                                    "username": self.config.bay_voc_username,
+                                                    "password": self.config.bay_voc_password
+                                                }, auth=HTTPBasicAuth(self.config.basic_auth_username,
+                                                                      self.config.basic_auth_password))
         except requests.exceptions.ConnectionError as e:
-            print(e)
             logging.error("Can not authenticate to Bay-VOC Rest API - Is the service down?")
+            raise e
+        if response.status_code != 200:
+            logging.error("Authentication error")
+            logging.error(response.text)
+            response.raise_for_status()
+        self.token = response.json()['jwttoken']
+        self.token_generation += 1
+        self.token_time = self.clock()
+        self.expiration_time = get_token_expiration(self.token)
+        logging.info("New Bay-VOC token requested, valid until {}".format(self.expiration_time))
+
+    def __is_token_expiring(self) -> bool:
+        # tokens with a short lifetime are not renewed before each request
+        renewal_margin = min(self.token_renewal_margin, (self.expiration_time - self.token_time) / 2)
+        return self.clock() + renewal_margin >= self.expiration_time
+
+    async def __get_authentication_header(self, executor, token_lock: asyncio.Lock, rejected_token_generation=None):
+        async with token_lock:
+            # a token fetched after the rejected request started was renewed by a concurrent request already
+            if self.token is None or self.__is_token_expiring() or self.token_generation == rejected_token_generation:
+                await self.__authenticate(executor)
+        basic_auth = b64encode(
+            bytes(f"{self.config.basic_auth_username}:{self.config.basic_auth_password}", "utf-8")).decode(
+            "ascii")
+        return {'Authorization': "Basic {}".format(basic_auth),
+                'AuthorizationBearer': "Bearer {}".format(self.token)}
 
-    def __create_authentication_header(self):
-        if self.token:
-            basic_auth = b64encode(
-                bytes(f"{self.config.basic_auth_username}:{self.config.basic_auth_password}", "utf-8")).decode(
-                "ascii")
-            basic_auth_str = "Basic {}".format(basic_auth)
-            bearer_token_str = "Bearer {}".format(self.token)
-            return {'Authorization': basic_auth_str,
-                    'AuthorizationBearer': bearer_token_str
-                    }
-        else:
-            logging.error("No JWT token obtained from Bay-VOC hub")
-
-    def read_all_sewagesamples_from_db(self):
-        response = requests.get(self.config.sewage_get_all_samples_endpoint,
-                                headers=self.__create_authentication_header())
-        json_sewage_samples = response.json()
+    async def __get_page(self, executor, token_lock: asyncio.Lock, page: int, since=None):
+        params = {"page": page, "size": self.page_size}
+        if since is not None:
+            params[self.config.sewage_since_parameter] = pd.Timestamp(since).strftime("%Y-%m-%d")
+        headers = await self.__get_authentication_header(executor, token_lock)
+        token_generation = self.token_generation
+        response = await self.__run_request(executor, "GET", self.config.sewage_get_all_samples_endpoint,
+                                            headers=headers, params=params)
+        if response.status_code == 401:
+            # the token was revoked or expired on the server: renew the token once
+            headers = await self.__get_authentication_header(executor, token_lock, rejected_token_generation=token_generation)
+            response = await self.__run_request(executor, "GET", self.config.sewage_get_all_samples_endpoint,
+                                                headers=headers, params=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def fetch_sewage_samples(self, since=None) -> []:
+        """
+        Returns the sewage samples as list of json records. Paged responses ('content', 'totalPages') are fetched concurrently
+        after the first page. For plain json lists the pages are fetched in batches of 'max_connections' until a page is not full.
+        """
+        token_lock = asyncio.Lock()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_connections) as executor:
+            first_page = await self.__get_page(executor, token_lock, 0, since)
+            if isinstance(first_page, dict):
+                records = list(first_page.get('content', []))
+                pages = await asyncio.gather(*[self.__get_page(executor, token_lock, page, since)
+                                               for page in range(1, first_page.get('totalPages', 1))])
+                for page in pages:
+                    records.extend(page.get('content', []))
+                return records
+            records = list(first_page)
+            next_page = 1
+            is_last_page = len(first_page) < self.page_size
+            while not is_last_page:
+                pages = await asyncio.gather(*[self.__get_page(executor, token_lock, page, since)
+                                               for page in range(next_page, next_page + self.max_connections)])
+                for page in pages:
+                    records.extend(page)
+                    if len(page) < self.page_size:
+                        is_last_page = True
+                        break
+                next_page += self.max_connections
+            return records
+
+    def __convert_samples(self, json_sewage_samples: []) -> pd.DataFrame:
         df = pd.DataFrame(json_sewage_samples)
         df.rename(columns=self.column_map, inplace=True)
         df['bem_lab'] = ''
-        sample_locs = df.groupby('name')
-        sewage_samples_dict = dict()
-        for name, group_list in sample_locs:
-            group_list = group_list[list(self.column_map.values())]
-            if 'A-STADT' in name :
-                sewage_samples_dict[name] = group_list
-
-        return sewage_samples_dict
+        for column in self.column_map.values():
+            if column not in df:
+                df[column] = np.NAN
+        return df
+
+    def __read_samples(self, since=None) -> pd.DataFrame:
+        sewage_samples = self.__convert_samples(asyncio.run(self.fetch_sewage_samples(since)))
+        if sewage_samples.shape[0] > 0:
+            sewage_samples[Columns.DATE.value] = sewage_samples[Columns.DATE.value].astype(str).str.slice(0, 10)
+        return sewage_samples
+
+    def read_sewage_samples(self, locations=None, database=None):
+        """
+        Yields the sample location and its measurements.
+        If a database is given, only samples collected after the earliest of the last stored collection dates are requested.
+        The new samples of each stored sample location are appended to its stored measurements, thus the quality control
+        sees the complete time series. For sample locations without stored measurements all samples are requested, if they
+        have samples collected after that date.
+        """
+        last_collection_dates = dict()
+        if database is not None:
+            last_collection_dates = {sample_location: last_collection_date
+                                     for sample_location, last_collection_date in database.get_last_collection_dates().items()
+                                     if is_sample_location_selected(sample_location, locations)}
+        since = min(last_collection_dates.values()) if last_collection_dates else None
+        sewage_samples = self.__read_samples(since)
+        if sewage_samples.shape[0] == 0:
+            return
+        if since is not None:
+            new_locations = [sample_location for sample_location in sewage_samples['name'].unique()
+                             if sample_location not in last_collection_dates and is_sample_location_selected(sample_location, locations)]
+            if new_locations:
+                # samples of the new sample locations collected before 'since' are missing
+                all_sewage_samples = self.__read_samples()
+                sewage_samples = pd.concat([sewage_samples[~sewage_samples['name'].isin(new_locations)],
+                                            all_sewage_samples[all_sewage_samples['name'].isin(new_locations)]], ignore_index=True)
+        for sample_location, measurements in sewage_samples.groupby('name'):
+            if not is_sample_location_selected(sample_location, locations):
+                continue
+            measurements = measurements[list(self.column_map.values())]
+            if sample_location in last_collection_dates:
+                stored_measurements = database.load_measurements(sample_location)
+                if stored_measurements is not None:
+                    # only the samples after the last collection date of this sample location are new
+                    last_collection_date = stored_measurements[Columns.DATE.value].max()
+                    measurements = measurements[measurements[Columns.DATE.value] > last_collection_date]
+                    measurements = pd.concat([stored_measurements, measurements], ignore_index=True)
+            yield sample_location, measurements.reset_index(drop=True)
+
+    def read_all_sewagesamples_from_db(self, locations=None):
+        return dict(self.read_sewage_samples(locations))
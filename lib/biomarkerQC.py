@@ -1,10 +1,11 @@
 # Created by alex at 22.06.23
 import math
+import itertools
 import numpy as np
 import pandas as pd
 from .utils import *
 from .statistics import *
-from .plotting import *
+from .measurement_arrays import MeasurementArrays
 
 
 class BiomarkerQC:
@@ -186,6 +187,128 @@ class BiomarkerQC:
             SewageFlag.add_flag_to_index_column(measurements, index, CalculatedColumns.FLAG.value, SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
 
 
+    def process_location(self, sample_location, arrays: MeasurementArrays):
+        """
+        Vectorized biomarker quality control of all measurements of a sample location that need processing.
+        Runs the same steps as the row-wise methods above and sets identical flags.
+        """
+        rows_mask = arrays.needs_processing
+        self.__check_comments_and_mean_sewage_flow_for_location(arrays, rows_mask)
+        self.__biomarker_below_threshold_or_empty_for_location(arrays, rows_mask)
+        self.__calculate_biomarker_ratios_and_detect_outliers_for_location(sample_location, arrays)
+        self.__assign_biomarker_outliers_based_on_ratio_flags_for_location(arrays, rows_mask)
+        self.__analyze_usable_biomarkers_for_location(arrays, rows_mask)
+
+    def __check_comments_and_mean_sewage_flow_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray):
+        comments_not_empty = rows_mask & ((arrays.comment_analysis != '') | (arrays.comment_operation != ''))
+        mean_sewage_flow = arrays.get_value(Columns.MEAN_SEWAGE_FLOW.value)
+        mean_sewage_flow_empty = rows_mask & (np.isnan(mean_sewage_flow) | (mean_sewage_flow == 0))
+        arrays.add_flag(comments_not_empty, SewageFlag.COMMENT_NOT_EMPTY)
+        arrays.add_flag(mean_sewage_flow_empty, SewageFlag.MISSING_MEAN_SEWAGE_FLOW)
+        events = [(comments_not_empty, self.sewageStat.add_comment_not_empty),
+                  (mean_sewage_flow_empty, self.sewageStat.add_mean_sewage_flow_empty)]
+        for event_idx in order_by_first_occurrence([mask for mask, _ in events]):
+            mask, add_statistic = events[event_idx]
+            add_statistic(count=int(mask.sum()))
+
+    def __biomarker_below_threshold_or_empty_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray):
+        below_threshold_or_empty = rows_mask[:, np.newaxis] & (np.isnan(arrays.biomarker_values) |
+                                                               (arrays.biomarker_values < self.min_biomarker_threshold))
+        arrays.biomarker_flags[below_threshold_or_empty] |= SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY.value
+        for biomarker_idx in order_by_first_occurrence(list(below_threshold_or_empty.T)):
+            self.sewageStat.add_biomarker_below_threshold_or_empty(arrays.biomarkers[biomarker_idx],
+                                                                   count=int(below_threshold_or_empty[:, biomarker_idx].sum()))
+
+    def __get_previous_biomarker_ratios_mask(self, arrays: MeasurementArrays, start, index) -> np.ndarray:
+        """
+          Array version of '__get_previous_biomarkers_ratios' for all biomarker pairs: mask (measurements x pairs)
+          of the previous measurements [start, index) without previously detected outliers and empty ratios.
+        """
+        return ((arrays.biomarker_ratio_flags[start:index] & SewageFlag.BIOMARKER_RATIO_OUTLIER.value) == 0) & \
+            ~np.isnan(arrays.biomarker_ratio_values[start:index]) & \
+            ~np.isnan(arrays.biomarker_zscores[start:index, arrays.biomarker1_indices]) & \
+            ~np.isnan(arrays.biomarker_zscores[start:index, arrays.biomarker2_indices]) & \
+            ~np.isnat(arrays.dates[start:index])[:, np.newaxis]
+
+    def __calculate_biomarker_ratios_and_detect_outliers_for_location(self, sample_location, arrays: MeasurementArrays):
+        """
+        Biomarker ratios depend on the ratios and ratio outliers of the previous measurements,
+        thus the measurements are processed in order; all biomarker pairs of a measurement are calculated
+        and tested at once right after each other.
+        """
+        is_below_threshold_or_empty = (arrays.biomarker_flags & SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY.value) != 0
+        zscores = arrays.biomarker_zscores
+        num_pairs = len(arrays.biomarker_pairs)
+        for index in arrays.get_rows_to_process():
+            start = max(index - 1 - self.max_number_biomarkers_for_outlier_detection, 0)
+            biomarker1_values, biomarker2_values = zscores[index, arrays.biomarker1_indices], zscores[index, arrays.biomarker2_indices]
+            is_skipped = is_below_threshold_or_empty[index, arrays.biomarker1_indices] | is_below_threshold_or_empty[index, arrays.biomarker2_indices] | \
+                (biomarker1_values == 0) | (biomarker2_values == 0)
+            previous_mask = self.__get_previous_biomarker_ratios_mask(arrays, start, index)
+            num_previous_ratios = previous_mask.sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                previous_zscore_ratios = zscores[start:index, arrays.biomarker1_indices] / zscores[start:index, arrays.biomarker2_indices]
+                # same as np.median: an empty ratio (0/0) within the previous ratios results in an empty median
+                has_empty_zscore_ratio = (previous_mask & np.isnan(previous_zscore_ratios)).any(axis=0)
+                sorted_zscore_ratios = np.where(previous_mask, previous_zscore_ratios, np.NAN).T
+                sorted_zscore_ratios.sort(axis=1)
+                last_biomarker_ratio_medians = get_median_of_sorted_windows(sorted_zscore_ratios, num_previous_ratios)
+                last_biomarker_ratio_medians[has_empty_zscore_ratio | (num_previous_ratios == 0)] = np.NAN
+                biomarker_ratios = np.where(np.isnan(last_biomarker_ratio_medians), 1,
+                                            (biomarker1_values / biomarker2_values) / last_biomarker_ratio_medians)
+            biomarker_ratios[is_skipped] = np.NAN
+            arrays.biomarker_ratio_values[index] = biomarker_ratios
+            is_ratio_empty = is_skipped | np.isnan(biomarker_ratios) | (biomarker_ratios == 0)
+            not_enough_previous_ratios = ~is_ratio_empty & (num_previous_ratios < self.min_number_biomarkers_for_outlier_detection)
+            arrays.biomarker_ratio_flags[index, not_enough_previous_ratios] |= SewageFlag.NOT_ENOUGH_PREVIOUS_BIOMARKER_VALUES.value
+            to_detect = ~is_ratio_empty & ~not_enough_previous_ratios
+            is_outlier = np.zeros(num_pairs, dtype=bool)
+            if to_detect.any():
+                # previous ratios of all pairs as one value array, one window per pair
+                window_size = index - start
+                previous_ratios = np.where(previous_mask, arrays.biomarker_ratio_values[start:index], np.NAN).T.ravel()
+                window_starts = np.flatnonzero(to_detect) * window_size
+                is_outlier[to_detect] = detect_outliers_in_windows(self.biomarker_outlier_statistics, previous_ratios, window_starts,
+                                                                   window_starts + window_size, biomarker_ratios[to_detect], isFactor=True)
+            arrays.biomarker_ratio_flags[index, is_outlier] |= SewageFlag.BIOMARKER_RATIO_OUTLIER.value
+            for pair_idx, (biomarker1_idx, biomarker2_idx) in enumerate(arrays.biomarker_pairs):
+                biomarker1, biomarker2 = arrays.biomarkers[biomarker1_idx], arrays.biomarkers[biomarker2_idx]
+                if is_ratio_empty[pair_idx]:
+                    self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'skipped')
+                elif to_detect[pair_idx]:
+                    self.sewageStat.add_biomarker_ratio_outlier(biomarker1, biomarker2, 'outlier' if is_outlier[pair_idx] else 'passed')
+
+    def __assign_biomarker_outliers_based_on_ratio_flags_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray):
+        biomarker1_indices, biomarker2_indices = arrays.biomarker1_indices, arrays.biomarker2_indices
+        usable_biomarkers = (arrays.biomarker_flags & SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY.value) == 0
+        usable_ratios = usable_biomarkers[:, biomarker1_indices] & usable_biomarkers[:, biomarker2_indices]
+        ratio_outliers = (arrays.biomarker_ratio_flags & SewageFlag.BIOMARKER_RATIO_OUTLIER.value) != 0
+        # if all usable ratios of a biomarker are flagged as outliers then the biomarker is flagged as validated outlier
+        all_ratios_outlier = np.zeros(usable_biomarkers.shape, dtype=bool)
+        for biomarker_idx in range(len(arrays.biomarkers)):
+            biomarker_ratios = (biomarker1_indices == biomarker_idx) | (biomarker2_indices == biomarker_idx)
+            all_ratios_outlier[:, biomarker_idx] = usable_biomarkers[:, biomarker_idx] & \
+                np.all(ratio_outliers[:, biomarker_ratios] | ~usable_ratios[:, biomarker_ratios], axis=1)
+        all_ratios_outlier &= rows_mask[:, np.newaxis] & (usable_biomarkers.sum(axis=1) > 2)[:, np.newaxis]
+        arrays.biomarker_flags[all_ratios_outlier] |= SewageFlag.BIOMARKER_VALIDATED_OUTLIER.value
+        # ratio outliers of biomarkers which are not validated outliers mark both biomarkers as probable outliers
+        probable_ratio_outliers = rows_mask[:, np.newaxis] & usable_ratios & ratio_outliers & \
+            ~all_ratios_outlier[:, biomarker1_indices] & ~all_ratios_outlier[:, biomarker2_indices]
+        probable_outliers = np.zeros(usable_biomarkers.shape, dtype=bool)
+        for pair_idx in range(len(arrays.biomarker_pairs)):
+            probable_outliers[:, biomarker1_indices[pair_idx]] |= probable_ratio_outliers[:, pair_idx]
+            probable_outliers[:, biomarker2_indices[pair_idx]] |= probable_ratio_outliers[:, pair_idx]
+        arrays.biomarker_flags[probable_outliers] |= SewageFlag.BIOMARKER_PROBABLE_OUTLIER.value
+
+    def __analyze_usable_biomarkers_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray):
+        is_below_threshold_or_empty = (arrays.biomarker_flags & SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY.value) != 0
+        is_validated_outlier = (arrays.biomarker_flags & SewageFlag.BIOMARKER_VALIDATED_OUTLIER.value) != 0
+        is_probable_outlier = (arrays.biomarker_flags & SewageFlag.BIOMARKER_PROBABLE_OUTLIER.value) != 0
+        num_usable_biomarkers = (~is_below_threshold_or_empty & ~is_validated_outlier).sum(axis=1)
+        arrays.num_usable_biomarkers[rows_mask] = num_usable_biomarkers[rows_mask]
+        # in case any biomarker was marked as probable outlier set flag for normalization
+        arrays.add_flag(rows_mask & is_probable_outlier.any(axis=1), SewageFlag.BIOMARKER_PROBABLE_OUTLIER)
+
     def report_last_biomarkers_invalid(self, sample_location, measurements_df: pd.DataFrame):
         last_two_measurements = measurements_df.tail(self.report_number_of_biomarker_outlier)
         if last_two_measurements.shape[0] == self.report_number_of_biomarker_outlier:
@@ -0,0 +1,67 @@
+import sys
+import itertools
+import numpy as np
+import pandas as pd
+from .constant import *
+from .flag_store import FlagStore
+
+float_type = np.float32
+flag_type = FlagStore.dtype
+
+
+def get_float_columns() -> []:
+    """ Measured values, biomarker z-scores and biomarker ratios """
+    biomarkers = Columns.get_biomarker_columns()
+    return biomarkers + [biomarker + "_zscore" for biomarker in biomarkers] + \
+        [biomarker1 + "/" + biomarker2 for biomarker1, biomarker2 in itertools.combinations(biomarkers, 2)] + \
+        [Columns.MEAN_SEWAGE_FLOW.value, Columns.AMMONIUM.value, Columns.CONDUCTIVITY.value] + Columns.get_surrogatevirus_columns()
+
+
+def get_flag_columns() -> []:
+    biomarkers = Columns.get_biomarker_columns()
+    return [CalculatedColumns.FLAG.value] + CalculatedColumns.get_biomarker_flag_columns() + \
+        [CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)
+         for biomarker1, biomarker2 in itertools.combinations(biomarkers, 2)]
+
+
+def get_categorical_columns() -> []:
+    return [Columns.TROCKENTAG.value, Columns.COMMENT_ANALYSIS.value, Columns.COMMENT_OPERATION.value]
+
+
+def compact_measurements(measurements: pd.DataFrame) -> None:
+    """
+    Converts the measurements in place to the compact layout: float32 values, uint32 flags, categorical dry day and
+    comment columns and interned outlier reasons. The outlier reasons stay strings, since they are extended row by row.
+    """
+    for column in get_float_columns():
+        if column in measurements and measurements[column].dtype != float_type:
+            measurements[column] = measurements[column].astype(float_type)
+    for column in get_flag_columns():
+        if column in measurements and measurements[column].dtype != flag_type:
+            measurements[column] = measurements[column].astype(flag_type)
+    for column in get_categorical_columns():
+        if column in measurements and not isinstance(measurements[column].dtype, pd.CategoricalDtype):
+            measurements[column] = measurements[column].astype("category")
+    if CalculatedColumns.OUTLIER_REASON.value in measurements:
+        measurements[CalculatedColumns.OUTLIER_REASON.value] = \
+            [sys.intern(reason) if isinstance(reason, str) else reason for reason in measurements[CalculatedColumns.OUTLIER_REASON.value]]
+
+
+def get_memory_usage(measurements: pd.DataFrame) -> int:
+    """
+    Returns the memory of the data frame in bytes. Python objects referenced more than once, e.g. interned strings,
+    are counted once.
+    """
+    memory_usage = measurements.index.memory_usage(deep=True)
+    counted_objects = set()
+    for column in measurements.columns:
+        if measurements[column].dtype == object:
+            values = measurements[column].to_numpy()
+            memory_usage += values.nbytes
+            for value in values:
+                if id(value) not in counted_objects:
+                    counted_objects.add(id(value))
+                    memory_usage += sys.getsizeof(value)
+        else:
+            memory_usage += measurements[column].memory_usage(index=False, deep=True)
+    return int(memory_usage)
@@ -24,6 +24,9 @@ class Config:
         self.authentication_endpoint = self.server + config['General']['authentication_endpoint']
 
         self.sewage_get_all_samples_endpoint = self.server + config['General']['sewage_get_all_endpoint']
+        self.sewage_page_size = config['General'].getint('sewage_page_size', 1000)
+        self.sewage_max_connections = config['General'].getint('sewage_max_connections', 8)
+        self.sewage_since_parameter = config['General'].get('sewage_since_parameter', 'since')
 
         self.gis_url = config['ARCGIS']['gis_url']
         self.gis_user = config['ARCGIS']['gis_user']
@@ -52,20 +52,24 @@ class SewageFlag(Flag):
     @staticmethod
     def remove_flag_from_index_column(df, index, flag_column, sewage_flag) -> None:
         if isinstance(sewage_flag, SewageFlag):
-            current_flag = df.iloc[index][flag_column]
+            # read the single cell instead of materializing the whole row
+            column_idx = df.columns.get_loc(flag_column)
+            current_flag = df.iat[index, column_idx]
             has_flag = SewageFlag.is_flag(current_flag, sewage_flag)
             if has_flag:
-                df.at[index, flag_column] -= sewage_flag.value
+                df.iat[index, column_idx] = current_flag - sewage_flag.value
         else:
             raise ValueError("The given flag is not of type 'SewageFlag'")
 
     @staticmethod
     def add_flag_to_index_column(df, index, flag_column, sewage_flag) -> None:
         if isinstance(sewage_flag, SewageFlag):
-            current_flag = df.iloc[index][flag_column]
+            # read the single cell instead of materializing the whole row
+            column_idx = df.columns.get_loc(flag_column)
+            current_flag = df.iat[index, column_idx]
             has_flag = SewageFlag.is_flag(current_flag, sewage_flag)
             if not has_flag:
-                df.at[index, flag_column] += sewage_flag.value
+                df.iat[index, column_idx] = current_flag + sewage_flag.value
         else:
             raise ValueError("The given flag is not of type 'SewageFlag'")
 
@@ -77,13 +81,24 @@ class SewageFlag(Flag):
             if not SewageFlag.is_flag(current_flag, new_flag):
                 df.at[index, flag_column] += new_flag.value
 
+    @staticmethod
+    def __as_integer_flags(series):
+        """
+            flag columns and flag arrays of the flag store are used as they are, other types are converted
+        """
+        if isinstance(series, pd.DataFrame):
+            is_integer = all(pd.api.types.is_integer_dtype(dtype) for dtype in series.dtypes)
+        else:
+            is_integer = pd.api.types.is_integer_dtype(series.dtype)
+        return series if is_integer else series.astype(int)
+
     @staticmethod
     def is_not_flag_set_for_series(series: pd.Series, sewage_flag) -> pd.Series:
         """
-            checks if the given flag is NOT contained in a series/dataframe and returns a boolean series
+            checks if the given flag is NOT contained in a series/dataframe/array and returns a boolean series
         """
         if isinstance(sewage_flag, SewageFlag):
-            series = series.astype(int)
+            series = SewageFlag.__as_integer_flags(series)
             return (series & sewage_flag.value) == 0
         else:
             raise ValueError("The given flag is not of type 'SewageFlag'")
@@ -91,10 +106,10 @@ class SewageFlag(Flag):
     @staticmethod
     def is_flag_set_for_series(series: pd.Series, sewage_flag) -> pd.Series:
         """
-            checks if the given flag is contained in the series and returns a boolean series
+            checks if the given flag is contained in the series/dataframe/array and returns a boolean series
         """
         if isinstance(sewage_flag, SewageFlag):
-            series = series.astype(int)
+            series = SewageFlag.__as_integer_flags(series)
             return (series & sewage_flag.value) == sewage_flag.value
         else:
             raise ValueError("The given flag is not of type 'SewageFlag'")
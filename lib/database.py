@@ -1,15 +1,23 @@
 # Created by alex at 10.07.23
 import os
+import time
 from platform import system
 from subprocess import call
 from pathlib import Path
 import itertools
-import hashlib
 
 import pandas as pd
 import pyarrow as pa
 import pyarrow.parquet as pq
 from .utils import *
+from .compact_dtypes import compact_measurements
+
+ROW_HASH_COLUMN = "row_hash"
+PARTITION_PREFIX = "year="
+# added to the stored measurements when they are read: name of their partition file, the files sort in the order they were written
+WRITE_ID_COLUMN = "write_id"
+# row hash of the rows marking the dates removed from the input
+REMOVED_ROW_HASH = np.uint64(0)
 
 
 class SewageDatabase:
@@ -18,25 +26,143 @@ class SewageDatabase:
         home = str(Path.home())
         self.output_folder = os.path.join(home, ".sewage_qc_normalization")
         self.measurements_dict = dict()
+        # dates of each sample location which are stored but were removed from the input, see 'needs_recalcuation'
+        self.removed_dates = dict()
+        # keep the stored measurements of each sample location in 'measurements_dict' after they were read once (serve mode)
+        self.cache_measurements = False
+        # store and restore the measurements in the compact layout, see 'compact_dtypes'
+        self.compact_dtypes = False
         self.__create_folder()
 
     def __create_folder(self):
         operatingSystem = system()
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
+        os.makedirs(self.output_folder, exist_ok=True)
         if operatingSystem == "Windows":
             call(["attrib", "+H", self.output_folder])  # hide folder in windows
         elif operatingSystem == "Darwin":
             os.system(["chflags", "hidden", self.output_folder])  # hide folder in mac os
 
 
-    def __load_db_for_location(self, sample_location):
-        sample_location = self.__get_sample_location_escaped(sample_location)
-        database_file = os.path.join(self.output_folder, ".{}_sewage_db.parquet".format(sample_location))
-        if os.path.exists(database_file):
-            table2 = pq.read_table(database_file)
-            loaded_df = table2.to_pandas()
-            return loaded_df, True
+    def __get_location_folder(self, sample_location):
+        return os.path.join(self.output_folder, ".{}_sewage_db".format(self.__get_sample_location_escaped(sample_location)))
+
+    def __get_single_file_database(self, sample_location):
+        # database layout before the partitioned dataset: one parquet file per sample location
+        return os.path.join(self.output_folder, ".{}_sewage_db.parquet".format(self.__get_sample_location_escaped(sample_location)))
+
+    @staticmethod
+    def __get_years(measurements_df: pd.DataFrame) -> pd.Series:
+        return pd.to_datetime(measurements_df[Columns.DATE.value]).dt.year.fillna(0).astype(int)
+
+    @staticmethod
+    def __get_partition_years(location_folder):
+        years = []
+        if os.path.isdir(location_folder):
+            for partition in os.listdir(location_folder):
+                if partition.startswith(PARTITION_PREFIX):
+                    years.append(int(partition[len(PARTITION_PREFIX):]))
+        return sorted(years)
+
+    @staticmethod
+    def __get_partition_files(partition_folder):
+        """ Data files of a partition in the order they were written """
+        if not os.path.isdir(partition_folder):
+            return []
+        return [os.path.join(partition_folder, f) for f in sorted(os.listdir(partition_folder)) if f.endswith(".parquet")]
+
+    @staticmethod
+    def __read_partition_files(partition_files) -> pd.DataFrame:
+        return pd.concat([pq.read_table(f).to_pandas().assign(**{WRITE_ID_COLUMN: os.path.basename(f)}) for f in partition_files],
+                         ignore_index=True)
+
+    @staticmethod
+    def __get_latest_versions(db_measurements: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the measurements of the last write of each date. Earlier versions of a date, e.g. before a correction,
+        are outdated. Measurements stored more than once within a write are contained once. Dates whose last write
+        marks them as removed are not contained.
+        """
+        latest_write_ids = db_measurements.groupby(Columns.DATE.value, dropna=False)[WRITE_ID_COLUMN].transform('max')
+        db_measurements = db_measurements[(db_measurements[WRITE_ID_COLUMN] == latest_write_ids).to_numpy() &
+                                          (db_measurements[ROW_HASH_COLUMN] != REMOVED_ROW_HASH).to_numpy()]
+        return db_measurements.drop_duplicates(subset=[Columns.DATE.value, ROW_HASH_COLUMN], keep='last')
+
+    def __write_partition_file(self, partition_folder, measurements_df: pd.DataFrame) -> str:
+        """ Writes the measurements to a new file of the partition and returns its write id """
+        os.makedirs(partition_folder, exist_ok=True)
+        if self.compact_dtypes:
+            measurements_df = measurements_df.copy()
+            compact_measurements(measurements_df)
+        partition_file = os.path.join(partition_folder, "part-{:020d}-{}.parquet".format(time.time_ns(), os.getpid()))
+        # write to a temporary file first and rename it, thus concurrent readers never see a partially written file
+        tmp_partition_file = "{}.tmp".format(partition_file)
+        try:
+            pq.write_table(pa.Table.from_pandas(measurements_df, preserve_index=False), tmp_partition_file)
+            os.replace(tmp_partition_file, partition_file)
+        finally:
+            if os.path.exists(tmp_partition_file):
+                os.remove(tmp_partition_file)
+        return os.path.basename(partition_file)
+
+    def __append_to_partitions(self, sample_location, measurements_df: pd.DataFrame) -> pd.DataFrame:
+        """ Appends the measurements to the partitions of their year and returns them with their write ids """
+        location_folder = self.__get_location_folder(sample_location)
+        years = self.__get_years(measurements_df)
+        write_ids = pd.Series("", index=measurements_df.index)
+        for year in years.unique():
+            partition_folder = os.path.join(location_folder, "{}{}".format(PARTITION_PREFIX, year))
+            is_year = (years == year).to_numpy()
+            write_ids[is_year] = self.__write_partition_file(partition_folder, measurements_df[is_year])
+        return measurements_df.assign(**{WRITE_ID_COLUMN: write_ids})
+
+    def __migrate_single_file_database(self, sample_location):
+        single_file_database = self.__get_single_file_database(sample_location)
+        if os.path.exists(single_file_database):
+            db_measurements = pq.read_table(single_file_database).to_pandas()
+            if ROW_HASH_COLUMN not in db_measurements:  # database created before row hashes were stored
+                db_measurements[ROW_HASH_COLUMN] = self.get_row_hashes(db_measurements)
+            self.__append_to_partitions(sample_location, db_measurements)
+            os.remove(single_file_database)
+
+    def __load_db_for_location(self, sample_location, years=None):
+        """
+        Loads the stored measurements of a sample location, see '__read_db_for_location'. If the measurements are cached,
+        all stored measurements of the sample location are read once and kept in memory.
+        """
+        if not self.cache_measurements:
+            return self.__read_db_for_location(sample_location, years)
+        if sample_location not in self.measurements_dict:
+            self.measurements_dict[sample_location] = self.__read_db_for_location(sample_location)[0]
+        db_measurements = self.measurements_dict[sample_location]
+        if db_measurements is not None and years is not None:
+            db_measurements = db_measurements[self.__get_years(db_measurements).isin(years).to_numpy()]
+        if db_measurements is None or db_measurements.shape[0] == 0:
+            return None, False
+        return db_measurements, True
+
+    def __read_db_for_location(self, sample_location, years=None):
+        """
+        Reads the stored measurements of a sample location. Only the partitions of the given years are read.
+        Measurements stored more than once are contained in the order they were written, see '__get_latest_versions'.
+        """
+        location_folder = self.__get_location_folder(sample_location)
+        if years is None:
+            years = self.__get_partition_years(location_folder)
+        loaded_dfs = []
+        single_file_database = self.__get_single_file_database(sample_location)
+        if os.path.exists(single_file_database):
+            loaded_df = pq.read_table(single_file_database).to_pandas()
+            if ROW_HASH_COLUMN not in loaded_df:  # database created before row hashes were stored
+                loaded_df[ROW_HASH_COLUMN] = self.get_row_hashes(loaded_df)
+            # written before all partition files
+            loaded_df[WRITE_ID_COLUMN] = ""
+            loaded_dfs.append(loaded_df[self.__get_years(loaded_df).isin(years).to_numpy()])
+        for year in years:
+            partition_files = self.__get_partition_files(os.path.join(location_folder, "{}{}".format(PARTITION_PREFIX, year)))
+            if partition_files:
+                loaded_dfs.append(self.__read_partition_files(partition_files))
+        if loaded_dfs:
+            return pd.concat(loaded_dfs, ignore_index=True), True
         return None, False
 
     def __get_sample_location_escaped(self, sample_location: str):
@@ -44,27 +170,123 @@ class SewageDatabase:
         return sample_location_escaped
 
     def add_sewage_location2db(self, sample_location, measurements_df: pd.DataFrame):
-        sample_location = self.__get_sample_location_escaped(sample_location)
+        """
+        Appends the processed measurements ('needs_processing') of a sample location to the partitions of their year.
+        Measurements which were restored from the database are already stored and not written again.
+        The dates removed from the input are marked as removed, thus they are not compared again.
+        """
+        self.__migrate_single_file_database(sample_location)
         if CalculatedColumns.NEEDS_PROCESSING.value in measurements_df:
+            measurements_df = measurements_df[measurements_df[CalculatedColumns.NEEDS_PROCESSING.value].to_numpy(dtype=bool)]
             measurements_df = measurements_df.drop(columns=[CalculatedColumns.NEEDS_PROCESSING.value])
-        table = pa.Table.from_pandas(measurements_df)
-        pq.write_table(table, os.path.join(self.output_folder, ".{}_sewage_db.parquet".format(sample_location)))
-
-    def __get_checksum_for_row(self, row) -> []:
-        used_columns = [c.value for c in Columns]
-        used_row = row[used_columns]
-        series = []
-        if isinstance(used_row, pd.DataFrame):  # multiple entries with same date
-            for index, duplicate in used_row.iterrows():
-                series.append(duplicate)
-        else:
-            series.append(used_row)
-        checksums = []
-        for serie in series:
-            merged = ','.join([str(i) for i in serie.to_list()])
-            md5hash = hashlib.md5(merged.encode('utf-8')).hexdigest()
-            checksums.append(md5hash)
-        return checksums
+        written_dfs = []
+        if measurements_df.shape[0] > 0:
+            measurements_df = measurements_df.assign(**{ROW_HASH_COLUMN: self.get_row_hashes(measurements_df)})
+            written_dfs.append(self.__append_to_partitions(sample_location, measurements_df))
+        removed_dates = self.removed_dates.pop(sample_location, [])
+        if len(removed_dates) > 0:
+            # written to files of their own, as the other columns are empty
+            removed_rows = pd.DataFrame({Columns.DATE.value: removed_dates, ROW_HASH_COLUMN: REMOVED_ROW_HASH})
+            written_dfs.append(self.__append_to_partitions(sample_location, removed_rows))
+        if written_dfs and sample_location in self.measurements_dict:
+            cached_measurements = self.measurements_dict[sample_location]
+            self.measurements_dict[sample_location] = pd.concat(([] if cached_measurements is None else [cached_measurements]) + written_dfs,
+                                                                ignore_index=True)
+
+    def compact_location(self, sample_location):
+        """
+        Rewrites each partition of a sample location into a single file.
+        Only the last written version of each date is kept, see '__get_latest_versions'.
+        """
+        self.__migrate_single_file_database(sample_location)
+        location_folder = self.__get_location_folder(sample_location)
+        for year in self.__get_partition_years(location_folder):
+            partition_folder = os.path.join(location_folder, "{}{}".format(PARTITION_PREFIX, year))
+            partition_files = self.__get_partition_files(partition_folder)
+            if len(partition_files) > 1:
+                db_measurements = self.__get_latest_versions(self.__read_partition_files(partition_files))
+                self.__write_partition_file(partition_folder, db_measurements.drop(columns=[WRITE_ID_COLUMN]))
+                for partition_file in partition_files:
+                    os.remove(partition_file)
+        # the cached measurements refer to the removed partition files
+        self.measurements_dict.pop(sample_location, None)
+
+    def __get_stored_locations(self) -> []:
+        """ Returns the escaped names of all sample locations in the database """
+        stored_locations = set()
+        for file_name in os.listdir(self.output_folder):
+            if file_name.startswith(".") and file_name.endswith("_sewage_db.parquet"):
+                stored_locations.add(file_name[1:-len("_sewage_db.parquet")])
+            elif file_name.startswith(".") and file_name.endswith("_sewage_db"):
+                stored_locations.add(file_name[1:-len("_sewage_db")])
+        return sorted(stored_locations)
+
+    def get_last_collection_date(self, sample_location):
+        """
+        Returns the last stored collection date of a sample location or None. Only the partitions of the last years
+        are read, until a year with stored measurements is found.
+        """
+        location_folder = self.__get_location_folder(sample_location)
+        last_collection_date = None
+        for year in reversed(self.__get_partition_years(location_folder)):
+            partition_files = self.__get_partition_files(os.path.join(location_folder, "{}{}".format(PARTITION_PREFIX, year)))
+            if partition_files:
+                db_measurements = self.__get_latest_versions(self.__read_partition_files(partition_files))
+                if db_measurements.shape[0] > 0:
+                    last_collection_date = db_measurements[Columns.DATE.value].max()
+                    break
+        single_file_database = self.__get_single_file_database(sample_location)
+        if os.path.exists(single_file_database):
+            single_file_date = pq.read_table(single_file_database, columns=[Columns.DATE.value]).column(0).to_pandas().max()
+            last_collection_date = single_file_date if last_collection_date is None else max(last_collection_date, single_file_date)
+        return None if last_collection_date is None else pd.Timestamp(last_collection_date)
+
+    def has_removed_measurements(self, sample_location) -> bool:
+        """ Returns whether stored measurements of a sample location were removed from the input, see 'needs_recalcuation' """
+        return len(self.removed_dates.get(sample_location, [])) > 0
+
+    def get_last_collection_dates(self) -> dict:
+        """ Returns the last stored collection date of all sample locations in the database """
+        last_collection_dates = dict()
+        for sample_location in self.__get_stored_locations():
+            last_collection_date = self.get_last_collection_date(sample_location)
+            if last_collection_date is not None:
+                last_collection_dates[sample_location] = last_collection_date
+        return last_collection_dates
+
+    def load_measurements(self, sample_location):
+        """
+        Returns the measured columns of the stored measurements of a sample location sorted by date, as read from the input
+        files, or None. Of measurements stored more than once for a date only the last written one is returned.
+        """
+        db_measurements, is_loaded = self.__load_db_for_location(sample_location)
+        if not is_loaded:
+            return None
+        db_measurements = self.__get_latest_versions(db_measurements).drop_duplicates(subset=[Columns.DATE.value], keep='last')
+        db_measurements = db_measurements[[c.value for c in Columns]].sort_values(by=Columns.DATE.value, ignore_index=True)
+        db_measurements[Columns.DATE.value] = pd.to_datetime(db_measurements[Columns.DATE.value]).dt.strftime("%Y-%m-%d")
+        return db_measurements
+
+    def compact(self):
+        """ Compacts the database of all sample locations """
+        for sample_location in self.__get_stored_locations():
+            self.compact_location(sample_location)
+
+    @staticmethod
+    def get_row_hashes(measurements_df: pd.DataFrame) -> pd.Series:
+        """
+        Hash per row over all measured columns. Numeric columns are hashed as float, all other columns as string,
+        thus the hashes of the input data and the stored data are comparable.
+        """
+        used_columns = pd.DataFrame(index=measurements_df.index)
+        for column in [c.value for c in Columns]:
+            if column == Columns.DATE.value:
+                used_columns[column] = pd.to_datetime(measurements_df[column])
+            elif pd.api.types.is_numeric_dtype(measurements_df[column]) and not pd.api.types.is_bool_dtype(measurements_df[column]):
+                used_columns[column] = measurements_df[column].astype(float)
+            else:
+                used_columns[column] = measurements_df[column].astype(str)
+        return pd.util.hash_pandas_object(used_columns, index=False)
 
     def __set_dtypes(self, new_measurements):
         for c in CalculatedColumns:
@@ -77,34 +299,64 @@ class SewageDatabase:
             column = CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)
             if column in new_measurements:
                 new_measurements[column] = new_measurements[column].astype(np.int)
+        if self.compact_dtypes:
+            compact_measurements(new_measurements)
+
+    @staticmethod
+    def __get_dependent_measurements(dates: np.ndarray, is_unchanged: np.ndarray, removed_dates: np.ndarray) -> np.ndarray:
+        """
+        Returns the unchanged measurements collected on or after the earliest changed, new or removed measurement.
+        The flags of a measurement depend on the values and flags of the previous measurements within its windows
+        (the last biomarker ratios, the last months and the dry weather flow of all previous mean sewage flows) and
+        flagged measurements are excluded from the windows of the later ones. The windows of consecutive measurements
+        overlap, thus a change is propagated to all later measurements.
+        """
+        change_dates = np.concatenate([dates[~is_unchanged], removed_dates])
+        if len(change_dates) == 0:
+            return np.zeros(len(dates), dtype=bool)
+        return is_unchanged & (dates >= change_dates.min())
 
-    def needs_recalcuation(self, sample_location, new_measurements: pd.DataFrame, rerun_all: bool):
+    def needs_recalcuation(self, sample_location, new_measurements: pd.DataFrame, rerun_all: bool,
+                           recalculate_dependent_measurements=False) -> int:
+        """
+        Marks all measurements whose date and measured values are not stored in the database as 'needs_processing'.
+        For the unchanged measurements the calculated columns are restored from the database.
+        With 'recalculate_dependent_measurements' the unchanged measurements after the earliest changed, new or removed
+        measurement are marked as well, as their flags depend on it. Returns the number of these dependent measurements.
+        """
+        num_dependent_measurements = 0
+        self.removed_dates.pop(sample_location, None)
         if rerun_all:
             new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = True
         else:
-            db_measurements, is_loaded = self.__load_db_for_location(sample_location)
+            years = self.__get_years(new_measurements).unique().tolist()
+            db_measurements, is_loaded = self.__load_db_for_location(sample_location, years)
             if is_loaded:
-                indices = []
-                for index, row in new_measurements.iterrows():
-                    needs_recalculation = True
-                    db_row = db_measurements[db_measurements[Columns.DATE.value] == row[Columns.DATE.value]]
-                    if db_row.shape[0] > 0:
-                        stored_checksums_list = self.__get_checksum_for_row(db_row.squeeze())
-                        new_checksum = self.__get_checksum_for_row(row)[0]
-                        found = False
-                        for stored_checksum in stored_checksums_list:
-                            if stored_checksum == new_checksum and not found:
-                                found = True
-                                needs_recalculation = False
-                                indices.append(db_row.index.tolist()[0])
-                    new_measurements.at[index, CalculatedColumns.NEEDS_PROCESSING.value] = needs_recalculation
-                update_df = db_measurements.iloc[indices]
-                new_measurements.set_index(Columns.DATE.value, inplace=True)
-                new_measurements.update(update_df.set_index(Columns.DATE.value))
-                new_measurements.reset_index(inplace=True)
+                measured_columns = [c.value for c in Columns]
+                cached_columns = [c for c in db_measurements.columns if c in new_measurements and c not in measured_columns]
+                # only the last written version of a date is unchanged, thus a reverted correction is processed again
+                db_measurements = self.__get_latest_versions(db_measurements)
+                stored_dates = pd.to_datetime(db_measurements[Columns.DATE.value]).to_numpy()
+                is_removed = ~np.isin(stored_dates, pd.to_datetime(new_measurements[Columns.DATE.value]).to_numpy())
+                # kept as stored, thus the rows marking them as removed are written with the same type
+                self.removed_dates[sample_location] = db_measurements[Columns.DATE.value].to_numpy()[is_removed]
+                db_measurements = db_measurements[[Columns.DATE.value, ROW_HASH_COLUMN] + cached_columns]
+                new_keys = pd.DataFrame({Columns.DATE.value: pd.to_datetime(new_measurements[Columns.DATE.value]).to_numpy(),
+                                         ROW_HASH_COLUMN: self.get_row_hashes(new_measurements).to_numpy()})
+                merged = new_keys.merge(db_measurements, on=[Columns.DATE.value, ROW_HASH_COLUMN], how='left', indicator=True)
+                is_unchanged = (merged['_merge'] == 'both').to_numpy()
+                if recalculate_dependent_measurements:
+                    is_dependent = self.__get_dependent_measurements(new_keys[Columns.DATE.value].to_numpy(), is_unchanged,
+                                                                     stored_dates[is_removed])
+                    num_dependent_measurements = int(is_dependent.sum())
+                    is_unchanged = is_unchanged & ~is_dependent
+                new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = ~is_unchanged
+                for column in cached_columns:
+                    cached_values = merged[column].to_numpy()
+                    restore = is_unchanged & pd.notna(cached_values)
+                    if restore.any():
+                        new_measurements.loc[restore, column] = cached_values[restore]
                 self.__set_dtypes(new_measurements)
             else:
                 new_measurements[CalculatedColumns.NEEDS_PROCESSING.value] = True
-
-
-
+        return num_dependent_measurements
@@ -0,0 +1,56 @@
+import dateutil.relativedelta
+import numpy as np
+import pandas as pd
+
+
+class DateWindowIndex:
+    """
+    Binary search index over the sorted collection dates of one sample location.
+    Returns the positions [start, end) of all measurements within the last N month and days before a measurement.
+    The start dates are computed once per unique date and time frame and shared by all quality control steps.
+    """
+
+    def __init__(self, dates: np.ndarray):
+        self.dates = np.asarray(dates, dtype='datetime64[ns]')
+        if np.any(self.dates[1:] < self.dates[:-1]):
+            raise ValueError("Dates of the date window index must be sorted in ascending order")
+        self.unique_dates, self.unique_date_positions = np.unique(self.dates, return_inverse=True)
+        # end positions are the same for all time frames: all measurements before the current date
+        self.end_positions = np.searchsorted(self.dates, self.unique_dates, side='left')[self.unique_date_positions]
+        self.start_positions = dict()
+
+    def __get_start_positions(self, num_month, num_days, include_start_date) -> np.ndarray:
+        time_frame = (num_month, num_days, include_start_date)
+        if time_frame not in self.start_positions:
+            start_dates = []
+            for unique_date in pd.to_datetime(self.unique_dates):
+                start_date = unique_date
+                if num_month > 0:
+                    start_date = start_date + dateutil.relativedelta.relativedelta(months=-num_month)
+                if num_days > 0:
+                    start_date = start_date + dateutil.relativedelta.relativedelta(days=-num_days)
+                start_dates.append(start_date.to_datetime64())
+            start_dates = np.array(start_dates, dtype='datetime64[ns]')
+            start_positions = np.searchsorted(self.dates, start_dates, side='left' if include_start_date else 'right')
+            self.start_positions[time_frame] = start_positions[self.unique_date_positions]
+        return self.start_positions[time_frame]
+
+    def get_window(self, index, num_month, num_days, include_start_date=True) -> (int, int):
+        """
+        :param index: position of the current measurement
+        :param num_month: number of last month
+        :param num_days: number of last days
+        :param include_start_date: measurements at the start date of the time frame are part of the window
+        :return: start and end position of the previous measurements within the time frame
+        """
+        start_positions = self.__get_start_positions(num_month, num_days, include_start_date)
+        end = int(self.end_positions[index])
+        return min(int(start_positions[index]), end), end
+
+    def get_windows(self, positions: np.ndarray, num_month, num_days, include_start_date=True) -> (np.ndarray, np.ndarray):
+        """
+        Array version of 'get_window' for the measurements at the given positions.
+        """
+        start_positions = self.__get_start_positions(num_month, num_days, include_start_date)[positions]
+        end_positions = self.end_positions[positions]
+        return np.minimum(start_positions, end_positions), end_positions
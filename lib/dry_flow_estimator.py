@@ -0,0 +1,60 @@
+import math
+import numpy as np
+
+
+class DryWeatherFlowEstimator:
+    """
+    Incremental estimation of the mean dry weather flow of a sample location.
+    The mean sewage flows of the previous measurements are added one after another and are kept in two Fenwick trees
+    (count and sum) over the ranks of all mean sewage flows of the location. Thus, adding a flow and obtaining
+    the mean of the N smallest flows takes logarithmic time.
+    """
+
+    def __init__(self, mean_sewage_flows: np.ndarray):
+        self.sorted_sewage_flows = np.unique(mean_sewage_flows[~np.isnan(mean_sewage_flows)])
+        self.size = self.sorted_sewage_flows.shape[0]
+        self.counts = [0] * (self.size + 1)
+        self.sums = [0.0] * (self.size + 1)
+        self.num_sewage_flows = 0  # including empty values
+        self.num_non_empty_sewage_flows = 0
+        self.highest_step = 1 << (self.size.bit_length() - 1) if self.size > 0 else 0
+
+    def add(self, mean_sewage_flow) -> None:
+        self.num_sewage_flows += 1
+        if math.isnan(mean_sewage_flow):
+            return
+        self.num_non_empty_sewage_flows += 1
+        rank = int(np.searchsorted(self.sorted_sewage_flows, mean_sewage_flow)) + 1
+        while rank <= self.size:
+            self.counts[rank] += 1
+            self.sums[rank] += mean_sewage_flow
+            rank += rank & -rank
+
+    def __get_rank_of_nth_smallest(self, num_smallest) -> int:
+        position, remaining = 0, num_smallest
+        step = self.highest_step
+        while step > 0:
+            if position + step <= self.size and self.counts[position + step] < remaining:
+                position += step
+                remaining -= self.counts[position]
+            step >>= 1
+        return position + 1
+
+    def __get_count_and_sum(self, rank) -> (int, float):
+        count, total = 0, 0.0
+        while rank > 0:
+            count += self.counts[rank]
+            total += self.sums[rank]
+            rank -= rank & -rank
+        return count, total
+
+    def get_mean_of_smallest(self, num_smallest) -> float:
+        """
+        Mean of the N smallest non-empty sewage flows. Like 'nsmallest' with keep='all', all flows equal to the
+        largest selected flow are included.
+        """
+        num_smallest = min(num_smallest, self.num_non_empty_sewage_flows)
+        if num_smallest <= 0:
+            return np.NAN
+        count, total = self.__get_count_and_sum(self.__get_rank_of_nth_smallest(num_smallest))
+        return total / count
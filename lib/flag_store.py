@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+from .constant import *
+
+
+class FlagStore:
+    """
+    Bitmask flags of all measurements of a sample location held in contiguous uint32 arrays:
+    'flag' (measurements), 'biomarker_flags' (measurements x biomarkers) and 'biomarker_ratio_flags' (measurements x pairs).
+    The two-dimensional arrays are stored column-major, thus the flags of each biomarker and biomarker ratio are contiguous.
+    The flags are written to the data frame columns only with 'write_back'.
+    """
+    dtype = np.uint32
+
+    def __init__(self, measurements: pd.DataFrame, biomarker_flag_columns: [], biomarker_ratio_flag_columns: []):
+        self.biomarker_flag_columns = biomarker_flag_columns
+        self.biomarker_ratio_flag_columns = biomarker_ratio_flag_columns
+        self.flag = measurements[CalculatedColumns.FLAG.value].to_numpy(dtype=self.dtype)
+        self.biomarker_flags = np.asfortranarray(measurements[biomarker_flag_columns].to_numpy(dtype=self.dtype))
+        self.biomarker_ratio_flags = np.asfortranarray(measurements[biomarker_ratio_flag_columns].to_numpy(dtype=self.dtype))
+
+    @staticmethod
+    def set_flag(flags: np.ndarray, rows_mask, sewage_flag: SewageFlag) -> None:
+        flags[rows_mask] |= FlagStore.dtype(sewage_flag.value)
+
+    @staticmethod
+    def clear_flag(flags: np.ndarray, rows_mask, sewage_flag: SewageFlag) -> None:
+        flags[rows_mask] &= ~FlagStore.dtype(sewage_flag.value)
+
+    @staticmethod
+    def is_flag_set(flags: np.ndarray, sewage_flag: SewageFlag) -> np.ndarray:
+        return (flags & FlagStore.dtype(sewage_flag.value)) != 0
+
+    @staticmethod
+    def is_not_flag_set(flags: np.ndarray, sewage_flag: SewageFlag) -> np.ndarray:
+        return (flags & FlagStore.dtype(sewage_flag.value)) == 0
+
+    @staticmethod
+    def __write_column(measurements: pd.DataFrame, column, flags: np.ndarray, default_type) -> None:
+        # the flag columns keep their type, thus the compact layout keeps the uint32 flags
+        flag_type = measurements[column].dtype if column in measurements else default_type
+        measurements[column] = flags.astype(flag_type)
+
+    def write_back(self, measurements: pd.DataFrame) -> None:
+        """ Materializes the flag arrays into the flag columns of the data frame, keeping the type of existing columns """
+        self.__write_column(measurements, CalculatedColumns.FLAG.value, self.flag, CalculatedColumns.FLAG.type)
+        for column_idx, column in enumerate(self.biomarker_flag_columns):
+            self.__write_column(measurements, column, self.biomarker_flags[:, column_idx], CalculatedColumns.BIOMARKER_FLAG.type)
+        for column_idx, column in enumerate(self.biomarker_ratio_flag_columns):
+            self.__write_column(measurements, column, self.biomarker_ratio_flags[:, column_idx],
+                                CalculatedColumns.BIOMARKER_RATIO_FLAG.type)
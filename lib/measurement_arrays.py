@@ -0,0 +1,92 @@
+import itertools
+import numpy as np
+import pandas as pd
+from .constant import *
+from .date_window_index import DateWindowIndex
+from .flag_store import FlagStore
+
+
+class MeasurementArrays:
+    """
+    Column-wise NumPy representation of all measurements of one sample location.
+    Used by the vectorized engine: every quality control step reads and writes these arrays
+    and the results are written back to the data frame once with 'write_back'.
+    The measurements must be sorted by date.
+    """
+
+    def __init__(self, measurements: pd.DataFrame):
+        self.biomarkers = Columns.get_biomarker_columns()
+        self.biomarker_pairs = list(itertools.combinations(range(len(self.biomarkers)), 2))
+        self.biomarker1_indices = np.array([b1 for b1, _ in self.biomarker_pairs])
+        self.biomarker2_indices = np.array([b2 for _, b2 in self.biomarker_pairs])
+        self.biomarker_ratios = [self.biomarkers[b1] + "/" + self.biomarkers[b2] for b1, b2 in self.biomarker_pairs]
+        self.size = measurements.shape[0]
+        self.dates = measurements[Columns.DATE.value].to_numpy(dtype='datetime64[ns]')
+        self.date_window_index = DateWindowIndex(self.dates)
+        self.needs_processing = measurements[CalculatedColumns.NEEDS_PROCESSING.value].to_numpy(dtype=bool) \
+            if CalculatedColumns.NEEDS_PROCESSING.value in measurements else np.ones(self.size, dtype=bool)
+        # measured values
+        self.biomarker_values = self.__get_float_array(measurements[self.biomarkers])
+        self.biomarker_zscores = self.__get_float_array(measurements[[b + "_zscore" for b in self.biomarkers]])
+        self.comment_analysis = measurements[Columns.COMMENT_ANALYSIS.value].to_numpy(dtype=object)
+        self.comment_operation = measurements[Columns.COMMENT_OPERATION.value].to_numpy(dtype=object)
+        self.trockentag = measurements[Columns.TROCKENTAG.value].to_numpy(dtype=object)
+        self.values = dict()
+        for column in [Columns.MEAN_SEWAGE_FLOW.value, Columns.AMMONIUM.value, Columns.CONDUCTIVITY.value] + \
+                      Columns.get_surrogatevirus_columns():
+            self.values[column] = self.__get_float_array(measurements[column])
+        # calculated values
+        self.biomarker_ratio_values = self.__get_float_array(measurements[self.biomarker_ratios])
+        self.flag_store = FlagStore(measurements, CalculatedColumns.get_biomarker_flag_columns(),
+                                    [CalculatedColumns.get_biomaker_ratio_flag(self.biomarkers[b1], self.biomarkers[b2])
+                                     for b1, b2 in self.biomarker_pairs])
+        self.flag = self.flag_store.flag
+        self.biomarker_flags = self.flag_store.biomarker_flags
+        self.biomarker_ratio_flags = self.flag_store.biomarker_ratio_flags
+        self.num_usable_biomarkers = measurements[CalculatedColumns.NUMBER_OF_USABLE_BIOMARKERS.value].to_numpy(dtype=np.int64)
+        self.normalized_mean_biomarkers = self.__get_float_array(measurements[CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value])
+        self.base_reproduction_factor = self.__get_float_array(measurements[CalculatedColumns.BASE_REPRODUCTION_FACTOR.value])
+        self.usable = measurements[CalculatedColumns.USABLE.value].to_numpy(dtype=bool)
+        self.outlier_reason = measurements[CalculatedColumns.OUTLIER_REASON.value].to_numpy(dtype=object)
+
+    @staticmethod
+    def __get_float_array(values) -> np.ndarray:
+        # float32 columns of the compact layout are calculated in float32, as the row-wise engine does
+        values = values.to_numpy()
+        return values if values.dtype == np.float32 else values.astype(float)
+
+    def get_rows_to_process(self) -> np.ndarray:
+        """ Returns the positions of all rows that need processing in ascending order """
+        return np.flatnonzero(self.needs_processing)
+
+    def get_value(self, column_name) -> np.ndarray:
+        if column_name in self.values:
+            return self.values[column_name]
+        if column_name == CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value:
+            return self.normalized_mean_biomarkers
+        raise ValueError("Column '{}' is not available as array".format(column_name))
+
+    def add_flag(self, rows_mask: np.ndarray, sewage_flag: SewageFlag) -> None:
+        FlagStore.set_flag(self.flag, rows_mask, sewage_flag)
+
+    def is_flag_set(self, sewage_flag: SewageFlag) -> np.ndarray:
+        return FlagStore.is_flag_set(self.flag, sewage_flag)
+
+    def is_not_flag_set(self, sewage_flag: SewageFlag) -> np.ndarray:
+        return FlagStore.is_not_flag_set(self.flag, sewage_flag)
+
+    @staticmethod
+    def __write_column(measurements: pd.DataFrame, column, values: np.ndarray) -> None:
+        # the columns keep their type, thus the compact layout keeps the float32 values as the row-wise engine does
+        measurements[column] = values.astype(measurements[column].dtype) if column in measurements else values
+
+    def write_back(self, measurements: pd.DataFrame) -> None:
+        """ Writes all calculated arrays back into the columns of the data frame, keeping the type of existing columns """
+        self.flag_store.write_back(measurements)
+        for pair_idx, biomarker_ratio in enumerate(self.biomarker_ratios):
+            self.__write_column(measurements, biomarker_ratio, self.biomarker_ratio_values[:, pair_idx])
+        self.__write_column(measurements, CalculatedColumns.NUMBER_OF_USABLE_BIOMARKERS.value, self.num_usable_biomarkers)
+        self.__write_column(measurements, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value, self.normalized_mean_biomarkers)
+        self.__write_column(measurements, CalculatedColumns.BASE_REPRODUCTION_FACTOR.value, self.base_reproduction_factor)
+        self.__write_column(measurements, CalculatedColumns.USABLE.value, self.usable)
+        self.__write_column(measurements, CalculatedColumns.OUTLIER_REASON.value, self.outlier_reason)
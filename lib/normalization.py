@@ -1,9 +1,10 @@
 # Created by alex at 03.07.23
 import pandas as pd
 import math
+import itertools
 from .utils import *
 from .statistics import *
-from .plotting import *
+from .measurement_arrays import MeasurementArrays
 
 
 class SewageNormalization:
@@ -193,4 +194,100 @@ class SewageNormalization:
             # remove biomarker ratio outliers in case the sample is valid
             self.__clear_biomarker_ratio_outliers(measurements, index)
 
+    def process_location(self, sample_location: str, arrays: MeasurementArrays):
+        """
+        Vectorized normalization and final outlier decision of all measurements of a sample location that need processing.
+        """
+        rows_mask = arrays.needs_processing
+        normalized_mean_biomarkers = self.__normalize_with_sewage_flow_for_location(arrays, rows_mask)
+        is_normalized = rows_mask & ~np.isnan(normalized_mean_biomarkers) & (normalized_mean_biomarkers != 0)
+        arrays.normalized_mean_biomarkers[is_normalized] = normalized_mean_biomarkers[is_normalized]
+        for index in arrays.get_rows_to_process():
+            if is_normalized[index]:
+                self.__detect_basic_reproduction_number_outliers_for_location(arrays, index)
+            else:
+                # no normalized mean biomarker could be calculated --> too less usable biomarkers
+                self.sewageStat.add_reproduction_factor_outlier('failed')
+                arrays.flag[index] |= SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED.value
+        self.__decide_biomarker_usable_based_on_flags_for_location(arrays, rows_mask)
+
+    def __normalize_with_sewage_flow_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray) -> np.ndarray:
+        """
+        Array version of '__normalize_with_sewage_flow'. Returns NaN for measurements that can not be normalized.
+        """
+        enough_biomarkers = arrays.num_usable_biomarkers >= self.min_number_of_biomarkers_for_normalization
+        arrays.add_flag(rows_mask & ~enough_biomarkers, SewageFlag.NOT_ENOUGH_BIOMARKERS_FOR_NORMALIZATION)
+        is_normalizable = rows_mask & enough_biomarkers & arrays.is_not_flag_set(SewageFlag.MISSING_MEAN_SEWAGE_FLOW)
+        biomarker_values = arrays.biomarker_values
+        usable_biomarkers = ((arrays.biomarker_flags & SewageFlag.BIOMARKER_VALIDATED_OUTLIER.value) == 0) & \
+                            ((arrays.biomarker_flags & SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY.value) == 0) & \
+                            ~np.isnan(biomarker_values) & (biomarker_values != 0)
+        # the row-wise engine calculates with numpy scalars, which are promoted differently than arrays, e.g. in the
+        # compact layout the mean of the float32 values is a float32, but multiplied with a number a float64
+        scalar_type = (biomarker_values.dtype.type(1) * 1000).dtype
+        normalized_mean_biomarkers = np.full(arrays.size, np.NAN)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_sewage_flow = (arrays.get_value(Columns.MEAN_SEWAGE_FLOW.value).astype(scalar_type) / 1000) * 60 * 60 * 24  # from l/s --> m³/day
+            num_usable_biomarkers = usable_biomarkers.sum(axis=1).astype(biomarker_values.dtype)
+            mean_biomarker_value = (np.where(usable_biomarkers, biomarker_values, 0).sum(axis=1) / num_usable_biomarkers).astype(scalar_type) \
+                                   * 1000 * 1000  # from genecopies/ml --> mean genecopies/m³
+            normalized_mean_biomarkers[is_normalizable] = np.round(mean_biomarker_value * mean_sewage_flow, 2)[is_normalizable]  # genecopies/day
+        return normalized_mean_biomarkers
+
+    def __detect_basic_reproduction_number_outliers_for_location(self, arrays: MeasurementArrays, index) -> None:
+        normalized_mean_biomarkers = arrays.normalized_mean_biomarkers
+        last_values_one_week = get_last_N_month_and_days_positions(arrays, index, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value,
+                                                                   num_month=0, num_days=self.num_previous_days_reproduction_factor,
+                                                                   sewage_flag=SewageFlag.REPRODUCTION_NUMBER_OUTLIER)
+        last_values_one_week = last_values_one_week[normalized_mean_biomarkers[last_values_one_week] > 0]
+        if last_values_one_week.shape[0] > 0:
+            current_mean_normalized_biomarker = normalized_mean_biomarkers[index]
+            last_mean_normalized_biomarker = np.mean(normalized_mean_biomarkers[last_values_one_week])
+            if last_mean_normalized_biomarker > 0 and current_mean_normalized_biomarker > 0:  # no division by zero
+                reproduction_factor = current_mean_normalized_biomarker / last_mean_normalized_biomarker
+                arrays.base_reproduction_factor[index] = reproduction_factor
+                if reproduction_factor > self.base_reproduction_value_factor or reproduction_factor < (1 / self.base_reproduction_value_factor):
+                    arrays.flag[index] |= SewageFlag.REPRODUCTION_NUMBER_OUTLIER.value
+                    self.sewageStat.add_reproduction_factor_outlier('failed')
+                return
+        arrays.flag[index] |= SewageFlag.REPRODUCTION_NUMBER_OUTLIER_SKIPPED.value
+        self.sewageStat.add_reproduction_factor_outlier('skipped')
 
+    def __decide_biomarker_usable_based_on_flags_for_location(self, arrays: MeasurementArrays, rows_mask: np.ndarray):
+        """
+        Array version of 'decide_biomarker_usable_based_on_flags'
+        """
+        is_biomarker_flagged = ((arrays.biomarker_flags & SewageFlag.BIOMARKER_PROBABLE_OUTLIER.value) != 0) | \
+                               ((arrays.biomarker_flags & SewageFlag.BIOMARKER_VALIDATED_OUTLIER.value) != 0)
+        surrogate_virus_outliers = np.column_stack([arrays.is_flag_set(CalculatedColumns.get_surrogate_outlier_flag(sVirus))
+                                                    for sVirus in Columns.get_surrogatevirus_columns()])
+        are_both_surrogate_virus_outliers = surrogate_virus_outliers.all(axis=1)
+        num_surrogate_virus_flags = surrogate_virus_outliers.sum(axis=1)
+        num_flags = arrays.is_flag_set(SewageFlag.COMMENT_NOT_EMPTY).astype(int) + is_biomarker_flagged.sum(axis=1) + \
+            np.where(are_both_surrogate_virus_outliers, 0, num_surrogate_virus_flags) + \
+            arrays.is_flag_set(SewageFlag.AMMONIUM_OUTLIER).astype(int) + arrays.is_flag_set(SewageFlag.CONDUCTIVITY_OUTLIER).astype(int)
+        # outlier reasons in the order of the row-wise decision
+        outlier_reasons = [('Min num biomarkers not reached', arrays.is_flag_set(SewageFlag.NOT_ENOUGH_BIOMARKERS_FOR_NORMALIZATION)),
+                           ('Surrogate virus outlier', are_both_surrogate_virus_outliers),
+                           ('Sewage flow outlier', arrays.is_flag_set(SewageFlag.SEWAGE_FLOW_PRECIPITATION) & (num_surrogate_virus_flags > 0)),
+                           ('Sewage flow outlier', arrays.is_flag_set(SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION)),
+                           ('Sewage flow outlier', arrays.is_flag_set(SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO)),
+                           ('Reproduction factor outlier', arrays.is_flag_set(SewageFlag.REPRODUCTION_NUMBER_OUTLIER)),
+                           ('Too many flags', num_flags > self.max_number_of_flags_for_outlier)]
+        is_outlier = np.zeros(arrays.size, dtype=bool)
+        reason_counts = dict()
+        for reason, reason_mask in outlier_reasons:
+            reason_mask = reason_mask & rows_mask
+            is_outlier |= reason_mask
+            reason_counts.setdefault(reason, np.zeros(arrays.size, dtype=int))
+            reason_counts[reason] += reason_mask
+            arrays.outlier_reason = np.where(reason_mask, np.where(arrays.outlier_reason == '', reason, arrays.outlier_reason + ', ' + reason),
+                                             arrays.outlier_reason).astype(object)
+        reasons = list(reason_counts.keys())
+        for reason_idx in order_by_first_occurrence([reason_counts[reason] > 0 for reason in reasons]):
+            self.sewageStat.add_outliers(reasons[reason_idx], count=int(reason_counts[reasons[reason_idx]].sum()))
+        arrays.usable[rows_mask] = ~is_outlier[rows_mask]
+        # remove biomarker ratio outliers in case the sample is valid
+        is_valid = (rows_mask & ~is_outlier)[:, np.newaxis]
+        ratio_outliers = (arrays.biomarker_ratio_flags & SewageFlag.BIOMARKER_RATIO_OUTLIER.value) != 0
+        arrays.biomarker_ratio_flags[is_valid & ratio_outliers] |= SewageFlag.BIOMARKER_RATIO_OUTLIER_REMOVED.value
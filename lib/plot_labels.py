@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+
+class LabelPlacement:
+    """
+    Placement of the outlier date labels: 'all' labels, 'none' or 'top-N', the N most extreme outliers of each panel.
+    The iterations of adjust_text are limited by 'max_iterations', thus the plots are rendered in predictable time.
+    """
+
+    def __init__(self, labels="all", max_iterations=500):
+        self.labels = labels
+        self.max_labels = self.parse_labels(labels)
+        self.max_iterations = max_iterations
+
+    @staticmethod
+    def parse_labels(labels: str):
+        """ Returns the maximal number of labels per panel or None for all labels """
+        if labels == "all":
+            return None
+        elif labels == "none":
+            return 0
+        elif labels.startswith("top-") and labels[len("top-"):].isdigit():
+            return int(labels[len("top-"):])
+        raise ValueError("Invalid plot labels '{}'. Use 'none', 'top-N' or 'all'.".format(labels))
+
+    def select(self, labels: list, panel_values: pd.Series) -> list:
+        """
+        Selects the labels (date, value, text) with the largest distance to the median of the panel.
+        The selected labels keep their order.
+        """
+        if self.max_labels is None or len(labels) <= self.max_labels:
+            return labels
+        distances = np.nan_to_num(np.abs(np.array([label[1] for label in labels], dtype=float) - np.nanmedian(panel_values)), nan=-1)
+        selected = np.sort(np.argsort(-distances, kind='stable')[:self.max_labels])
+        return [labels[i] for i in selected]
+
+    def adjust_text(self, texts, **kwargs):
+        if self.max_labels != 0:
+            from adjustText import adjust_text
+            adjust_text(texts, lim=self.max_iterations, **kwargs)
@@ -1,17 +1,60 @@
 # Created by alex at 28.06.23
+import os
+import json
+import pickle
+import hashlib
 import itertools
 from dateutil.relativedelta import relativedelta
 import seaborn as sns
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.lines import Line2D
-from adjustText import adjust_text
 from .constant import *
+from .plot_labels import LabelPlacement
+from .utils import write_file_atomically
 
 
 sns.set_style('darkgrid')
 sns.set_context("talk")
 
 
+label_placement = LabelPlacement()
+
+
+class PickledFigurePages:
+    """
+    Replaces the PdfPages of a plot function: the saved figures are pickled,
+    thus the figures can be created in a worker process and written to the pdf file by the main process.
+    """
+
+    def __init__(self):
+        self.figures = []
+
+    def savefig(self):
+        self.figures.append(pickle.dumps(plt.gcf()))
+
+
+def initialize_plot_worker(placement: LabelPlacement = None):
+    global label_placement
+    plt.switch_backend("Agg")
+    if placement is not None:
+        label_placement = placement
+
+
+def render_plot_page(plot_function, measurements_df, sample_location, *args) -> list:
+    """ Runs the plot function in a worker process and returns its pickled figures """
+    figure_pages = PickledFigurePages()
+    plot_function(figure_pages, measurements_df, sample_location, *args)
+    return figure_pages.figures
+
+
+def save_pickled_figures(pdf_plotter, figures: list):
+    for pickled_figure in figures:
+        figure = pickle.loads(pickled_figure)
+        pdf_plotter.savefig(figure)
+        plt.close(figure)
+
+
 def get_label_colors():
     colors = {'inlier': '#1f77b4',
               'not tested': '#505050',
@@ -29,7 +72,7 @@ def get_date_outlier_labels_flags(plot_frame, filter_column, filter_value, outli
             date = current_row['date'].strftime("%Y-%m-%d")
             t = (current_row['date'], current_row[select_column], date)
             labels.append(t)
-    return labels
+    return label_placement.select(labels, plot_frame[select_column])
 
 
 def get_date_outlier_labels_value(plot_frame, filter_column, filter_value, outlier_column, outlier_value, select_column):
@@ -40,26 +83,24 @@ def get_date_outlier_labels_value(plot_frame, filter_column, filter_value, outli
             date = current_row['date'].strftime("%Y-%m-%d")
             t = (current_row['date'], current_row[select_column], date)
             labels.append(t)
-    return labels
+    return label_placement.select(labels, plot_frame[select_column])
 
 
 def get_general_outlier_date_labels(plot_frame, outlier_col='outlier'):
     labels = []
     for index, current_row in plot_frame.iterrows():
         if current_row[outlier_col] != "":
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = plt.text(current_row['date'], current_row['value'], date, size='xx-small', color='black', horizontalalignment='right', rotation=0)
-            labels.append(t)
-    return labels
+            labels.append((current_row['date'], current_row['value'], current_row['date'].strftime("%Y-%m-%d")))
+    return [plt.text(date, value, text, size='xx-small', color='black', horizontalalignment='right', rotation=0)
+            for date, value, text in label_placement.select(labels, plot_frame['value'])]
 
 def get_date_outlier_labels_by_value(plot_frame, outlier_col='outlier', value='outlier'):
     labels = []
     for index, current_row in plot_frame.iterrows():
         if current_row[outlier_col] == value:
-            date = current_row['date'].strftime("%Y-%m-%d")
-            t = plt.text(current_row['date'], current_row['value'], date, size='xx-small', color='black', horizontalalignment='right', rotation=0)
-            labels.append(t)
-    return labels
+            labels.append((current_row['date'], current_row['value'], current_row['date'].strftime("%Y-%m-%d")))
+    return [plt.text(date, value, text, size='xx-small', color='black', horizontalalignment='right', rotation=0)
+            for date, value, text in label_placement.select(labels, plot_frame['value'])]
 
 
 def __add_outlier_date_labels2ax(g, labels_dict: dict):
@@ -68,7 +109,7 @@ def __add_outlier_date_labels2ax(g, labels_dict: dict):
         for tuples in labels_dict[biomarker_ratio]:
             t = ax.text(tuples[0], tuples[1], tuples[2], size='xx-small', color='black', horizontalalignment='right', rotation=0)
             texts.append(t)
-        adjust_text(texts, ax=ax, arrowprops=dict(arrowstyle='-', color='red'))
+        label_placement.adjust_text(texts, ax=ax, arrowprops=dict(arrowstyle='-', color='red'))
 
 def plot_biomarker_outlier_summary(pdf_plotter, measurements_df, sample_location, outlier_detection_methods):
     plot_frame = pd.DataFrame()
@@ -198,7 +239,7 @@ def plot_sewage_flow(pdf_plotter, measurements_df, sample_location):
     #    plt.title("Mean sewage flow for '{}' - Dry weather flow: '{}'".format(sample_location, round(dry_weather_flow,1)))
     # plt.legend(bbox_to_anchor=(1.01, 0.5), loc='center left', borderaxespad=0)
     labels = get_date_outlier_labels_by_value(plot_frame, 'outlier', 'outlier')
-    adjust_text(labels)
+    label_placement.adjust_text(labels)
     sns.move_legend(
         g, loc="upper center",
         bbox_to_anchor=(.5, -0.1), ncol=3, title=None, frameon=True
@@ -253,7 +294,7 @@ def plot_general_outliers(pdf_plotter, measurements_df, sample_location):
     max_date = plot_frame['date'].max() + relativedelta(days=10)
     g.set(xlim=(min_date, max_date))
     labels = get_general_outlier_date_labels(plot_frame, 'outlier')
-    adjust_text(labels)
+    label_placement.adjust_text(labels)
     sns.move_legend(
         g, loc="upper center",
         bbox_to_anchor=(.5, -0.1), ncol=2, title=None, frameon=True
@@ -265,3 +306,76 @@ def plot_general_outliers(pdf_plotter, measurements_df, sample_location):
     plt.close()
 
 
+
+
+def get_plotted_columns(plot_function) -> list:
+    """ Columns of the measurements used by the plot function """
+    biomarker_pairs = list(itertools.combinations(Columns.get_biomarker_columns(), 2))
+    plotted_columns = {
+        plot_biomarker_outlier_summary: [Columns.DATE.value] +
+                                        [biomarker1 + "/" + biomarker2 for biomarker1, biomarker2 in biomarker_pairs] +
+                                        [CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2) for biomarker1, biomarker2 in biomarker_pairs],
+        plot_surrogatvirus: [Columns.DATE.value, CalculatedColumns.FLAG.value] + Columns.get_surrogatevirus_columns(),
+        plot_water_quality: [Columns.DATE.value, CalculatedColumns.FLAG.value, Columns.AMMONIUM.value, Columns.CONDUCTIVITY.value],
+        plot_sewage_flow: [Columns.DATE.value, CalculatedColumns.FLAG.value, Columns.MEAN_SEWAGE_FLOW.value],
+        plot_biomarker_normalization: [Columns.DATE.value, CalculatedColumns.FLAG.value, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value,
+                                       CalculatedColumns.BASE_REPRODUCTION_FACTOR.value],
+        plot_general_outliers: [Columns.DATE.value, CalculatedColumns.NORMALIZED_MEAN_BIOMARKERS.value, CalculatedColumns.OUTLIER_REASON.value]
+    }
+    return plotted_columns[plot_function]
+
+
+class PlotPageCache:
+    """
+    Cache of the pickled figures of each plot page of a sample location.
+    A page is identified by a fingerprint of the plotted columns, the plot function and its parameters,
+    thus only pages whose plotted data changed are created again.
+    The fingerprints of the pages of the current pdf file are stored in a manifest.
+    """
+    manifest_file_name = "manifest.json"
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    @staticmethod
+    def get_fingerprint(plot_function, measurements_df, sample_location, args) -> str:
+        fingerprint = hashlib.sha1()
+        fingerprint.update(plot_function.__name__.encode('utf-8'))
+        fingerprint.update(plot_function.__code__.co_code)
+        fingerprint.update(repr((sample_location, args, label_placement.labels, label_placement.max_iterations,
+                                 matplotlib.__version__, sns.__version__)).encode('utf-8'))
+        plotted_columns = [c for c in get_plotted_columns(plot_function) if c in measurements_df]
+        fingerprint.update(repr(plotted_columns).encode('utf-8'))
+        fingerprint.update(pd.util.hash_pandas_object(measurements_df[plotted_columns], index=False).to_numpy().tobytes())
+        return fingerprint.hexdigest()
+
+    def __get_page_file(self, fingerprint):
+        return os.path.join(self.cache_folder, "{}.pkl".format(fingerprint))
+
+    def load(self, fingerprint):
+        """ Returns the pickled figures of the page or None if the page is not cached """
+        page_file = self.__get_page_file(fingerprint)
+        if os.path.exists(page_file):
+            with open(page_file, 'rb') as f:
+                return pickle.load(f)
+        return None
+
+    def save(self, fingerprint, figures: list):
+        write_file_atomically(self.__get_page_file(fingerprint), lambda f: pickle.dump(figures, f))
+
+    def is_pdf_unchanged(self, fingerprints: list) -> bool:
+        manifest_file = os.path.join(self.cache_folder, self.manifest_file_name)
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                return json.load(f) == fingerprints
+        return False
+
+    def save_manifest(self, fingerprints: list):
+        """ Stores the fingerprints of the written pdf file and removes the pages no longer used """
+        write_file_atomically(os.path.join(self.cache_folder, self.manifest_file_name),
+                              lambda f: f.write(json.dumps(fingerprints).encode('utf-8')))
+        page_files = {"{}.pkl".format(fingerprint) for fingerprint in fingerprints}
+        for file_name in os.listdir(self.cache_folder):
+            if file_name.endswith(".pkl") and file_name not in page_files:
+                os.remove(os.path.join(self.cache_folder, file_name))
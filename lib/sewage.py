@@ -5,6 +5,18 @@ import itertools
 from datetime import datetime
 
 class SewageSample:
+    """
+    Sewage sample of an ARCGIS feature. The attributes are slots, thus the samples do not carry a per-instance dict.
+    Samples pickled before the slots were introduced are restored by '__setstate__'.
+    """
+    __slots__ = ('arcgisId', 'location_name', 'name', 'collectionDate', 'end_date', 'begin_date', 'mean_sewage_flow',
+                 'crassphage', 'pmmov', 'biomarker_N1', 'biomarker_N2', 'biomarker_N3', 'biomarker_E', 'biomarker_ORF',
+                 'biomarker_RDRP', 'labCopiesMWMeanGenes', 'labCopiesGMWeanGenes', 'trockentag', 'air_temperature',
+                 'water_temperature', 'nh4n', 'pH', 'lf', 'mean_norm_genes', 'rolling_average_3_measurements',
+                 'rolling_average_5_measurements', 'bem_qs', 'bem_pn', 'bem_lab', 'qualified', 'location_id',
+                 'rain_region_id', 'loess_regression_value_last_release',
+                 'loess_percentage_difference_seven_days_before_last_release', 'loess_regression_value',
+                 'loess_percentage_difference_seven_days_before', 'flags', 'discarded')
 
     def __init__(self, feature):
         #self.latitude = feature['geometry']['x']
@@ -63,7 +75,33 @@ class SewageSample:
         self.loess_percentage_difference_seven_days_before_last_release = None
         self.loess_regression_value = None
         self.loess_percentage_difference_seven_days_before = None
+        self.flags = []
+        self.discarded = False
 
+    @classmethod
+    def from_dict(cls, attributes: dict):
+        """ Returns the sample with the given attributes, missing attributes are set to their defaults """
+        sample = cls.__new__(cls)
+        sample.__setstate__(attributes)
+        return sample
+
+    def as_dict(self) -> dict:
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__}
+
+    def __getstate__(self):
+        return self.as_dict()
+
+    def __setstate__(self, state):
+        # older pickles hold the instance dict, pickles of slotted objects the tuple (None, slots)
+        if isinstance(state, tuple):
+            state = state[1]
+        for attribute in self.__slots__:
+            setattr(self, attribute, None)
+        self.flags = []
+        self.discarded = False
+        for attribute, value in state.items():
+            if attribute in self.__slots__:
+                setattr(self, attribute, value)
 
     def has_collection_date(self):
         return bool(self.collectionDate)
@@ -0,0 +1,116 @@
+# Converter and loader of the pickled sewage samples (data/sewageData.dat)
+import os
+import sys
+import pickle
+import argparse
+from typing import List
+import pyarrow as pa
+from .constant import SewageFlag
+from .sewage import SewageSample
+from .utils import column_map, input_schema, input_location_column, read_arrow_input_file
+
+# attributes of the samples that are not input columns of the quality control
+sample_schema = pa.schema([
+    ('arcgisId', pa.int64()),
+    ('location_name', pa.string()),
+    ('name', pa.string()),
+    ('end_date', pa.string()),
+    ('begin_date', pa.string()),
+    ('labCopiesMWMeanGenes', pa.float64()),
+    ('labCopiesGMWeanGenes', pa.float64()),
+    ('air_temperature', pa.float64()),
+    ('water_temperature', pa.float64()),
+    ('pH', pa.float64()),
+    ('mean_norm_genes', pa.float64()),
+    ('rolling_average_3_measurements', pa.float64()),
+    ('rolling_average_5_measurements', pa.float64()),
+    ('bem_qs', pa.string()),
+    ('qualified', pa.string()),
+    ('location_id', pa.string()),
+    ('rain_region_id', pa.string()),
+    ('loess_regression_value_last_release', pa.float64()),
+    ('loess_percentage_difference_seven_days_before_last_release', pa.float64()),
+    ('loess_regression_value', pa.float64()),
+    ('loess_percentage_difference_seven_days_before', pa.float64()),
+    ('flags', pa.list_(pa.int64())),
+    ('discarded', pa.bool_())
+])
+
+# the input columns are stored with the input names, thus the file is a valid input file of the quality control
+sewage_data_schema = pa.schema([(input_location_column, pa.string())] + list(input_schema) + list(sample_schema))
+attribute2column = {attribute: column for column, attribute in column_map.items()}
+
+
+def _get_flag_values(flags) -> List[int]:
+    return [flag.value if isinstance(flag, SewageFlag) else int(flag) for flag in flags]
+
+
+def convert_samples2table(sewage_samples: dict) -> pa.Table:
+    """
+    Converts the sewage samples of each sample location into one table with a column per attribute.
+    The samples of a sample location are stored as contiguous rows.
+    """
+    columns = {column: [] for column in sewage_data_schema.names}
+    for sample_location, samples in sewage_samples.items():
+        columns[input_location_column].extend([sample_location] * len(samples))
+        for attribute in SewageSample.__slots__:
+            values = [getattr(sample, attribute) for sample in samples]
+            if attribute == 'flags':
+                values = [_get_flag_values(flags) for flags in values]
+            columns[attribute2column.get(attribute, attribute)].extend(values)
+    return pa.Table.from_arrays([pa.array(columns[field.name], type=field.type) for field in sewage_data_schema],
+                                schema=sewage_data_schema)
+
+
+def convert_table2samples(table: pa.Table) -> dict:
+    """ Returns the sewage samples of each sample location of a table written by 'convert_sewage_data' """
+    columns = {attribute: table.column(attribute2column.get(attribute, attribute)).to_pylist()
+               for attribute in SewageSample.__slots__}
+    sewage_samples = dict()
+    for idx, sample_location in enumerate(table.column(input_location_column).to_pylist()):
+        sample = SewageSample.from_dict({attribute: values[idx] for attribute, values in columns.items()})
+        sample.flags = [SewageFlag(flag) for flag in sample.flags]
+        sewage_samples.setdefault(sample_location, []).append(sample)
+    return sewage_samples
+
+
+def convert_sewage_data(pickle_file: str, arrow_file: str) -> int:
+    """
+    Converts the pickled sewage samples into an uncompressed arrow file, which is memory-mapped when read.
+    Returns the number of converted samples.
+    """
+    with open(pickle_file, "rb") as f:
+        table = convert_samples2table(pickle.load(f))
+    # written to a temporary file first, thus a running reader never sees a partially written file
+    tmp_file = arrow_file + ".tmp"
+    with pa.OSFile(tmp_file, "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_file, arrow_file)
+    return table.num_rows
+
+
+def open_sewage_data(arrow_file: str) -> pa.Table:
+    """ Returns the memory-mapped table of the converted sewage samples """
+    return pa.ipc.open_file(pa.memory_map(arrow_file, "r")).read_all()
+
+
+def load_sewage_samples(arrow_file: str) -> dict:
+    """ Returns the sewage samples of each sample location as the pickle 'data/sewageData.dat' did """
+    return convert_table2samples(open_sewage_data(arrow_file))
+
+
+def read_sewage_data(arrow_file: str, locations: List[str] = None):
+    """ Yields the sample location and its measurements of the converted sewage samples """
+    return read_arrow_input_file(arrow_file, locations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Converts the pickled sewage samples into a memory-mapped arrow file")
+    parser.add_argument('pickle_file', nargs='?', default=os.path.join("data", "sewageData.dat"))
+    parser.add_argument('arrow_file', nargs='?', default=None)
+    args = parser.parse_args()
+    arrow_file = args.arrow_file or os.path.splitext(args.pickle_file)[0] + ".arrow"
+    num_samples = convert_sewage_data(args.pickle_file, arrow_file)
+    print("{} samples converted to '{}'".format(num_samples, arrow_file))
+    sys.exit(0)
@@ -1,8 +1,9 @@
 # Created by alex at 03.07.23
 import math
-from .plotting import *
 from .statistics import *
 from .utils import *
+from .measurement_arrays import MeasurementArrays
+from .dry_flow_estimator import DryWeatherFlowEstimator
 
 
 class SewageFlow:
@@ -41,8 +42,11 @@ class SewageFlow:
         return mean_dry_flow_estimation
 
     def __get_dry_flow(self, sample_location, measurements_df: pd.DataFrame, current_measurement):
-        is_mean_dry_weather_flow_available = False
         mean_dry_flow_estimation = self.__get_mean_flow_based_on_last_min_values(sample_location, measurements_df, current_measurement)
+        return self.__get_estimated_or_known_dry_flow(sample_location, mean_dry_flow_estimation)
+
+    def __get_estimated_or_known_dry_flow(self, sample_location, mean_dry_flow_estimation):
+        is_mean_dry_weather_flow_available = False
         if mean_dry_flow_estimation:
             is_mean_dry_weather_flow_available = True
             return mean_dry_flow_estimation, is_mean_dry_weather_flow_available
@@ -53,30 +57,34 @@ class SewageFlow:
                     return dry_flow, is_mean_dry_weather_flow_available
         return None, is_mean_dry_weather_flow_available
 
+    def __classify_mean_flow(self, current_mean_flow, dry_flow) -> (SewageFlag, str):
+        """
+        Compares the current mean flow with the dry weather flow.
+        Returns the flag to set (None if the mean flow is plausible) and the status for the statistics.
+        """
+        # is the mean flow a factor of N (default: 9) higher than the dry weather flow --> probable typo
+        if (current_mean_flow / dry_flow) > self.mean_sewage_flow_above_typo_factor:
+            return SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO, 'probable_typo'
+        # is the mean flow a factor of N (default: 2) higher than the dry weather flow --> heavy precipitation
+        elif (current_mean_flow / dry_flow) > 3:
+            return SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION, 'heavy_precipitation'
+        elif (current_mean_flow / dry_flow) > self.heavy_precipitation_factor:
+            return SewageFlag.SEWAGE_FLOW_PRECIPITATION, 'precipitation'
+        # is the mean flow a factor of N (default: 1.5) less than the dry weather flow --> probably typo
+        elif (dry_flow / current_mean_flow) > self.mean_sewage_flow_below_typo_factor:
+            return SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO, 'probable_typo'
+        return None, 'passed'
+
     def __is_mean_flow_above_dry_flow(self, sample_location, measurements: pd.DataFrame, index):
         is_mean_dry_weather_flow_available, dry_flow = False, None
         current_measurement = measurements.iloc[index]
         if SewageFlag.is_not_flag(current_measurement[CalculatedColumns.FLAG.value], SewageFlag.MISSING_MEAN_SEWAGE_FLOW):
             dry_flow, is_mean_dry_weather_flow_available = self.__get_dry_flow(sample_location, measurements, current_measurement)
             if dry_flow:
-                current_mean_flow = current_measurement[Columns.MEAN_SEWAGE_FLOW.value]
-                # is the mean flow a factor of N (default: 9) higher than the dry weather flow --> probable typo
-                if (current_mean_flow / dry_flow) > self.mean_sewage_flow_above_typo_factor:
-                    self.sewageStat.add_sewage_flow_outlier('probable_typo')
-                    measurements.at[index, CalculatedColumns.FLAG.value] += SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value
-                # is the mean flow a factor of N (default: 2) higher than the dry weather flow --> heavy precipitation
-                elif (current_mean_flow / dry_flow) > 3:
-                    self.sewageStat.add_sewage_flow_outlier('heavy_precipitation')
-                    measurements.at[index, CalculatedColumns.FLAG.value] += SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value
-                elif (current_mean_flow / dry_flow) > self.heavy_precipitation_factor:
-                    self.sewageStat.add_sewage_flow_outlier('precipitation')
-                    measurements.at[index, CalculatedColumns.FLAG.value] += SewageFlag.SEWAGE_FLOW_PRECIPITATION.value
-                # is the mean flow a factor of N (default: 1.5) less than the dry weather flow --> probably typo
-                elif (dry_flow / current_mean_flow) > self.mean_sewage_flow_below_typo_factor:
-                    self.sewageStat.add_sewage_flow_outlier('probable_typo')
-                    measurements.at[index, CalculatedColumns.FLAG.value] += SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value
-                else:
-                    self.sewageStat.add_sewage_flow_outlier('passed')
+                sewage_flow_flag, status = self.__classify_mean_flow(current_measurement[Columns.MEAN_SEWAGE_FLOW.value], dry_flow)
+                self.sewageStat.add_sewage_flow_outlier(status)
+                if sewage_flow_flag:
+                    measurements.at[index, CalculatedColumns.FLAG.value] += sewage_flow_flag.value
             else:
                 measurements.at[index, CalculatedColumns.FLAG.value] += SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES.value
                 self.sewageStat.add_sewage_flow_outlier('skipped')
@@ -85,3 +93,43 @@ class SewageFlow:
             self.sewageStat.add_sewage_flow_outlier('skipped')
         return dry_flow, is_mean_dry_weather_flow_available
 
+    def process_location(self, sample_location, arrays: MeasurementArrays):
+        """
+        Vectorized sewage flow quality control of all measurements of a sample location that need processing.
+        The previous mean sewage flows are added to the dry weather flow estimator in the order of the measurements.
+        """
+        mean_sewage_flows = arrays.get_value(Columns.MEAN_SEWAGE_FLOW.value)
+        dry_flow_estimator = DryWeatherFlowEstimator(mean_sewage_flows)
+        # omit samples where any sewage flow tag was set
+        excluded_flags = SewageFlag.SEWAGE_FLOW_HEAVY_PRECIPITATION.value | SewageFlag.SEWAGE_FLOW_PROBABLE_TYPO.value | \
+                         SewageFlag.MISSING_MEAN_SEWAGE_FLOW.value
+        num_added_measurements = 0
+        for index in arrays.get_rows_to_process():
+            # all previous measurements are processed, thus their flags do not change anymore
+            while num_added_measurements < arrays.size and arrays.dates[num_added_measurements] < arrays.dates[index]:
+                if (arrays.flag[num_added_measurements] & excluded_flags) == 0:
+                    dry_flow_estimator.add(mean_sewage_flows[num_added_measurements])
+                num_added_measurements += 1
+            if (arrays.flag[index] & SewageFlag.MISSING_MEAN_SEWAGE_FLOW.value) == 0:
+                mean_dry_flow_estimation = self.__get_mean_flow_based_on_last_min_values_for_location(sample_location, dry_flow_estimator)
+                dry_flow, _ = self.__get_estimated_or_known_dry_flow(sample_location, mean_dry_flow_estimation)
+                if dry_flow:
+                    sewage_flow_flag, status = self.__classify_mean_flow(mean_sewage_flows[index], dry_flow)
+                    self.sewageStat.add_sewage_flow_outlier(status)
+                    if sewage_flow_flag:
+                        arrays.flag[index] |= sewage_flow_flag.value
+                    continue
+            arrays.flag[index] |= SewageFlag.SEWAGE_FLOW_NOT_ENOUGH_PREVIOUS_VALUES.value
+            self.sewageStat.add_sewage_flow_outlier('skipped')
+
+    def __get_mean_flow_based_on_last_min_values_for_location(self, sample_location, dry_flow_estimator: DryWeatherFlowEstimator):
+        """
+        Incremental version of '__get_mean_flow_based_on_last_min_values'
+        """
+        if dry_flow_estimator.num_sewage_flows < self.min_num_samples_for_mean_dry_flow:
+            self.logger.log.debug("[Sewage flow] - [Sample location: '{}'] - Less than '{}' "
+                                  "previous samples obtained. Skipping sewage flow QC...".format(sample_location, self.min_num_samples_for_mean_dry_flow))
+            return None
+        # round up to next integer
+        num_last_N_samples = math.ceil(dry_flow_estimator.num_sewage_flows * self.fraction_last_samples_for_dry_flow)
+        return dry_flow_estimator.get_mean_of_smallest(num_last_N_samples)
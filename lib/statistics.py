@@ -14,6 +14,11 @@ class SewageStat:
         self.water_quality_outliers = dict()
         self.normalization_outliers = dict()
         self.outliers = dict()
+        self.model_cache = dict()
+        self.num_measurements = 0
+        self.timings = dict()
+        self.detector_timings = dict()
+        self.memory_usage = 0
 
     def __reset(self):
         self.stat_dict = dict()
@@ -24,25 +29,30 @@ class SewageStat:
         self.water_quality_outliers = dict()
         self.normalization_outliers = dict()
         self.outliers = dict()
+        self.model_cache = dict()
+        self.num_measurements = 0
+        self.timings = dict()
+        self.detector_timings = dict()
+        self.memory_usage = 0
 
     def set_sample_location_and_total_number(self, sample_location, total_samples_number):
         self.sample_location = sample_location
         self.total_samples = total_samples_number
         self.__reset()
 
-    def add_comment_not_empty(self):
+    def add_comment_not_empty(self, count=1):
         msg = 'Comment not empty'
         self.stat_dict.setdefault(msg, 0)
-        self.stat_dict[msg] += 1
+        self.stat_dict[msg] += count
 
-    def add_mean_sewage_flow_empty(self):
+    def add_mean_sewage_flow_empty(self, count=1):
         msg = 'Mean sewage flow empty'
         self.stat_dict.setdefault(msg, 0)
-        self.stat_dict[msg] += 1
+        self.stat_dict[msg] += count
 
-    def add_biomarker_below_threshold_or_empty(self, biomarker):
+    def add_biomarker_below_threshold_or_empty(self, biomarker, count=1):
         self.biomarker_dict.setdefault(biomarker, 0)
-        self.biomarker_dict[biomarker] += 1
+        self.biomarker_dict[biomarker] += count
 
     def add_biomarker_ratio_outlier(self, biomarker1, biomarker2, status):
         ratio_name = biomarker1 + "/" + biomarker2
@@ -71,9 +81,21 @@ class SewageStat:
         self.normalization_outliers.setdefault(status, 0)
         self.normalization_outliers[status] += 1
 
-    def add_outliers(self, type):
+    def add_outliers(self, type, count=1):
         self.outliers.setdefault(type, 0)
-        self.outliers[type] += 1
+        self.outliers[type] += count
+
+    def set_model_cache_statistics(self, hits, misses):
+        self.model_cache['hits'] = hits
+        self.model_cache['misses'] = misses
+
+    def set_timings(self, num_measurements, timings: dict, detector_timings: dict):
+        self.num_measurements = num_measurements
+        self.timings = timings
+        self.detector_timings = detector_timings
+
+    def set_memory_usage(self, memory_usage):
+        self.memory_usage = memory_usage
 
     def print_statistics(self):
         stats = "{}:\n".format(self.sample_location)
@@ -98,4 +120,8 @@ class SewageStat:
         stats += "Outlier reasons:\n"
         for outlier_type, count in self.outliers.items():
             stats += "\t{}:\t{}\n".format(outlier_type, count)
+        if self.model_cache:
+            stats += "Fitted model cache:\n"
+            for status, count in self.model_cache.items():
+                stats += "\t{}:\t{}\n".format(status, count)
         return stats
\ No newline at end of file
@@ -3,7 +3,7 @@ import math
 from dateutil.relativedelta import relativedelta
 from .utils import *
 from .statistics import *
-from .plotting import *
+from .measurement_arrays import MeasurementArrays
 
 
 class SurrogateVirusQC:
@@ -73,6 +73,34 @@ class SurrogateVirusQC:
                 else:
                     self.sewageStat.add_surrogate_virus_outlier(sVirus, 'skipped')
 
-
-
-
+    def process_location(self, sample_location: str, arrays: MeasurementArrays):
+        """
+        Vectorized surrogatevirus quality control of all measurements of a sample location that need processing.
+        """
+        rows_mask = arrays.needs_processing
+        trockentag = np.char.strip(np.char.lower(arrays.trockentag.astype(str)))
+        arrays.add_flag(rows_mask & (trockentag != "ja"), SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE)
+        is_value_usable = arrays.is_not_flag_set(SewageFlag.SURROGATEVIRUS_VALUE_NOT_USABLE)
+        rows_to_process = arrays.get_rows_to_process()
+        window_starts, window_ends = arrays.date_window_index.get_windows(rows_to_process, self.periode_month_surrogatevirus, 0,
+                                                                          include_start_date=False)
+        statuses = dict()
+        for sVirus in Columns.get_surrogatevirus_columns():
+            sVirus_values = arrays.get_value(sVirus)
+            current_values = sVirus_values[rows_to_process]
+            is_value_present = is_value_usable[rows_to_process] & (current_values != 0) & ~np.isnan(current_values)
+            is_train_value = ~np.isnan(sVirus_values) & is_value_usable & \
+                arrays.is_not_flag_set(CalculatedColumns.get_surrogate_outlier_flag(sVirus))
+            num_previous_values, is_outlier = detect_outliers_in_trailing_windows(self.surrogatevirus_outlier_statistics, sVirus_values,
+                                                                                  is_train_value, rows_to_process[is_value_present],
+                                                                                  window_starts[is_value_present], window_ends[is_value_present],
+                                                                                  self.min_number_surrogatevirus_for_outlier_detection + 1)
+            statuses[sVirus] = np.full(rows_to_process.shape[0], None, dtype=object)
+            statuses[sVirus][is_value_present] = np.where(num_previous_values <= self.min_number_surrogatevirus_for_outlier_detection,
+                                                          'skipped', np.where(is_outlier, 'outlier', 'passed'))
+            arrays.add_flag(rows_to_process[is_value_present][is_outlier], CalculatedColumns.get_surrogate_outlier_flag(sVirus))
+        # statistics in the order of the measurements
+        for row_idx in range(rows_to_process.shape[0]):
+            for sVirus in Columns.get_surrogatevirus_columns():
+                if statuses[sVirus][row_idx]:
+                    self.sewageStat.add_surrogate_virus_outlier(sVirus, statuses[sVirus][row_idx])
@@ -1,17 +1,22 @@
 # Created by alex at 20.06.23
 import os.path
 import sys
+import pickle
+import hashlib
+import json
+import zipfile
+import xml.etree.ElementTree as ElementTree
+import collections
+import contextlib
+import time
 from typing import List
 import datetime
 import dateutil.relativedelta
 import numpy as np
 import pandas as pd
+import pyarrow as pa
 import logging
 import tqdm
-import scipy.stats as st
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
-from sklearn.svm import OneClassSVM
 from .sewage import SewageSample
 from .constant import *
 
@@ -33,47 +38,390 @@ column_map = {
     'TRO_TAG': 'trockentag'
 }
 
+# types of the input columns for parquet, feather and csv files; the collection date is parsed later as for excel files
+input_schema = pa.schema([
+    ('ANFANG', pa.string()),
+    ('BEM_LAB', pa.string()),
+    ('BEM_PN', pa.string()),
+    ('N1_LAB', pa.float64()),
+    ('N2_LAB', pa.float64()),
+    ('N3_LAB', pa.float64()),
+    ('E_LAB', pa.float64()),
+    ('ORF_LAB', pa.float64()),
+    ('RDRP_LAB', pa.float64()),
+    ('NH4N', pa.float64()),
+    ('LF', pa.float64()),
+    ('VOLUMENSTROM', pa.float64()),
+    ('CRASSPHAGE', pa.float64()),
+    ('PMMOV', pa.float64()),
+    ('TRO_TAG', pa.string())
+])
+
+# column (or hive partition key) with the sample location in parquet, feather and csv files
+input_location_column = 'location'
+
+
+def is_sample_location_selected(sample_location: str, locations: List[str] = None) -> bool:
+    """ A sample location is selected if its name contains one of the given locations. No locations select all. """
+    return not locations or any(location in sample_location for location in locations)
+
+
+def read_excel_input_files(input_file: str, locations: List[str] = None, conversion_cache=None):
+    """
+    Yields the sample location and its measurements for each selected sheet of the excel file.
+    The sheets are parsed one at a time and only the columns of 'column_map' are read.
+    With a 'conversion_cache' only the sheets changed since the last run are parsed.
+    """
+    if conversion_cache is not None:
+        yield from conversion_cache.read_excel_input_files(input_file, locations)
+        return
+    with pd.ExcelFile(input_file, engine="openpyxl") as f:
+        for sheet in f.sheet_names:
+            if is_sample_location_selected(sheet, locations):
+                yield sheet, parse_excel_sheet(f, sheet)
+
+
+def parse_excel_sheet(excel_file: pd.ExcelFile, sheet: str) -> pd.DataFrame:
+    df = excel_file.parse(sheet, usecols=lambda column: column in column_map)
+    df.rename(columns=column_map, inplace=True)
+    return df[list(column_map.values())]
+
+
+def write_file_atomically(file_name, write):
+    """
+    Writes a file with 'write', which gets the opened binary file. The file is written to a temporary file first,
+    thus a concurrent reader never sees a partially written file.
+    """
+    tmp_file_name = "{}.{}.tmp".format(file_name, os.getpid())
+    try:
+        with open(tmp_file_name, 'wb') as f:
+            write(f)
+        os.replace(tmp_file_name, file_name)
+    finally:
+        if os.path.exists(tmp_file_name):
+            os.remove(tmp_file_name)
+
 
-def read_excel_input_files(input_file: str):
-    f = pd.ExcelFile(input_file)
-    location_dict = dict()
-    for sheet in f.sheet_names:
-        df = f.parse(sheet)
-        df.rename(columns=column_map, inplace=True)
-        df = df[list(column_map.values())]
-        location_dict[sheet] = df
-    return location_dict
+class ExcelConversionCache:
+    """
+    On-disk cache of the parsed sheets of excel input files.
+    An unchanged workbook (same size and modification time or same content hash) is not opened at all.
+    Otherwise, only sheets whose worksheet, shared strings or styles differ from the cached version are parsed again.
+    The parsed sheets are pickled, as the object columns of the excel sheets may contain mixed types.
+    """
+    manifest_file_name = "manifest.json"
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        self.parsed_sheets = 0
+        self.cached_sheets = 0
+
+    def __get_workbook_folder(self, input_file):
+        return os.path.join(self.cache_folder, hashlib.sha1(os.path.abspath(input_file).encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def __get_content_hash(input_file) -> str:
+        content_hash = hashlib.sha1()
+        with open(input_file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    @staticmethod
+    def __get_sheet_keys(input_file) -> dict:
+        """
+        Key of each sheet in workbook order. The key is based on the CRC of the worksheet part, the shared strings and
+        the styles stored in the xlsx archive, thus the sheets are not decompressed.
+        """
+        main_namespace = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+        relationship_namespace = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+        with zipfile.ZipFile(input_file) as archive:
+            crcs = {info.filename: info.CRC for info in archive.infolist()}
+            workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+            relationships = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {relationship.get("Id"): relationship.get("Target") for relationship in relationships}
+        shared_crcs = "{}:{}:{}".format(crcs.get("xl/sharedStrings.xml"), crcs.get("xl/styles.xml"), repr(column_map))
+        sheet_keys = dict()
+        for sheet in workbook.iter(main_namespace + "sheet"):
+            target = targets[sheet.get(relationship_namespace + "id")]
+            sheet_part = target.lstrip("/") if target.startswith("/") else "xl/" + target
+            sheet_key = "{}:{}:{}".format(sheet.get("name"), crcs.get(sheet_part), shared_crcs)
+            sheet_keys[sheet.get("name")] = hashlib.sha1(sheet_key.encode('utf-8')).hexdigest()
+        return sheet_keys
+
+    def __load_manifest(self, workbook_folder):
+        manifest_file = os.path.join(workbook_folder, self.manifest_file_name)
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                return json.load(f)
+        return None
+
+    def __get_manifest(self, input_file, workbook_folder) -> dict:
+        file_stat = os.stat(input_file)
+        manifest = self.__load_manifest(workbook_folder)
+        if manifest is not None and manifest["size"] == file_stat.st_size and manifest["mtime_ns"] == file_stat.st_mtime_ns:
+            return manifest
+        content_hash = self.__get_content_hash(input_file)
+        if manifest is None or manifest["content_hash"] != content_hash:
+            sheets = self.__get_sheet_keys(input_file)
+        else:
+            sheets = manifest["sheets"]
+        manifest = {"path": os.path.abspath(input_file), "size": file_stat.st_size, "mtime_ns": file_stat.st_mtime_ns,
+                    "content_hash": content_hash, "sheets": sheets}
+        write_file_atomically(os.path.join(workbook_folder, self.manifest_file_name),
+                              lambda f: f.write(json.dumps(manifest, indent=2).encode('utf-8')))
+        return manifest
+
+    def read_excel_input_files(self, input_file: str, locations: List[str] = None):
+        workbook_folder = self.__get_workbook_folder(input_file)
+        os.makedirs(workbook_folder, exist_ok=True)
+        manifest = self.__get_manifest(input_file, workbook_folder)
+        excel_file = None
+        try:
+            for sheet, sheet_key in manifest["sheets"].items():
+                if not is_sample_location_selected(sheet, locations):
+                    continue
+                sheet_file = os.path.join(workbook_folder, "{}.pkl".format(sheet_key))
+                if os.path.exists(sheet_file):
+                    with open(sheet_file, 'rb') as f:
+                        df = pickle.load(f)
+                    self.cached_sheets += 1
+                else:
+                    if excel_file is None:
+                        excel_file = pd.ExcelFile(input_file, engine="openpyxl")
+                    df = parse_excel_sheet(excel_file, sheet)
+                    write_file_atomically(sheet_file, lambda f: pickle.dump(df, f))
+                    self.parsed_sheets += 1
+                yield sheet, df
+        finally:
+            if excel_file is not None:
+                excel_file.close()
+        self.__remove_outdated_sheets(workbook_folder, manifest)
+
+    @staticmethod
+    def __remove_outdated_sheets(workbook_folder, manifest):
+        sheet_files = {"{}.pkl".format(sheet_key) for sheet_key in manifest["sheets"].values()}
+        for file_name in os.listdir(workbook_folder):
+            if file_name.endswith(".pkl") and file_name not in sheet_files:
+                os.remove(os.path.join(workbook_folder, file_name))
+
+
+def read_input_files(input_file: str, locations: List[str] = None, conversion_cache: ExcelConversionCache = None):
+    """
+    Yields the sample location and its measurements for each selected sample location of the input.
+    Supported inputs:
+        excel file (.xlsx): one sheet per sample location
+        parquet file or dataset (.parquet or folder): sample location as column or hive partition 'location=<name>'
+        feather/arrow file (.feather, .arrow): sample location as column
+        csv file (.csv): sample location as column
+        folder of csv files: one file per sample location named '<sample location>.csv'
+    """
+    if os.path.isdir(input_file):
+        csv_files = sorted(f for f in os.listdir(input_file) if f.lower().endswith(".csv"))
+        if len(csv_files) > 0:
+            return read_csv_input_folder(input_file, csv_files, locations)
+        return read_columnar_input_files(input_file, "parquet", locations)
+    extension = os.path.splitext(input_file)[1].lower()
+    if extension == ".parquet":
+        return read_columnar_input_files(input_file, "parquet", locations)
+    elif extension in [".feather", ".arrow"]:
+        return read_arrow_input_file(input_file, locations)
+    elif extension == ".csv":
+        import pyarrow.dataset
+        return read_columnar_input_files(input_file, pyarrow.dataset.CsvFileFormat(convert_options=_get_csv_convert_options()), locations)
+    return read_excel_input_files(input_file, locations, conversion_cache)
+
+
+def _get_csv_convert_options(include_columns: List[str] = None):
+    import pyarrow.csv
+    return pyarrow.csv.ConvertOptions(column_types=input_schema, strings_can_be_null=True, include_columns=include_columns)
+
+
+def _convert_input_table(table: pa.Table) -> pd.DataFrame:
+    """ Casts the input columns to the input schema and renames them with 'column_map' """
+    table = table.select(input_schema.names).cast(input_schema)
+    return table.rename_columns([column_map[column] for column in table.column_names]).to_pandas()
+
+
+def read_columnar_input_files(input_file: str, file_format, locations: List[str] = None):
+    """
+    Yields the sample location and its measurements of a parquet, feather or csv file or dataset.
+    Only the columns of 'column_map' and the rows of one sample location are read at a time.
+    """
+    import pyarrow.dataset
+    dataset = pyarrow.dataset.dataset(input_file, format=file_format, partitioning="hive")
+    sample_locations = dataset.to_table(columns=[input_location_column]).column(input_location_column).unique().to_pylist()
+    for sample_location in sample_locations:
+        if sample_location is not None and is_sample_location_selected(str(sample_location), locations):
+            table = dataset.to_table(columns=input_schema.names,
+                                     filter=pyarrow.dataset.field(input_location_column) == sample_location)
+            yield str(sample_location), _convert_input_table(table)
+
+
+def read_arrow_input_file(input_file: str, locations: List[str] = None):
+    """
+    Yields the sample location and its measurements of a feather/arrow file. The file is memory-mapped,
+    thus for uncompressed files only the rows of the selected sample locations are copied into memory.
+    """
+    import pyarrow.feather
+    import pyarrow.compute
+    table = pyarrow.feather.read_table(input_file, columns=[input_location_column] + input_schema.names, memory_map=True)
+    location_column = table.column(input_location_column)
+    for sample_location in location_column.unique().to_pylist():
+        if sample_location is not None and is_sample_location_selected(str(sample_location), locations):
+            yield str(sample_location), _convert_input_table(table.filter(pyarrow.compute.equal(location_column, sample_location)))
+
+
+def read_csv_input_folder(input_folder: str, csv_files: List[str], locations: List[str] = None):
+    """
+    Yields the sample location and its measurements for each selected csv file of the folder.
+    """
+    for csv_file in csv_files:
+        sample_location = os.path.splitext(csv_file)[0]
+        if is_sample_location_selected(sample_location, locations):
+            import pyarrow.csv
+            table = pyarrow.csv.read_csv(os.path.join(input_folder, csv_file),
+                                         convert_options=_get_csv_convert_options(input_schema.names))
+            yield sample_location, _convert_input_table(table)
 
 
 def convert_sample_list2pandas(measurements: List[SewageSample]):
-    table = pd.DataFrame.from_records([vars(s) for s in measurements])
+    table = pd.DataFrame.from_records([s.as_dict() for s in measurements])
     return table
 
 
+class FittedModelCache:
+    """
+    Bounded LRU cache of fitted outlier detection models (lof, svm, rf). The models are keyed by a hash of the
+    training values and the model parameters, thus identical training windows are fitted only once.
+    The cache can be saved to a file to reuse the fitted models in the next run.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.models = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __get_key(self, method, parameters, train_values: np.ndarray) -> str:
+        key = hashlib.sha1()
+        key.update(method.encode('utf-8'))
+        key.update(repr(parameters).encode('utf-8'))
+        key.update(np.ascontiguousarray(train_values, dtype=float).tobytes())
+        return key.hexdigest()
+
+    def get_model(self, method, parameters, train_values: np.ndarray, fit_model):
+        """
+        Returns the cached model for the training values or fits a new model with 'fit_model'.
+        """
+        key = self.__get_key(method, parameters, train_values)
+        if key in self.models:
+            self.hits += 1
+            self.models.move_to_end(key)
+            return self.models[key]
+        self.misses += 1
+        model = fit_model()
+        if self.max_size > 0:
+            self.models[key] = model
+            while len(self.models) > self.max_size:
+                self.models.popitem(last=False)
+        return model
+
+    def load(self, cache_file):
+        if not os.path.exists(cache_file):
+            return
+        import sklearn
+        with open(cache_file, 'rb') as f:
+            cached = pickle.load(f)
+        # models fitted with another scikit-learn version are not reused
+        if cached.get("sklearn_version") == sklearn.__version__:
+            for key, model in cached["models"].items():
+                self.models[key] = model
+            while len(self.models) > self.max_size:
+                self.models.popitem(last=False)
+
+    def save(self, cache_file):
+        import sklearn
+        tmp_cache_file = "{}.{}.tmp".format(cache_file, os.getpid())
+        try:
+            with open(tmp_cache_file, 'wb') as f:
+                pickle.dump({"sklearn_version": sklearn.__version__, "models": self.models}, f)
+            os.replace(tmp_cache_file, cache_file)
+        finally:
+            if os.path.exists(tmp_cache_file):
+                os.remove(tmp_cache_file)
+
+
+fitted_model_cache = FittedModelCache()
+
+
+class StageTimer:
+    """
+    Accumulated wall clock time and number of calls per stage, e.g. the quality control steps of a sample location
+    or the outlier detection methods.
+    """
+
+    def __init__(self):
+        self.seconds = collections.OrderedDict()
+        self.calls = collections.OrderedDict()
+
+    @contextlib.contextmanager
+    def measure(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def add(self, stage, seconds, calls=1):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.calls[stage] = self.calls.get(stage, 0) + calls
+
+    def add_timings(self, timings: dict):
+        """ Adds the timings of another timer obtained with 'to_dict' """
+        for stage, timing in timings.items():
+            self.add(stage, timing["seconds"], timing["calls"])
+
+    def reset(self):
+        self.seconds.clear()
+        self.calls.clear()
+
+    def to_dict(self) -> dict:
+        return {stage: {"seconds": seconds, "calls": self.calls[stage]} for stage, seconds in self.seconds.items()}
+
+
+detector_timer = StageTimer()
+
+
 def detect_outliers(outlier_statistics, train_values, test_value, isFactor=False):
     outlier_detected = []
     if 'svm' in outlier_statistics or 'all' in outlier_statistics:
-        is_svm_outlier = is_oneClassSVM(test_value, train_values)
+        with detector_timer.measure('svm'):
+            is_svm_outlier = is_oneClassSVM(test_value, train_values)
         outlier_detected.append(is_svm_outlier)
     if 'lof' in outlier_statistics or 'all' in outlier_statistics:
-        is_lof_outlier = is_outlier_local_outlier_factor(test_value, train_values)
+        with detector_timer.measure('lof'):
+            is_lof_outlier = is_outlier_local_outlier_factor(test_value, train_values)
         outlier_detected.append(is_lof_outlier)
     if 'rf' in outlier_statistics or 'all' in outlier_statistics:
-        is_isolation_forest_outlier, isolation_forest_score_ratio = is_outlier_isolation_forest(test_value, train_values)
+        with detector_timer.measure('rf'):
+            is_isolation_forest_outlier, isolation_forest_score_ratio = is_outlier_isolation_forest(test_value, train_values)
         outlier_detected.append(is_isolation_forest_outlier)
     if 'ci' in outlier_statistics or 'all' in outlier_statistics:
-        is_confidence_interval_99_outlier, confidence_interval = is_confidence_interval_outlier(test_value, train_values, 0.99)
+        with detector_timer.measure('ci'):
+            is_confidence_interval_99_outlier, confidence_interval = is_confidence_interval_outlier(test_value, train_values, 0.99)
         outlier_detected.append(is_confidence_interval_99_outlier)
     if 'iqr' in outlier_statistics or 'all' in outlier_statistics:
-        is_iqr_outlier, iqr_range = interquartile_range(test_value, train_values, isFactor)
+        with detector_timer.measure('iqr'):
+            is_iqr_outlier, iqr_range = interquartile_range(test_value, train_values, isFactor)
         outlier_detected.append(is_iqr_outlier)
     if 'zscore' in outlier_statistics or 'all' in outlier_statistics:
-        is_zscore_outlier, z_score_threshold = is_outlier_modified_z_score(test_value, train_values)
+        with detector_timer.measure('zscore'):
+            is_zscore_outlier, z_score_threshold = is_outlier_modified_z_score(test_value, train_values)
         outlier_detected.append(is_zscore_outlier)
     return all(outlier_detected)
 
 
-
 def is_outlier_local_outlier_factor(test_value: float, train_values: List[float], contamination='auto'):
     """
     The Local Outlier Factor measures the local deviation of the density of a given sample with respect to its neighbors.
@@ -86,9 +434,11 @@ def is_outlier_local_outlier_factor(test_value: float, train_values: List[float]
     :param train_values: values to be used for training the model
     :param contamination:  the amount of contamination, i.e. the proportion of outliers in the data set. Range should be: (0, 0.5]
     """
+    from sklearn.neighbors import LocalOutlierFactor
     X = np.array(train_values).reshape(-1, 1)
     neighbours = 20 if len(X) > 20 else len(X) - 1
-    lof_novelty = LocalOutlierFactor(n_neighbors=neighbours, novelty=True, contamination=contamination,).fit(X)
+    lof_novelty = fitted_model_cache.get_model('lof', (neighbours, contamination), X,
+                                               lambda: LocalOutlierFactor(n_neighbors=neighbours, novelty=True, contamination=contamination,).fit(X))
     test_value = np.array(test_value).reshape(1, -1)
     prediction = lof_novelty.predict(test_value)
     return prediction[0] == -1
@@ -101,8 +451,9 @@ def is_oneClassSVM(test_value: float, train_values: List[float]):
     :param test_value: the value to be checked as an outlier
     :param train_values: values to be used for training the model
     """
-    model = OneClassSVM(nu=0.1, kernel="rbf", gamma=0.2)
-    model.fit(np.array(train_values).reshape(-1, 1))
+    from sklearn.svm import OneClassSVM
+    X = np.array(train_values).reshape(-1, 1)
+    model = fitted_model_cache.get_model('svm', (0.1, "rbf", 0.2), X, lambda: OneClassSVM(nu=0.1, kernel="rbf", gamma=0.2).fit(X))
     prediction = model.predict(np.array(test_value).reshape(-1, 1))   #1 = inlier;  -1 : outlier
     print(prediction)
     if prediction[0] == 1:
@@ -123,11 +474,12 @@ def is_outlier_isolation_forest(test_value: float, train_values: List[float], co
     :param train_values: values to be used for training the model
     :param contamination:  the amount of contamination, i.e. the proportion of outliers in the data set. Range should be: (0, 0.5]
     """
+    from sklearn.ensemble import IsolationForest
     X = pd.DataFrame(train_values)
     X.rename(columns={X.columns[0]: 'samples'}, inplace=True)
-    model = IsolationForest(n_estimators=100, warm_start=False, contamination=contamination,
-                            n_jobs=4)  # contamination="auto" else range should be (0, 0.5]
-    model.fit(X.values)
+    model = fitted_model_cache.get_model('rf', (100, contamination), X.values,
+                                         lambda: IsolationForest(n_estimators=100, warm_start=False, contamination=contamination,
+                                                                 n_jobs=4).fit(X.values))  # contamination="auto" else range should be (0, 0.5]
     test = np.array(test_value).reshape(1, -1)
     score = model.decision_function(test)
     outlier = model.predict(test)
@@ -164,6 +516,7 @@ def interquartile_range(test_value: float, train_values: List[float], isFactor=F
 
 
 def is_confidence_interval_outlier(test_value: float, train_values: List[float], confidence: float):
+    import scipy.stats as st
     train_values = train_values.tolist()
     if len(train_values) < 30:  # use t-distribution in case less than 30 samples are used
         confidence_interval = st.t.interval(alpha=confidence, df=len(train_values) - 1,
@@ -178,6 +531,166 @@ def is_confidence_interval_outlier(test_value: float, train_values: List[float],
     return True, confidence_interval
 
 
+def get_sorted_window_values(train_values: np.ndarray, window_starts: np.ndarray, window_ends: np.ndarray):
+    """
+    Collects the non-empty training values of each window [start, end) as sorted row of a matrix padded with NaN.
+
+    :return: matrix with one sorted row per window and the number of values per window
+    """
+    window_sizes = window_ends - window_starts
+    max_window_size = int(window_sizes.max()) if window_sizes.shape[0] > 0 else 0
+    positions = window_starts[:, np.newaxis] + np.arange(max_window_size)
+    in_window = positions < window_ends[:, np.newaxis]
+    window_values = np.where(in_window, train_values[np.minimum(positions, train_values.shape[0] - 1)], np.NAN)
+    window_values.sort(axis=1)  # NaN values are sorted to the end
+    return window_values, (~np.isnan(window_values)).sum(axis=1)
+
+
+def get_quantile_of_sorted_windows(sorted_values: np.ndarray, num_values: np.ndarray, quantile: float) -> np.ndarray:
+    """
+    Same linear interpolation as np.quantile, applied to each row of the sorted window matrix.
+    """
+    rows = np.arange(sorted_values.shape[0])
+    virtual_indexes = (num_values - 1) * quantile
+    previous_indexes = np.clip(np.floor(virtual_indexes).astype(int), 0, None)
+    next_indexes = np.clip(previous_indexes + 1, None, np.maximum(num_values - 1, 0))
+    gamma = virtual_indexes - previous_indexes
+    previous_values = sorted_values[rows, previous_indexes] if sorted_values.shape[1] > 0 else np.full(rows.shape[0], np.NAN)
+    next_values = sorted_values[rows, next_indexes] if sorted_values.shape[1] > 0 else np.full(rows.shape[0], np.NAN)
+    diff = next_values - previous_values
+    return np.where(gamma >= 0.5, next_values - diff * (1 - gamma), previous_values + diff * gamma)
+
+
+def get_median_of_sorted_windows(sorted_values: np.ndarray, num_values: np.ndarray) -> np.ndarray:
+    """
+    Same as np.median, applied to each row of the sorted window matrix.
+    """
+    if sorted_values.shape[1] == 0:
+        return np.full(sorted_values.shape[0], np.NAN)
+    rows = np.arange(sorted_values.shape[0])
+    lower_values = sorted_values[rows, np.clip((num_values - 1) // 2, 0, None)]
+    upper_values = sorted_values[rows, np.clip(num_values // 2, 0, None)]
+    return np.where(num_values % 2 == 1, upper_values, (lower_values + upper_values) / 2)
+
+
+def interquartile_range_of_windows(test_values: np.ndarray, sorted_values: np.ndarray, num_values: np.ndarray, isFactor=False) -> np.ndarray:
+    q1 = get_quantile_of_sorted_windows(sorted_values, num_values, 0.25)
+    q3 = get_quantile_of_sorted_windows(sorted_values, num_values, 0.75)
+    iqr = q3 - q1
+    multiplier = 1.5
+    minimum = q1 - multiplier * iqr
+    if isFactor:
+        minimum = 1 / (q3 + multiplier * iqr)
+    maximum = q3 + multiplier * iqr
+    return ~((minimum <= test_values) & (test_values <= maximum))
+
+
+def modified_z_score_of_windows(test_values: np.ndarray, sorted_values: np.ndarray, num_values: np.ndarray) -> np.ndarray:
+    median = get_median_of_sorted_windows(sorted_values, num_values)
+    abs_diff = np.abs(sorted_values - median[:, np.newaxis])
+    abs_diff.sort(axis=1)
+    median_abs_diff = get_median_of_sorted_windows(abs_diff, num_values)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        modified_zscore = 0.6745 * ((test_values - median) / median_abs_diff)
+    max_standard_deviation = 3.5  # how many std deviations; good value
+    return modified_zscore > max_standard_deviation
+
+
+def confidence_interval_of_windows(test_values: np.ndarray, sorted_values: np.ndarray, num_values: np.ndarray, confidence: float) -> np.ndarray:
+    import scipy.stats as st
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.nanmean(sorted_values, axis=1) if sorted_values.shape[1] > 0 else np.full(num_values.shape[0], np.NAN)
+        sem = np.nanstd(sorted_values, axis=1, ddof=1) / np.sqrt(num_values) if sorted_values.shape[1] > 0 else mean
+        # use t-distribution in case less than 30 samples are used, else normal distribution
+        t_interval = st.t.interval(confidence, df=np.maximum(num_values - 1, 1), loc=mean, scale=sem)
+        norm_interval = st.norm.interval(confidence, loc=mean, scale=sem)
+    minimum = np.where(num_values < 30, t_interval[0], norm_interval[0])
+    maximum = np.where(num_values < 30, t_interval[1], norm_interval[1])
+    return ~((minimum <= test_values) & (test_values <= maximum))
+
+
+def detect_outliers_in_windows(outlier_statistics, train_values: np.ndarray, window_starts: np.ndarray, window_ends: np.ndarray,
+                               test_values: np.ndarray, isFactor=False) -> np.ndarray:
+    """
+    Batch version of 'detect_outliers'. The training values of the i-th test value are the non-empty values
+    train_values[window_starts[i]:window_ends[i]]. The statistical methods (iqr, zscore, ci) are evaluated for all windows
+    at once. The sklearn models (svm, lof, rf) are only fitted for the windows where all statistical methods detected an outlier,
+    since a test value is an outlier only if all selected methods agree.
+
+    :return: boolean mask with one entry per test value
+    """
+    is_outlier = np.ones(test_values.shape[0], dtype=bool)
+    if test_values.shape[0] == 0:
+        return is_outlier
+    use_all = 'all' in outlier_statistics
+    with detector_timer.measure('sorted_windows'):
+        sorted_values, num_values = get_sorted_window_values(train_values, window_starts, window_ends)
+    if 'ci' in outlier_statistics or use_all:
+        with detector_timer.measure('ci'):
+            is_outlier &= confidence_interval_of_windows(test_values, sorted_values, num_values, 0.99)
+    if 'iqr' in outlier_statistics or use_all:
+        with detector_timer.measure('iqr'):
+            is_outlier &= interquartile_range_of_windows(test_values, sorted_values, num_values, isFactor)
+    if 'zscore' in outlier_statistics or use_all:
+        with detector_timer.measure('zscore'):
+            is_outlier &= modified_z_score_of_windows(test_values, sorted_values, num_values)
+    for window_idx in np.flatnonzero(is_outlier):
+        window_values = train_values[window_starts[window_idx]:window_ends[window_idx]]
+        window_values = window_values[~np.isnan(window_values)]
+        test_value = test_values[window_idx]
+        if 'svm' in outlier_statistics or use_all:
+            with detector_timer.measure('svm'):
+                is_outlier[window_idx] &= is_oneClassSVM(test_value, window_values)
+        if 'lof' in outlier_statistics or use_all:
+            with detector_timer.measure('lof'):
+                is_outlier[window_idx] &= is_outlier_local_outlier_factor(test_value, window_values)
+        if 'rf' in outlier_statistics or use_all:
+            with detector_timer.measure('rf'):
+                is_outlier[window_idx] &= is_outlier_isolation_forest(test_value, window_values)[0]
+    return is_outlier
+
+
+def detect_outliers_in_trailing_windows(outlier_statistics, values: np.ndarray, is_train_value: np.ndarray, positions: np.ndarray,
+                                        window_starts: np.ndarray, window_ends: np.ndarray, min_number_of_train_values) -> (np.ndarray, np.ndarray):
+    """
+    Outlier detection for the values at the given positions (ascending), where each detected outlier is removed from the
+    training values of the following positions, as in a row by row processing. All windows are evaluated in one batch;
+    after an outlier is detected only the windows containing the outlier are evaluated again.
+
+    :param values: all values of the sample location
+    :param is_train_value: values usable for training
+    :param min_number_of_train_values: outlier detection is skipped for windows with less training values
+    :return: number of training values and outlier mask for each position
+    """
+    train_values = np.where(is_train_value, values, np.NAN)
+    num_train_values = np.zeros(positions.shape[0], dtype=int)
+    is_outlier = np.zeros(positions.shape[0], dtype=bool)
+    to_evaluate = np.ones(positions.shape[0], dtype=bool)
+    position_indices = np.arange(positions.shape[0])
+    next_position_idx = 0
+    while True:
+        if to_evaluate.any():
+            cumulative_train_values = np.concatenate([[0], np.cumsum(~np.isnan(train_values))])
+            num_train_values[to_evaluate] = cumulative_train_values[window_ends[to_evaluate]] - \
+                cumulative_train_values[window_starts[to_evaluate]]
+            to_detect = to_evaluate & (num_train_values >= min_number_of_train_values)
+            is_outlier[to_evaluate] = False
+            is_outlier[to_detect] = detect_outliers_in_windows(outlier_statistics, train_values, window_starts[to_detect],
+                                                               window_ends[to_detect], values[positions[to_detect]])
+        # remove the next outlier from the training values of the following windows
+        outliers = np.flatnonzero(is_outlier[next_position_idx:])
+        if outliers.shape[0] == 0:
+            break
+        outlier_idx = next_position_idx + outliers[0]
+        outlier_position = positions[outlier_idx]
+        next_position_idx = outlier_idx + 1
+        to_evaluate = np.zeros(positions.shape[0], dtype=bool)
+        if not np.isnan(train_values[outlier_position]):
+            train_values[outlier_position] = np.NAN
+            to_evaluate = (position_indices > outlier_idx) & (window_starts <= outlier_position) & (outlier_position < window_ends)
+    return num_train_values, is_outlier
+
+
 def get_last_values(measurements_df: pd.DataFrame, index, column_name,
                               sewage_flag: SewageFlag = None, additional_sewage_flag: SewageFlag = None):
     """
@@ -235,6 +748,38 @@ def get_last_N_month_and_days(measurements_df: pd.DataFrame, current_measurement
     return last_values
 
 
+def order_by_first_occurrence(event_masks: List[np.ndarray]) -> List[int]:
+    """
+    Sorts row masks of events by the first row they occur in. Events of the same row keep the given order.
+    Used to add counters of whole columns to the statistics in the same order as a row-wise processing would do.
+
+    :param event_masks: boolean arrays, one per event type
+    :return: indices of all event masks with at least one occurrence
+    """
+    first_occurrences = [(np.argmax(mask), event_idx) for event_idx, mask in enumerate(event_masks) if mask.any()]
+    return [event_idx for _, event_idx in sorted(first_occurrences)]
+
+
+def get_last_N_month_and_days_positions(arrays, index, column_name, num_month, num_days,
+                                        sewage_flag: SewageFlag = None, additional_sewage_flag: SewageFlag = None) -> np.ndarray:
+    """
+    Array version of 'get_last_N_month_and_days' used by the vectorized engine.
+    The time frame is looked up in the date window index, thus only the measurements within the time frame are filtered.
+
+    :param arrays: MeasurementArrays of the sample location
+    :param index: position of the current measurement
+    :return: positions of the values from the last N month and days in ascending order
+    """
+    start, end = arrays.date_window_index.get_window(index, num_month, num_days)
+    last_values = ~np.isnan(arrays.get_value(column_name)[start:end])
+    flags = arrays.flag[start:end]
+    if sewage_flag:
+        last_values &= (flags & sewage_flag.value) == 0
+    if additional_sewage_flag:
+        last_values &= (flags & additional_sewage_flag.value) == 0
+    return start + np.flatnonzero(last_values)
+
+
 def add_default_biomarker_statistic(stat_dict: dict, biomarker1, biomarker2) -> None:
     stat_dict.setdefault(biomarker1 + "/" + biomarker2, dict())
     stat_dict[biomarker1 + "/" + biomarker2].setdefault("passed", 0)
@@ -281,11 +826,34 @@ class CustomFormatter(logging.Formatter):
         return formatter.format(record)
 
 
+class SewageLogCollector(logging.Handler):
+    """
+    Keeps all log records in memory instead of emitting them.
+    Used in worker processes; the records are emitted later by the main process in a deterministic order.
+    """
+
+    def __init__(self):
+        super().__init__(level=logging.DEBUG)
+        self.records = []
+
+    def emit(self, record):
+        # format the message in the worker, so that the record can be sent to the main process
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        self.records.append(record)
+
+    def pop_records(self) -> []:
+        records, self.records = self.records, []
+        return records
+
+
 class SewageLogger:
     _instance = None
     log = None
     verbosity = None
     quiet = None
+    collector = None
 
     def __init__(self, output_folder, verbosity=None, quiet=False):
         self.output_folder = os.path.join(output_folder, "logs")
@@ -294,8 +862,7 @@ class SewageLogger:
         self.__initalize()
 
     def __initalize(self):
-        if not os.path.exists(self.output_folder):
-            os.makedirs(self.output_folder)
+        os.makedirs(self.output_folder, exist_ok=True)
         if not self.log:
             self.log = self.__setup_logger()
 
@@ -328,5 +895,25 @@ class SewageLogger:
         logger.addHandler(file_handler)
         return logger
 
+    def collect_records(self):
+        """
+        Replaces all handlers by a collector. The collected records are obtained with 'pop_collected_records'.
+        """
+        for handler in list(self.log.handlers):
+            self.log.removeHandler(handler)
+        self.collector = SewageLogCollector()
+        self.log.addHandler(self.collector)
+        self.log.setLevel(logging.DEBUG)
+
+    def pop_collected_records(self) -> []:
+        if self.collector:
+            return self.collector.pop_records()
+        return []
+
+    def emit_records(self, records: []):
+        for record in records:
+            self.log.handle(record)
+
     def get_progress_bar(self, total, text):
-        return tqdm.tqdm(total=total, unit=' samples', colour="blue", ncols=100, desc=text, file=sys.stdout)
+        return tqdm.tqdm(total=total, unit=' samples', colour="blue", ncols=100, desc=text, file=sys.stdout,
+                         disable=self.collector is not None)
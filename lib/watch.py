@@ -0,0 +1,58 @@
+# Watches the input folder of the serve mode for new or changed input files
+import os
+from typing import List
+
+# input files read by 'read_input_files'; csv files are read as one file per sample location
+input_file_extensions = [".xlsx", ".csv", ".parquet", ".feather", ".arrow"]
+
+
+class InputFolderWatcher:
+    """
+    Polls a folder for new or changed input files. A file is reported once its size and modification time
+    did not change between two scans, thus files which are still being written or copied are not read. A file is
+    reported again at each scan until it is marked as processed by 'mark_processed'. Hidden files, temporary files and
+    the lock files of excel are ignored.
+    """
+
+    def __init__(self, input_folder):
+        self.input_folder = input_folder
+        self.processed_signatures = dict()
+        self.pending_signatures = dict()
+        self.reported_signatures = dict()
+
+    @staticmethod
+    def is_input_file(file_name: str) -> bool:
+        if file_name.startswith(".") or file_name.startswith("~$"):
+            return False
+        return os.path.splitext(file_name)[1].lower() in input_file_extensions
+
+    def __scan(self) -> dict:
+        signatures = dict()
+        with os.scandir(self.input_folder) as entries:
+            for entry in entries:
+                if entry.is_file() and self.is_input_file(entry.name):
+                    stat = entry.stat()
+                    signatures[entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return signatures
+
+    def get_changed_files(self) -> List[str]:
+        """ Returns the files which were added or changed since they were marked as processed and are complete """
+        signatures = self.__scan()
+        changed_files = []
+        self.reported_signatures = dict()
+        for input_file, signature in signatures.items():
+            if self.processed_signatures.get(input_file) == signature:
+                continue
+            if self.pending_signatures.get(input_file) == signature:
+                changed_files.append(input_file)
+                self.reported_signatures[input_file] = signature
+        self.pending_signatures = {input_file: signature for input_file, signature in signatures.items()
+                                   if self.processed_signatures.get(input_file) != signature}
+        for input_file in [f for f in self.processed_signatures if f not in signatures]:
+            del self.processed_signatures[input_file]
+        return sorted(changed_files)
+
+    def mark_processed(self, input_file):
+        """ Marks a file returned by the last scan as processed, thus it is returned again once it changed """
+        if input_file in self.reported_signatures:
+            self.processed_signatures[input_file] = self.reported_signatures[input_file]
@@ -4,7 +4,7 @@ from .constant import *
 import math
 from .utils import *
 from .statistics import *
-from .plotting import *
+from .measurement_arrays import MeasurementArrays
 
 
 class WaterQuality:
@@ -60,3 +60,30 @@ class WaterQuality:
         else:
             self.sewageStat.add_water_quality_outlier("Conductivity", 'skipped')
 
+    def process_location(self, sample_location, arrays: MeasurementArrays):
+        """
+        Vectorized water quality control of all measurements of a sample location that need processing.
+        """
+        water_quality_parameters = [(Columns.AMMONIUM.value, "Ammonium", SewageFlag.AMMONIUM_OUTLIER, SewageFlag.NOT_ENOUGH_AMMONIUM_VALUES),
+                                    (Columns.CONDUCTIVITY.value, "Conductivity", SewageFlag.CONDUCTIVITY_OUTLIER, SewageFlag.NOT_ENOUGH_CONDUCTIVITY_VALUES)]
+        rows_to_process = arrays.get_rows_to_process()
+        window_starts, window_ends = arrays.date_window_index.get_windows(rows_to_process, self.water_quality_number_of_last_month, 0)
+        for column, qual_type, outlier_flag, not_enough_values_flag in water_quality_parameters:
+            values = arrays.get_value(column)
+            current_values = values[rows_to_process]
+            is_value_present = (current_values != 0) & ~np.isnan(current_values)  # only if current value is not empty
+            is_train_value = ~np.isnan(values) & ((arrays.flag & outlier_flag.value) == 0)
+            num_last_values, is_outlier = detect_outliers_in_trailing_windows(self.water_qc_outlier_statistics, values, is_train_value,
+                                                                              rows_to_process[is_value_present], window_starts[is_value_present],
+                                                                              window_ends[is_value_present], self.min_number_of_last_measurements_for_water_qc)
+            for index, is_present, value_idx in zip(rows_to_process, is_value_present, np.cumsum(is_value_present) - 1):
+                if not is_present:
+                    self.sewageStat.add_water_quality_outlier(qual_type, 'skipped')
+                elif num_last_values[value_idx] < self.min_number_of_last_measurements_for_water_qc:
+                    self.sewageStat.add_water_quality_outlier(qual_type, 'skipped')
+                    arrays.flag[index] |= not_enough_values_flag.value
+                elif is_outlier[value_idx]:
+                    arrays.flag[index] |= outlier_flag.value
+                    self.sewageStat.add_water_quality_outlier(qual_type, 'failed')
+                else:
+                    self.sewageStat.add_water_quality_outlier(qual_type, 'passed')
@@ -3,7 +3,7 @@ from setuptools import setup
 setup(
     name='sewageQualityControl',
     version='0.1',
-    packages=['lib', 'test'],
+    packages=['lib', 'test', 'benchmark'],
     url='https://github.com/axgraf/sewageQualityControl',
     license='',
     author='Alexander Graf',
@@ -22,8 +22,7 @@ setup(
         'tqdm == 4.65.0',
         'openpyxl == 3.0.10',
         'adjustText == 0.7.3',
-        'requests == 2.25.1',
-        'jwt'
+        'requests == 2.25.1'
     ]
     #include_package_data=True,
     #package_data={'': ['data/*.dat']},
@@ -1,15 +1,23 @@
 #!/usr/bin/env python3
 
 import os
+import copy
 import itertools
 import argparse
 import pickle
+import collections
+import concurrent.futures
+import datetime
+import json
+import time
+import signal
+import hashlib
+import threading
 
 import numpy as np
 import pandas as pd
 
 
-from matplotlib.backends.backend_pdf import PdfPages
 from lib.config import Config
 from lib.constant import *
 from lib.biomarkerQC import BiomarkerQC
@@ -17,10 +25,13 @@ from lib.surrogatevirusQC import SurrogateVirusQC
 from lib.water_quality import WaterQuality
 from lib.sewage_flow import SewageFlow
 from lib.normalization import SewageNormalization
+from lib.measurement_arrays import MeasurementArrays
 import lib.utils as utils
 import lib.statistics as sewageStat
-import lib.plotting as plotting
+from lib.plot_labels import LabelPlacement
 import lib.database as db
+import lib.compact_dtypes as compact_dtypes
+from lib.watch import InputFolderWatcher
 import re
 
 
@@ -33,8 +44,10 @@ class SewageQuality:
                  water_quality_number_of_last_month, min_number_of_last_measurements_for_water_qc, water_qc_outlier_statistics,
                  fraction_last_samples_for_dry_flow, min_num_samples_for_mean_dry_flow, heavy_precipitation_factor,
                  mean_sewage_flow_below_typo_factor, mean_sewage_flow_above_typo_factor, min_number_of_biomarkers_for_normalization,
-                 base_reproduction_value_factor, num_previous_days_reproduction_factor, max_number_of_flags_for_outlier
-                  ):
+                 base_reproduction_value_factor, num_previous_days_reproduction_factor, max_number_of_flags_for_outlier,
+                 engine="legacy", workers=1, model_cache_size=1024, persist_model_cache=False, locations=None, excel_cache=True, plot_workers=1,
+                 plot_labels="all", plot_label_iterations=500, plots=True, compact_dtypes=False,
+                 incremental_import=False):
 
         self.input_file = input_file
         self.config_file = config_file
@@ -43,6 +56,18 @@ class SewageQuality:
         self.verbosity = verbosity
         self.quiet = quiet
         self.rerun_all = rerun_all
+        self.engine = engine
+        self.workers = workers
+        self.model_cache_size = model_cache_size
+        self.persist_model_cache = persist_model_cache
+        self.locations = locations
+        self.excel_cache = excel_cache
+        self.plot_workers = plot_workers
+        self.plot_labels = plot_labels
+        self.plot_label_iterations = plot_label_iterations
+        self.plots = plots
+        self.compact_dtypes = compact_dtypes
+        self.incremental_import = incremental_import
         # biomarker qc
         self.biomarker_outlier_statistics = biomarker_outlier_statistics
         self.min_biomarker_threshold = min_biomarker_threshold
@@ -69,33 +94,40 @@ class SewageQuality:
         self.num_previous_days_reproduction_factor = num_previous_days_reproduction_factor
         self.max_number_of_flags_for_outlier = max_number_of_flags_for_outlier
         self.sewageStat = sewageStat.SewageStat()
+        self.location_statistics = dict()
+        self.read_input_seconds = dict()
+        # fingerprints of the input measurements of each sample location processed in the serve mode
+        self.input_fingerprints = dict()
         self.logger = utils.SewageLogger(self.output_folder, verbosity=verbosity, quiet=quiet)
+        self.database = db.SewageDatabase()
+        self.database.compact_dtypes = compact_dtypes
         self.__load_data()
         self.__initialize()
 
     def __load_data(self):
         if self.input_file:
-            self.sewage_samples_dict = utils.read_excel_input_files(self.input_file)
+            conversion_cache = utils.ExcelConversionCache(os.path.join(self.database.output_folder, ".excel_cache")) \
+                if self.excel_cache else None
+            self.sewage_samples = utils.read_input_files(self.input_file, self.locations, conversion_cache)
         elif self.config_file:
-            # Todo: switch to real data import
+            # requests and asyncio are only imported for the Bay-VOC import
+            from lib.bayvoc import BayVOC
             config = Config(self.config_file)
+            bayvoc = BayVOC(config)
+            self.sewage_samples = bayvoc.read_sewage_samples(self.locations, self.database if self.incremental_import else None)
 #            arcgis = Arcgis(config)
-#            sewage_samples_dict = arcgis.obtain_sewage_samples()
-#            self.sewage_samples_dict = dict()
-#            for loc, samples_list in sewage_samples_dict.items():
-#                if 'A-STADT' in loc:
-#                    self.sewage_samples_dict[loc] = pd.DataFrame(s.__dict__ for s in samples_list)
-#           # bayvoc = bayVocConn.BayVOC(config)
-#           # self.sewage_samples_dict = bayvoc.read_all_sewagesamples_from_db()
-#        # arcgis = Arcgis(Config(self.config))
-#        # self.sewage_samples = arcgis.obtain_sewage_samples()
+#            self.sewage_samples = [(loc, m) for loc, m in arcgis.obtain_sewage_samples().items()
+#                                   if utils.is_sample_location_selected(loc, self.locations)]
 
         self.sewage_plants2trockenwetterabfluss = dict()
 
     def __initialize(self):
         if not os.path.exists(self.output_folder):
             os.makedirs(self.output_folder)
-        self.database = db.SewageDatabase()
+        utils.fitted_model_cache.max_size = self.model_cache_size
+        if self.persist_model_cache:
+            utils.fitted_model_cache.load(self.__get_model_cache_file())
+        self.label_placement = LabelPlacement(self.plot_labels, self.plot_label_iterations)
         self.biomarkerQC = BiomarkerQC(self.output_folder, self.sewageStat, self.biomarker_outlier_statistics, self.min_biomarker_threshold,
                                   self.min_number_biomarkers_for_outlier_detection,
                                   self.max_number_biomarkers_for_outlier_detection,
@@ -113,6 +145,9 @@ class SewageQuality:
 
 
 
+    def __get_model_cache_file(self):
+        return os.path.join(self.database.output_folder, ".fitted_models.pkl")
+
     def __initalize_columns(self, measurements: pd.DataFrame):
         for biomarker in Columns.get_biomarker_columns():
             measurements[CalculatedColumns.get_biomarker_flag(biomarker)] = 0
@@ -131,8 +166,7 @@ class SewageQuality:
 
     def save_dataframe(self, sample_location, measurements: pd.DataFrame):
         result_folder = os.path.join(self.output_folder, "results")
-        if not os.path.exists(result_folder):
-            os.makedirs(result_folder)
+        os.makedirs(result_folder, exist_ok=True)
         output_file = os.path.join(result_folder, "normalized_sewage_{}.xlsx".format(sample_location))
         measurements.to_excel(output_file, index=False)
 
@@ -175,49 +209,84 @@ class SewageQuality:
         # Sort by collection date. Newest last.
         measurements.sort_values(by=Columns.DATE.value, ascending=True, inplace=True, ignore_index=True)
         self.__initalize_columns(measurements)
-        self.database.needs_recalcuation(sample_location, measurements, self.rerun_all)
+        if self.compact_dtypes:
+            compact_dtypes.compact_measurements(measurements)
+        num_dependent_measurements = self.database.needs_recalcuation(sample_location, measurements, self.rerun_all,
+                                                                      recalculate_dependent_measurements=True)
+        if num_dependent_measurements > 0:
+            self.logger.log.info("{} measurements depend on changed measurements and are analyzed again".format(num_dependent_measurements))
         return plausibility_dict, measurements
 
+    def prepare_measurements(self, sample_location, measurements: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the measurements of a sample location prepared for the quality control steps: dates parsed,
+        sorted by date, calculated columns initialized and biomarker values standardized.
+        """
+        _, measurements = self.__setup(sample_location, measurements)
+        self.biomarkerQC.standardize_biomarker_values(sample_location, measurements)
+        return measurements
+
     def __is_plot_not_generated(self, sample_location):
         return not os.path.exists(os.path.join(self.output_folder, "plots", "{}.plots.pdf".format(sample_location)))
 
-    def __plot_results(self, measurements: pd.DataFrame, sample_location):
-        if not os.path.exists(os.path.join(self.output_folder, "plots")):
-            os.makedirs(os.path.join(self.output_folder, "plots"))
-        pdf_pages = PdfPages(os.path.join(self.output_folder, "plots", "{}.plots.pdf".format(sample_location)))
-        plotting.plot_biomarker_outlier_summary(pdf_pages, measurements, sample_location, self.biomarker_outlier_statistics)
-        plotting.plot_surrogatvirus(pdf_pages, measurements, sample_location, self.surrogatevirus_outlier_statistics)
-        plotting.plot_sewage_flow(pdf_pages, measurements, sample_location)
-        plotting.plot_water_quality(pdf_pages, measurements, sample_location, self.water_qc_outlier_statistics)
-        plotting.plot_biomarker_normalization(pdf_pages, measurements, sample_location)
-        plotting.plot_general_outliers(pdf_pages, measurements, sample_location)
-        pdf_pages.close()
+    def __get_plot_pages(self):
+        import lib.plotting as plotting
+        return [(plotting.plot_biomarker_outlier_summary, (self.biomarker_outlier_statistics,)),
+                (plotting.plot_surrogatvirus, (self.surrogatevirus_outlier_statistics,)),
+                (plotting.plot_sewage_flow, ()),
+                (plotting.plot_water_quality, (self.water_qc_outlier_statistics,)),
+                (plotting.plot_biomarker_normalization, ()),
+                (plotting.plot_general_outliers, ())]
 
-    def run_quality_control(self):
+    def __plot_results(self, measurements: pd.DataFrame, sample_location):
         """
-        Main method to run the quality checks and normalization
+        Writes the plot pages of the sample location to a pdf file. Pages whose plotted data did not change are
+        reused from the page cache next to the pdf file and the pdf file is kept if no page changed.
         """
-        for idx, (sample_location, measurements) in enumerate(self.sewage_samples_dict.items()):
-            self.logger.log.info("\n####################################################\n"
-                                 "\tSewage location: {} "
-                                 "\n####################################################".format(sample_location))
-            if not "Augsburg_Stadt" in sample_location:
-                continue
-            plausibility_dict, measurements = self.__setup(sample_location, measurements)
-            ### Plausibilitätscheck: dict with the index of the odd values
-            if len(plausibility_dict) > 0:
-                self.logger.log.info("Check date filed:{}".format(plausibility_dict))
-            self.logger.log.info("{}/{} new measurements to analyze".format(CalculatedColumns.get_num_of_unprocessed(measurements),
-                                                                            measurements.shape[0]))
-            progress_bar = self.logger.get_progress_bar(CalculatedColumns.get_num_of_unprocessed(measurements), "Analyzing samples")
-            self.sewageStat.set_sample_location_and_total_number(sample_location, CalculatedColumns.get_num_of_unprocessed(measurements))
-            changes_detected = False
-            self.biomarkerQC.standardize_biomarker_values(sample_location, measurements)
-            for index, current_measurement in measurements.iterrows():
-                if CalculatedColumns.needs_processing(current_measurement):
-                    changes_detected = True
-                    progress_bar.update(1)
-                    # -----------------  BIOMARKER QC -----------------------
+        # matplotlib and seaborn are only imported if plots are generated
+        import lib.plotting as plotting
+        from matplotlib.backends.backend_pdf import PdfPages
+        plotting.label_placement = self.label_placement
+        plot_folder = os.path.join(self.output_folder, "plots")
+        os.makedirs(plot_folder, exist_ok=True)
+        pdf_file = os.path.join(plot_folder, "{}.plots.pdf".format(sample_location))
+        page_cache = plotting.PlotPageCache(os.path.join(plot_folder, ".{}.plots".format(sample_location)))
+        plot_pages = self.__get_plot_pages()
+        fingerprints = [page_cache.get_fingerprint(plot_function, measurements, sample_location, args)
+                        for plot_function, args in plot_pages]
+        if os.path.exists(pdf_file) and page_cache.is_pdf_unchanged(fingerprints):
+            self.logger.log.info("Plotted data unchanged. Skipping plots...")
+            return
+        page_figures = [page_cache.load(fingerprint) for fingerprint in fingerprints]
+        changed_pages = [page for page, figures in enumerate(page_figures) if figures is None]
+        if self.plot_workers > 1 and len(changed_pages) > 1:
+            # the figures are created in parallel and written to the pdf file in the order of the pages
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.plot_workers,
+                                                        initializer=plotting.initialize_plot_worker,
+                                                        initargs=(plotting.label_placement,)) as executor:
+                futures = {page: executor.submit(plotting.render_plot_page, plot_pages[page][0], measurements, sample_location,
+                                                 *plot_pages[page][1]) for page in changed_pages}
+                for page, future in futures.items():
+                    page_figures[page] = future.result()
+        else:
+            for page in changed_pages:
+                page_figures[page] = plotting.render_plot_page(plot_pages[page][0], measurements, sample_location, *plot_pages[page][1])
+        for page in changed_pages:
+            page_cache.save(fingerprints[page], page_figures[page])
+        pdf_pages = PdfPages(pdf_file)
+        for figures in page_figures:
+            plotting.save_pickled_figures(pdf_pages, figures)
+        pdf_pages.close()
+        page_cache.save_manifest(fingerprints)
+
+    def __run_row_wise_quality_control(self, sample_location, measurements: pd.DataFrame, progress_bar, timer: utils.StageTimer) -> bool:
+        changes_detected = False
+        for index, current_measurement in measurements.iterrows():
+            if CalculatedColumns.needs_processing(current_measurement):
+                changes_detected = True
+                progress_bar.update(1)
+                # -----------------  BIOMARKER QC -----------------------
+                with timer.measure("biomarker_qc"):
                     # 1. check for comments. Flag samples that contain any commentary.
                     self.biomarkerQC.check_comments(sample_location, measurements, index)
                     self.biomarkerQC.check_mean_sewage_flow_present(sample_location, measurements, index)
@@ -233,43 +302,329 @@ class SewageQuality:
                     # 6. Create report in case the last two biomarkers were identified as outliers
                     # self.biomarkerQC.report_last_biomarkers_invalid(sample_location, measurements)
 
-                    # --------------------  SUROGATVIRUS QC -------------------
+                # --------------------  SUROGATVIRUS QC -------------------
+                with timer.measure("surrogatevirus_qc"):
                     self.surrogateQC.filter_dry_days_time_frame(sample_location, measurements, index)
                     self.surrogateQC.is_surrogatevirus_outlier(sample_location, measurements, index)
 
-                    # --------------------  SEWAGE FLOW -------------------
+                # --------------------  SEWAGE FLOW -------------------
+                with timer.measure("sewage_flow"):
                     self.sewage_flow.sewage_flow_quality_control(sample_location, measurements, index)
 
-                    # --------------------  WATER QUALITY -------------------
+                # --------------------  WATER QUALITY -------------------
+                with timer.measure("water_quality"):
                     self.water_quality.check_water_quality(sample_location, measurements, index)
 
-                    # --------------------  NORMALIZATION -------------------
+                # --------------------  NORMALIZATION -------------------
+                with timer.measure("normalization"):
                     self.sewageNormalization.normalize_biomarker_values(sample_location, measurements, index)
 
                     # --------------------  MARK OUTLIERS FROM ALL STEPS -------------------
                     self.sewageNormalization.decide_biomarker_usable_based_on_flags(sample_location, measurements, index)
-            progress_bar.close()
+        return changes_detected
+
+    def __run_vectorized_quality_control(self, sample_location, measurements: pd.DataFrame, progress_bar, timer: utils.StageTimer) -> bool:
+        """
+        Runs each quality control step column-wise over all measurements of the sample location.
+        The flags are identical to the row-wise processing.
+        """
+        with timer.measure("measurement_arrays"):
+            arrays = MeasurementArrays(measurements)
+        num_rows_to_process = len(arrays.get_rows_to_process())
+        if num_rows_to_process == 0:
+            return False
+        # -----------------  BIOMARKER QC -----------------------
+        with timer.measure("biomarker_qc"):
+            self.biomarkerQC.process_location(sample_location, arrays)
+        # --------------------  SUROGATVIRUS QC -------------------
+        with timer.measure("surrogatevirus_qc"):
+            self.surrogateQC.process_location(sample_location, arrays)
+        # --------------------  SEWAGE FLOW -------------------
+        with timer.measure("sewage_flow"):
+            self.sewage_flow.process_location(sample_location, arrays)
+        # --------------------  WATER QUALITY -------------------
+        with timer.measure("water_quality"):
+            self.water_quality.process_location(sample_location, arrays)
+        # --------------------  NORMALIZATION AND OUTLIERS FROM ALL STEPS -------------------
+        with timer.measure("normalization"):
+            self.sewageNormalization.process_location(sample_location, arrays)
+        with timer.measure("measurement_arrays"):
+            arrays.write_back(measurements)
+        progress_bar.update(num_rows_to_process)
+        return True
+
+    def run_quality_control_for_location(self, sample_location, measurements: pd.DataFrame):
+        """
+        Runs the quality checks and normalization for a single sample location.
+        Returns the statistics of the sample location, including the time spent in each step.
+        """
+        self.logger.log.info("\n####################################################\n"
+                             "\tSewage location: {} "
+                             "\n####################################################".format(sample_location))
+        timer = utils.StageTimer()
+        utils.detector_timer.reset()
+        with timer.measure("setup"):
+            plausibility_dict, measurements = self.__setup(sample_location, measurements)
+        memory_usage = compact_dtypes.get_memory_usage(measurements)
+        self.logger.log.info("Measurements use {:.2f} MB ({} layout)".format(memory_usage / 2 ** 20,
+                                                                             "compact" if self.compact_dtypes else "default"))
+        ### Plausibilitätscheck: dict with the index of the odd values
+        if len(plausibility_dict) > 0:
+            self.logger.log.info("Check date filed:{}".format(plausibility_dict))
+        self.logger.log.info("{}/{} new measurements to analyze".format(CalculatedColumns.get_num_of_unprocessed(measurements),
+                                                                        measurements.shape[0]))
+        progress_bar = self.logger.get_progress_bar(CalculatedColumns.get_num_of_unprocessed(measurements), "Analyzing samples")
+        self.sewageStat.set_sample_location_and_total_number(sample_location, CalculatedColumns.get_num_of_unprocessed(measurements))
+        with timer.measure("setup"):
+            self.biomarkerQC.standardize_biomarker_values(sample_location, measurements)
+        model_cache_hits, model_cache_misses = utils.fitted_model_cache.hits, utils.fitted_model_cache.misses
+        if self.engine == "vectorized":
+            changes_detected = self.__run_vectorized_quality_control(sample_location, measurements, progress_bar, timer)
+        else:
+            changes_detected = self.__run_row_wise_quality_control(sample_location, measurements, progress_bar, timer)
+        self.sewageStat.set_model_cache_statistics(utils.fitted_model_cache.hits - model_cache_hits,
+                                                   utils.fitted_model_cache.misses - model_cache_misses)
+        progress_bar.close()
+        if not progress_bar.disable:
             print("    ")
-            if changes_detected or self.__is_plot_not_generated(sample_location):
-                self.logger.log.info(self.sewageStat.print_statistics())
+        changes_detected = changes_detected or self.database.has_removed_measurements(sample_location)
+        if changes_detected or (self.plots and self.__is_plot_not_generated(sample_location)):
+            self.logger.log.info(self.sewageStat.print_statistics())
+            if self.plots:
                 self.logger.log.info("Generating plots...")
-                self.__plot_results(measurements, sample_location)
-                # Experimental: Final step explain flags
-                measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value])
-                self.logger.log.info("Add '{}' to database...".format(sample_location))
+                with timer.measure("plotting"):
+                    self.__plot_results(measurements, sample_location)
+            # Experimental: Final step explain flags
+            measurements['flags_explained'] = SewageFlag.explain_flag_series(measurements[CalculatedColumns.FLAG.value])
+            self.logger.log.info("Add '{}' to database...".format(sample_location))
+            with timer.measure("database"):
                 self.database.add_sewage_location2db(sample_location, measurements)
-                self.logger.log.info("Export '{}' to excel file...".format(sample_location))
+            self.logger.log.info("Export '{}' to excel file...".format(sample_location))
+            with timer.measure("excel_export"):
                 self.save_dataframe(sample_location, measurements)
+        self.sewageStat.set_timings(measurements.shape[0], timer.to_dict(), utils.detector_timer.to_dict())
+        self.sewageStat.set_memory_usage(memory_usage)
+        return copy.deepcopy(self.sewageStat)
 
+    def run_quality_control(self, skip_failed_locations=False):
+        """
+        Main method to run the quality checks and normalization.
+        With 'skip_failed_locations' the error of a sample location is logged and the other sample locations are processed,
+        the failed sample location has no statistics. Only used by a single process.
+        """
+        started = datetime.datetime.now()
+        start = time.perf_counter()
+        if self.workers > 1:
+            self.__run_quality_control_in_parallel()
+        else:
+            for sample_location, measurements in self.__read_sewage_samples():
+                try:
+                    self.location_statistics[sample_location] = self.run_quality_control_for_location(sample_location, measurements)
+                except Exception:
+                    if not skip_failed_locations:
+                        raise
+                    self.logger.log.exception("Quality control of '{}' failed".format(sample_location))
+        if self.persist_model_cache:
+            utils.fitted_model_cache.save(self.__get_model_cache_file())
+        self.__write_run_report(started, time.perf_counter() - start)
+
+    def __read_sewage_samples(self):
+        """ Iterates the sewage samples and measures the time to read the input of each sample location """
+        self.read_input_seconds = dict()
+        samples = iter(self.sewage_samples)
+        while True:
+            start = time.perf_counter()
+            try:
+                sample_location, measurements = next(samples)
+            except StopIteration:
+                return
+            self.read_input_seconds[sample_location] = time.perf_counter() - start
+            yield sample_location, measurements
+
+    def get_run_report(self, started: datetime.datetime, seconds: float) -> dict:
+        """
+        Returns the time spent in each step and outlier detection method, per sample location and in total.
+        """
+        stage_totals, detector_totals = utils.StageTimer(), utils.StageTimer()
+        locations = dict()
+        for sample_location, location_statistic in self.location_statistics.items():
+            timings = dict(location_statistic.timings)
+            if sample_location in self.read_input_seconds:
+                timings = {"read_input": {"seconds": self.read_input_seconds[sample_location], "calls": 1}, **timings}
+            stage_totals.add_timings(timings)
+            detector_totals.add_timings(location_statistic.detector_timings)
+            locations[sample_location] = {"measurements": location_statistic.num_measurements,
+                                          "processed_measurements": location_statistic.total_samples,
+                                          "seconds": sum(timing["seconds"] for timing in timings.values()),
+                                          "memory_bytes": location_statistic.memory_usage,
+                                          "stages": timings, "detectors": location_statistic.detector_timings}
+        return {"started": started.isoformat(timespec="seconds"), "seconds": seconds, "engine": self.engine,
+                "workers": self.workers, "plot_workers": self.plot_workers, "compact_dtypes": self.compact_dtypes, "stages": stage_totals.to_dict(),
+                "detectors": detector_totals.to_dict(), "locations": locations}
+
+    def __write_run_report(self, started: datetime.datetime, seconds: float):
+        run_report = self.get_run_report(started, seconds)
+        with open(os.path.join(self.logger.output_folder, "run_report.json"), "w") as f:
+            json.dump(run_report, f, indent=2)
+        summary = "Run time: {:.1f} s for {} sample locations\n".format(seconds, len(run_report["locations"]))
+        for key, title in [("stages", "Steps"), ("detectors", "Outlier detection")]:
+            timings = sorted(run_report[key].items(), key=lambda timing: timing[1]["seconds"], reverse=True)
+            if timings:
+                summary += "{}:\n".format(title)
+            for stage, timing in timings:
+                summary += "\t{}:\t{:.2f} s\n".format(stage, timing["seconds"])
+        slowest_locations = sorted(run_report["locations"].items(), key=lambda location: location[1]["seconds"], reverse=True)[:3]
+        if slowest_locations:
+            summary += "Slowest sample locations:\n"
+        for sample_location, location in slowest_locations:
+            summary += "\t{}:\t{:.2f} s\n".format(sample_location, location["seconds"])
+        self.logger.log.info(summary)
+
+    def __run_quality_control_in_parallel(self):
+        """
+        Sample locations are independent, thus each location is processed in a worker process.
+        Log records and statistics of the workers are collected and added in the order of the sample locations.
+        At most two locations per worker are read ahead, thus not all measurements are held in memory at once.
+        """
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self.workers, initializer=_initialize_worker,
+                                                    initargs=(self,)) as executor:
+            pending = collections.deque()
+            for sample_location, measurements in self.__read_sewage_samples():
+                pending.append((sample_location, executor.submit(_run_quality_control_for_location, sample_location, measurements)))
+                if len(pending) >= 2 * self.workers:
+                    self.__add_location_result(*pending.popleft())
+            while pending:
+                self.__add_location_result(*pending.popleft())
+
+    def __add_location_result(self, sample_location, future: concurrent.futures.Future):
+        log_records, location_statistic = future.result()
+        self.logger.emit_records(log_records)
+        self.location_statistics[sample_location] = location_statistic
+
+    def serve(self, watch_folder, poll_interval=2.0, max_polls=None):
+        """
+        Watches the folder for new or changed input files and runs the quality control for the sample locations of
+        these files. The stored measurements, the cache of the fitted models and the fingerprints of the input measurements
+        are kept in memory, thus sample locations whose input did not change are skipped and of the others only the new or
+        changed measurements are processed and written. The dry weather flow and the windows of the detectors are
+        calculated again for each processed sample location. Runs until SIGINT/SIGTERM or 'max_polls' scans of the folder.
+        """
+        if self.workers > 1:
+            self.logger.log.warning("Serve mode: sample locations are processed in a single process to keep their state in memory")
+            self.workers = 1
+        self.database.cache_measurements = True
+        conversion_cache = utils.ExcelConversionCache(os.path.join(self.database.output_folder, ".excel_cache")) \
+            if self.excel_cache else None
+        watcher = InputFolderWatcher(watch_folder)
+        stop_event = threading.Event()
+        previous_handlers = dict()
+        if threading.current_thread() is threading.main_thread():
+            for signal_number in [signal.SIGINT, signal.SIGTERM]:
+                previous_handlers[signal_number] = signal.signal(signal_number, lambda *_: stop_event.set())
+        self.logger.log.info("Watching '{}' for new or changed input files...".format(watch_folder))
+        num_polls = 0
+        try:
+            while not stop_event.is_set():
+                changed_files = watcher.get_changed_files()
+                num_polls += 1
+                if changed_files:
+                    self.location_statistics = dict()
+                    input_locations = dict()
+                    self.sewage_samples = self.__read_changed_sample_locations(changed_files, conversion_cache, input_locations)
+                    failed_files = set(changed_files)
+                    try:
+                        self.run_quality_control(skip_failed_locations=True)
+                        failed_files = set()
+                    except Exception:
+                        self.logger.log.exception("Quality control of '{}' failed".format("', '".join(changed_files)))
+                    # the results of these sample locations are written, thus their input is not processed again
+                    for sample_location, (input_file, fingerprint) in input_locations.items():
+                        if sample_location in self.location_statistics:
+                            self.input_fingerprints[sample_location] = fingerprint
+                        else:
+                            failed_files.add(input_file)
+                    # the input files of failed sample locations are read again at the next scan
+                    for input_file in changed_files:
+                        if input_file not in failed_files:
+                            watcher.mark_processed(input_file)
+                if max_polls is not None and num_polls >= max_polls:
+                    break
+                stop_event.wait(poll_interval)
+        finally:
+            for signal_number, handler in previous_handlers.items():
+                signal.signal(signal_number, handler)
+        self.logger.log.info("Stopped watching '{}'".format(watch_folder))
+
+    def __read_changed_sample_locations(self, changed_files, conversion_cache, input_locations: dict):
+        """
+        Yields the sample locations of the changed input files whose measurements changed. The csv files of the watched
+        folder are read as one file per sample location. The input file and the fingerprint of the measurements of each
+        yielded sample location are added to 'input_locations'.
+        """
+        for input_file in changed_files:
+            self.logger.log.info("Reading '{}'...".format(input_file))
+            try:
+                if input_file.lower().endswith(".csv"):
+                    sewage_samples = list(utils.read_csv_input_folder(os.path.dirname(input_file), [os.path.basename(input_file)],
+                                                                      self.locations))
+                else:
+                    sewage_samples = list(utils.read_input_files(input_file, self.locations, conversion_cache))
+            except Exception:
+                # e.g. a malformed file, it is read again once it changed
+                self.logger.log.exception("Can not read '{}'".format(input_file))
+                continue
+            for sample_location, measurements in sewage_samples:
+                fingerprint = hashlib.sha1(pd.util.hash_pandas_object(measurements, index=False).to_numpy().tobytes())
+                fingerprint.update(",".join(measurements.columns).encode('utf-8'))
+                if self.input_fingerprints.get(sample_location) == fingerprint.hexdigest():
+                    self.logger.log.info("Measurements of '{}' unchanged. Skipping...".format(sample_location))
+                    continue
+                input_locations[sample_location] = (input_file, fingerprint.hexdigest())
+                yield sample_location, measurements
 
+    def __getstate__(self):
+        # the input data is passed separately for each sample location to the worker processes
+        state = self.__dict__.copy()
+        state.pop('sewage_samples', None)
+        return state
 
-if __name__ == '__main__':
+
+_worker_sewage_quality = None
+
+
+def _initialize_worker(sewage_quality: SewageQuality):
+    global _worker_sewage_quality
+    _worker_sewage_quality = sewage_quality
+    _worker_sewage_quality.logger.collect_records()
+
+
+def _run_quality_control_for_location(sample_location, measurements: pd.DataFrame):
+    location_statistic = _worker_sewage_quality.run_quality_control_for_location(sample_location, measurements)
+    return _worker_sewage_quality.logger.pop_collected_records(), location_statistic
+
+
+def _plot_labels(labels: str) -> str:
+    try:
+        LabelPlacement.parse_labels(labels)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return labels
+
+
+def create_argument_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         description="Sewage qPCR quality control",
         usage='use "python3 ssqn.py --help" for more information',
         epilog="author: Dr. Alexander Graf (graf@genzentrum.lmu.de)", formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('command', metavar="COMMAND", nargs='?', default="run", choices=["run", "serve"],
+                        help=("run = run the quality control for the input file or Bay-VOC once (default)\n"
+                              "serve = watch the folder given by --watch and process new or changed input files as they arrive\n"))
     parser.add_argument('-i', '--input', metavar="FILE", type=str,
-                        help="Specifiy input excel file with biomarker values",
+                        help=("Specifiy input file with biomarker values.\n"
+                              "\texcel file (.xlsx) with one sheet per sample location\n"
+                              "\tparquet file or dataset folder (.parquet), feather file (.feather, .arrow) or csv file (.csv)\n"
+                              "\t\twith a 'location' column or hive partitions 'location=<name>'\n"
+                              "\tfolder of csv files with one file per sample location ('<location>.csv')\n"),
                         required=False)
     parser.add_argument('-c', '--config', metavar="FILE", type=str,
                         help="Config file for DB connections",
@@ -277,9 +632,58 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--output_folder', metavar="FOLDER", default="sewage_qc", type=str,
                         help="Specifiy output folder. (default folder: 'sewage_qc')",
                         required=False)
+    parser.add_argument('-l', '--locations', metavar="LOCATION", default=None, nargs='+', type=str,
+                        help="Process only the sample locations (excel sheets) whose name contains one of the given values. (default: all sample locations)\n"
+                             "E.g. to select all locations of Augsburg use: --locations Augsburg_Stadt",
+                        required=False)
+    parser.add_argument('--no_excel_cache', action="store_true",
+                        help="Parse all sheets of the excel input file, instead of reusing the sheets cached in the database folder.")
     parser.add_argument('-r', '--rerun_all', action="store_true", help="Rerun the analysis on all samples.")
+    parser.add_argument('--compact_db', action="store_true",
+                        help="Compact the database: merge the appended files of each sample location and year and remove outdated measurements.")
     parser.add_argument('-v', '--verbosity', action="count", help="Increase output verbosity.")
     parser.add_argument('-q', '--quiet', action='store_true', help="Print litte output.")
+    parser.add_argument('--engine', metavar="ENGINE", default="legacy", choices=["legacy", "vectorized"], type=str,
+                        help=("Quality control engine. (default: 'legacy')\n"
+                              "\tlegacy = process the measurements row by row\n"
+                              "\tvectorized = process each quality control step column-wise for all measurements of a location\n"),
+                        required=False)
+    parser.add_argument('--workers', metavar="INT", default=1, type=int,
+                        help="Number of worker processes. Sample locations are processed in parallel. (default: 1)",
+                        required=False)
+    parser.add_argument('--incremental_import', '--incremental-import', action="store_true",
+                        help=("Request only the samples collected after the last stored collection date from Bay-VOC (-c).\n"
+                              "The new samples are appended to the stored measurements of each sample location."))
+    parser.add_argument('--compact_dtypes', '--compact-dtypes', action="store_true",
+                        help=("Hold and store the measurements in a compact layout: float32 values, uint32 flags and categorical\n"
+                              "dry day and comment columns. Measurements stored in the default layout are processed again."))
+    parser.add_argument('--watch', metavar="FOLDER", type=str,
+                        help=("Folder watched in the serve mode for new or changed input files: excel, parquet, feather or csv\n"
+                              "files (csv files with one file per sample location). Sample locations whose measurements did not\n"
+                              "change are skipped."),
+                        required=False)
+    parser.add_argument('--poll_interval', '--poll-interval', metavar="SECONDS", default=2.0, type=float,
+                        help="Seconds between the scans of the watched folder. (default: 2.0)",
+                        required=False)
+    parser.add_argument('--no_plots', '--no-plots', action="store_true",
+                        help="Do not generate the pdf plots. matplotlib and seaborn are not loaded.")
+    parser.add_argument('--plot_workers', '--plot-workers', metavar="INT", default=1, type=int,
+                        help="Number of worker processes creating the pages of the pdf plots of a sample location. (default: 1)",
+                        required=False)
+    parser.add_argument('--plot_labels', '--plot-labels', metavar="LABELS", default="all", type=_plot_labels,
+                        help=("Outlier date labels in the plots. (default: 'all')\n"
+                              "\tnone = no labels\n"
+                              "\ttop-N = only the N most extreme outliers of each panel, e.g. top-10\n"
+                              "\tall = all outliers\n"),
+                        required=False)
+    parser.add_argument('--plot_label_iterations', metavar="INT", default=500, type=int,
+                        help="Maximal number of iterations to place the labels of a plot panel without overlaps. (default: 500)",
+                        required=False)
+    parser.add_argument('--model_cache_size', metavar="INT", default=1024, type=int,
+                        help="Maximum number of fitted lof/svm/rf models kept in memory for identical training values. 0 disables the cache. (default: 1024)",
+                        required=False)
+    parser.add_argument('--persist_model_cache', action="store_true",
+                        help="Save the fitted models to the database folder and reuse them in the next run.")
 
     biomarker_qc_group = parser.add_argument_group("Biomarker quality control")
     biomarker_qc_group.add_argument('--biomarker_outlier_statistics', metavar="METHOD", default=['iqr', 'lof'], nargs='+',
@@ -390,21 +794,36 @@ if __name__ == '__main__':
     normalization_group.add_argument('--min_number_of_biomarkers_for_normalization', metavar="INT", default=2, type=int,
                                      help="Minimal number of biomarkers used for normalization. (default: 2)",
                                      required=False)
+    return parser
+
+
+def create_sewage_quality(args: argparse.Namespace) -> SewageQuality:
+    return SewageQuality(args.input, args.config, args.output_folder, args.verbosity, args.quiet, args.rerun_all,
+                         args.biomarker_outlier_statistics, args.biomarker_min_threshold,
+                         args.min_number_biomarkers_for_outlier_detection,
+                         args.max_number_biomarkers_for_outlier_detection,
+                         args.report_number_of_biomarker_outliers, args.periode_month_surrogatevirus,
+                         args.surrogatevirus_outlier_statistics, args.min_number_surrogatevirus_for_outlier_detection,
+                         args.water_quality_number_of_last_month,
+                         args.min_number_of_last_measurements_for_water_qc, args.water_qc_outlier_statistics,
+                         args.fraction_last_samples_for_dry_flow, args.min_num_samples_for_mean_dry_flow,
+                         args.heavy_precipitation_factor, args.mean_sewage_flow_below_typo_factor,
+                         args.mean_sewage_flow_above_typo_factor, args.min_number_of_biomarkers_for_normalization,
+                         args.base_reproduction_value_factor, args.num_previous_days_reproduction_factor, args.max_number_of_flags_for_outlier,
+                         args.engine, args.workers, args.model_cache_size, args.persist_model_cache, args.locations,
+                         not args.no_excel_cache, args.plot_workers, args.plot_labels, args.plot_label_iterations,
+                         not args.no_plots, args.compact_dtypes, args.incremental_import)
 
 
+if __name__ == '__main__':
+    parser = create_argument_parser()
     args = parser.parse_args()
-    sewageQuality = SewageQuality(args.input, args.config, args.output_folder, args.verbosity, args.quiet, args.rerun_all,
-                                  args.biomarker_outlier_statistics, args.biomarker_min_threshold,
-                                  args.min_number_biomarkers_for_outlier_detection,
-                                  args.max_number_biomarkers_for_outlier_detection,
-                                  args.report_number_of_biomarker_outliers, args.periode_month_surrogatevirus,
-                                  args.surrogatevirus_outlier_statistics, args.min_number_surrogatevirus_for_outlier_detection,
-                                  args.water_quality_number_of_last_month,
-                                  args.min_number_of_last_measurements_for_water_qc, args.water_qc_outlier_statistics,
-                                  args.fraction_last_samples_for_dry_flow, args.min_num_samples_for_mean_dry_flow,
-                                  args.heavy_precipitation_factor, args.mean_sewage_flow_below_typo_factor,
-                                  args.mean_sewage_flow_above_typo_factor, args.min_number_of_biomarkers_for_normalization,
-                                  args.base_reproduction_value_factor, args.num_previous_days_reproduction_factor, args.max_number_of_flags_for_outlier)
-
-    sewageQuality.run_quality_control()
-
+    if args.command == "serve" and not args.watch:
+        parser.error("the serve mode requires --watch FOLDER")
+    if args.compact_db:
+        db.SewageDatabase().compact()
+    if args.command == "serve":
+        create_sewage_quality(args).serve(args.watch, args.poll_interval)
+    elif args.input or args.config:
+        sewageQuality = create_sewage_quality(args)
+        sewageQuality.run_quality_control()
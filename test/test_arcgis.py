@@ -0,0 +1,63 @@
+import json
+import os.path
+from types import SimpleNamespace
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.arcgis import query_feature_attributes, group_features_by_location, convert_feature_attributes
+from lib.constant import *
+from lib.sewage import SewageSample
+from lib.utils import column_map
+
+fixture_file = os.path.join(os.path.dirname(__file__), "fixtures", "arcgis_features.json")
+
+
+class RecordedFeatureLayer:
+    """ Replays the recorded feature pages of a feature layer query """
+
+    def __init__(self, pages):
+        self.features = [feature for page in pages for feature in page["features"]]
+        self.queries = []
+
+    def query(self, where, out_fields, return_geometry, result_offset, result_record_count):
+        self.queries.append((result_offset, result_record_count))
+        features = self.features[result_offset:result_offset + result_record_count]
+        return SimpleNamespace(features=[SimpleNamespace(attributes=feature["attributes"]) for feature in features])
+
+
+class TestArcgis(TestCase):
+
+    def setUp(self) -> None:
+        with open(fixture_file) as f:
+            self.pages = json.load(f)
+
+    def test_paged_query(self):
+        feature_layer = RecordedFeatureLayer(self.pages)
+        pages = list(query_feature_attributes(feature_layer, page_size=6))
+        self.assertEqual([len(attributes) for attributes in pages], [6, 6, 1])
+        self.assertEqual(feature_layer.queries, [(0, 6), (6, 6), (12, 6)])
+
+    def test_conversion_equals_sewage_samples(self):
+        attributes = [feature["attributes"] for page in self.pages for feature in page["features"]]
+        features = convert_feature_attributes(attributes)
+        for idx, attribute in enumerate(attributes):
+            sewage_sample = SewageSample({"attributes": attribute})
+            collection_date = features[Columns.DATE.value][idx]
+            self.assertEqual(None if pd.isna(collection_date) else collection_date, sewage_sample.collectionDate)
+            self.assertEqual(features[Columns.COMMENT_ANALYSIS.value][idx], sewage_sample.bem_lab)
+            for column in [Columns.BIOMARKER_N1.value, Columns.MEAN_SEWAGE_FLOW.value, Columns.CONDUCTIVITY.value]:
+                expected = getattr(sewage_sample, column)
+                self.assertEqual(np.isnan(features[column][idx]), expected is None)
+                if expected is not None:
+                    self.assertEqual(features[column][idx], expected)
+
+    def test_group_features_by_location(self):
+        sewage_samples = group_features_by_location(query_feature_attributes(RecordedFeatureLayer(self.pages), page_size=6))
+        self.assertEqual(list(sewage_samples), ["A-STADT_01", "BGL_03_BAD_REICHENHALL"])
+        measurements = sewage_samples["A-STADT_01"]
+        self.assertEqual(list(measurements.columns), list(column_map.values()))
+        self.assertEqual(measurements.shape[0], 6)
+        self.assertEqual(measurements[Columns.BIOMARKER_N1.value].dtype, np.float64)
+        # BGL samples are used from March 2023 on
+        self.assertTrue((sewage_samples["BGL_03_BAD_REICHENHALL"][Columns.DATE.value] >= "2023-03-01").all())
+        self.assertEqual(sewage_samples["BGL_03_BAD_REICHENHALL"].shape[0], 2)
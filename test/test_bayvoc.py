@@ -0,0 +1,176 @@
+import json
+import shutil
+import os.path
+import threading
+import urllib.parse
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.bayvoc import BayVOC, get_token_expiration
+from lib.config import Config
+from lib.constant import *
+from lib.database import SewageDatabase
+
+test_output_folder = 'tmp'
+
+
+def create_token(expiration: float, token_id=0) -> str:
+    def encode(data):
+        return urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("ascii").rstrip("=")
+    return "{}.{}.signature".format(encode({"alg": "HS256"}), encode({"sub": "user", "jti": token_id, "exp": int(expiration)}))
+
+
+def create_samples(sample_location, num_samples, start_date="2023-01-02"):
+    return [{"name": sample_location, "collectionDate": "{}T00:00:00".format(date.strftime("%Y-%m-%d")),
+             "labCopiesMlGeneN1": 100.0 + i, "labCopiesMlGeneN2": 50.0 + i, "nh4n": 40.0, "lf": 1500.0,
+             "mean_sewage_flow": 60.0, "trockentag": "Ja"}
+            for i, date in enumerate(pd.date_range(start_date, periods=num_samples, freq="3D"))]
+
+
+class StubBayVOCHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def __send_json(self, data, status=200):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        with self.server.lock:
+            self.server.num_authentications += 1
+            self.server.token = create_token(self.server.now.timestamp() + self.server.token_lifetime, self.server.num_authentications)
+            self.__send_json({"jwttoken": self.server.token})
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        if self.headers["AuthorizationBearer"] != "Bearer {}".format(self.server.token):
+            self.__send_json({"error": "unauthorized"}, 401)
+            return
+        with self.server.lock:
+            self.server.requests.append(params)
+            if self.server.revoke_token:
+                self.server.token, self.server.revoke_token = None, False
+        samples = self.server.samples
+        if "since" in params:
+            samples = [sample for sample in samples if sample["collectionDate"][:10] >= params["since"]]
+        page, size = int(params["page"]), int(params["size"])
+        content = samples[page * size:(page + 1) * size]
+        if self.server.spring_pages:
+            self.__send_json({"content": content, "totalPages": (len(samples) + size - 1) // size})
+        else:
+            self.__send_json(content)
+
+
+class TestBayVOC(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubBayVOCHandler)
+        self.server.lock = threading.Lock()
+        self.server.samples = create_samples("A-STADT_01", 25) + create_samples("B-LAND_01", 12)
+        self.server.token = None
+        # the client and the server share the time of the test, thus the token renewal is deterministic
+        self.server.now = datetime(2023, 6, 1, 12, 0)
+        self.server.token_lifetime = 3600
+        self.server.num_authentications = 0
+        self.server.revoke_token = False
+        self.server.spring_pages = False
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        config_file = os.path.join(test_output_folder, "config.ini")
+        with open(config_file, "w") as f:
+            f.write("[General]\nserver = http://127.0.0.1:{}\nauthentication_endpoint = /authenticate\n"
+                    "sewage_get_all_endpoint = /samples\nsewage_page_size = 10\nsewage_max_connections = 3\n"
+                    "[ARCGIS]\ngis_url = \ngis_user = \ngis_password = \n[BasicAuth]\nuser = basic\npassword = basic\n"
+                    "[BayVOC]\nuser = user\npassword = password\n[Mail]\nhost = \nport = \nuser = \npassword = \n"
+                    .format(self.server.server_address[1]))
+        self.bayvoc = BayVOC(Config(config_file), clock=lambda: self.server.now)
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_token_expiration(self):
+        self.assertEqual(get_token_expiration(create_token(1700000000)).timestamp(), 1700000000)
+
+    def test_fetch_pages(self):
+        sewage_samples = dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(sorted(sewage_samples), ["A-STADT_01", "B-LAND_01"])
+        self.assertEqual(sewage_samples["A-STADT_01"].shape[0], 25)
+        self.assertEqual(sewage_samples["A-STADT_01"][Columns.DATE.value][0], "2023-01-02")
+        self.assertTrue(np.isnan(sewage_samples["A-STADT_01"][Columns.BIOMARKER_N3.value]).all())
+        self.assertEqual(self.server.num_authentications, 1)
+
+    def test_fetch_spring_pages(self):
+        self.server.spring_pages = True
+        records = dict(self.bayvoc.read_sewage_samples(["B-LAND"]))
+        self.assertEqual(list(records), ["B-LAND_01"])
+        self.assertEqual(sorted(int(request["page"]) for request in self.server.requests), [0, 1, 2, 3])
+
+    def test_token_renewal(self):
+        # a token with a lifetime shorter than the renewal margin is renewed within the last half of its lifetime only
+        self.server.token_lifetime = 30
+        self.assertEqual(len(dict(self.bayvoc.read_sewage_samples())), 2)
+        self.assertEqual(self.server.num_authentications, 1)
+        self.server.now += timedelta(seconds=14)
+        dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(self.server.num_authentications, 1)
+        self.server.now += timedelta(seconds=1)
+        dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(self.server.num_authentications, 2)
+        # tokens with a long lifetime are renewed 'token_renewal_margin' before they expire
+        self.server.token_lifetime = 3600
+        self.server.now += timedelta(seconds=30)
+        dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(self.server.num_authentications, 3)
+        self.server.now += timedelta(seconds=3600) - BayVOC.token_renewal_margin
+        dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(self.server.num_authentications, 4)
+
+    def test_revoked_token(self):
+        self.server.revoke_token = True
+        sewage_samples = dict(self.bayvoc.read_sewage_samples())
+        self.assertEqual(sewage_samples["A-STADT_01"].shape[0], 25)
+        self.assertEqual(self.server.num_authentications, 2)
+
+    def test_incremental_import(self):
+        database = SewageDatabase()
+        database.output_folder = test_output_folder
+        stored_measurements = dict(self.bayvoc.read_sewage_samples())
+        for sample_location, measurements in stored_measurements.items():
+            measurements = measurements.iloc[:10].copy()
+            measurements[Columns.DATE.value] = pd.to_datetime(measurements[Columns.DATE.value])
+            database.add_sewage_location2db(sample_location, measurements)
+        self.server.requests = []
+        sewage_samples = dict(self.bayvoc.read_sewage_samples(database=database))
+        self.assertEqual(self.server.requests[0]["since"], "2023-01-29")
+        self.assertEqual(sewage_samples["A-STADT_01"].shape[0], 25)
+        self.assertEqual(sewage_samples["B-LAND_01"].shape[0], 12)
+        pd.testing.assert_frame_equal(sewage_samples["A-STADT_01"], stored_measurements["A-STADT_01"], check_dtype=False)
+
+    def test_incremental_import_of_new_location(self):
+        database = SewageDatabase()
+        database.output_folder = test_output_folder
+        stored_measurements = dict(self.bayvoc.read_sewage_samples())
+        measurements = stored_measurements["A-STADT_01"].iloc[:5].copy()
+        measurements[Columns.DATE.value] = pd.to_datetime(measurements[Columns.DATE.value])
+        database.add_sewage_location2db("A-STADT_01", measurements)
+        self.server.requests = []
+        # the samples of 'B-LAND_01' before the last collection date of 'A-STADT_01' are requested as well
+        sewage_samples = dict(self.bayvoc.read_sewage_samples(database=database))
+        self.assertEqual(self.server.requests[0]["since"], "2023-01-14")
+        self.assertTrue(any("since" not in request for request in self.server.requests))
+        for sample_location in ["A-STADT_01", "B-LAND_01"]:
+            pd.testing.assert_frame_equal(sewage_samples[sample_location], stored_measurements[sample_location], check_dtype=False)
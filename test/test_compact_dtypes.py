@@ -0,0 +1,51 @@
+import shutil
+import os.path
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.constant import *
+from lib.compact_dtypes import compact_measurements, get_memory_usage
+from lib.database import SewageDatabase
+from test.test_vectorized_engine import create_measurements
+
+test_output_folder = 'tmp'
+
+
+class TestCompactDtypes(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_compact_layout(self):
+        measurements = create_measurements(num_samples=100)
+        measurements[CalculatedColumns.OUTLIER_REASON.value] = ["outlier " + str(i % 2) for i in range(100)]
+        memory_usage = get_memory_usage(measurements)
+        compact_measurements(measurements)
+        self.assertEqual(measurements[Columns.BIOMARKER_N1.value].dtype, np.float32)
+        self.assertEqual(measurements[CalculatedColumns.FLAG.value].dtype, np.uint32)
+        self.assertEqual(measurements[CalculatedColumns.get_biomarker_flag(Columns.BIOMARKER_N1.value)].dtype, np.uint32)
+        self.assertIsInstance(measurements[Columns.TROCKENTAG.value].dtype, pd.CategoricalDtype)
+        self.assertIs(measurements[CalculatedColumns.OUTLIER_REASON.value][0], measurements[CalculatedColumns.OUTLIER_REASON.value][2])
+        self.assertLess(get_memory_usage(measurements), memory_usage / 1.5)
+        compacted_measurements = measurements.copy()
+        compact_measurements(compacted_measurements)
+        pd.testing.assert_frame_equal(measurements, compacted_measurements)
+
+    def test_database_restores_compact_layout(self):
+        database = SewageDatabase()
+        database.output_folder = test_output_folder
+        database.compact_dtypes = True
+        measurements = create_measurements(num_samples=20)
+        compact_measurements(measurements)
+        measurements[CalculatedColumns.FLAG.value] = np.arange(20, dtype=np.uint32)
+        database.add_sewage_location2db("location", measurements)
+        new_measurements = create_measurements(num_samples=20)
+        compact_measurements(new_measurements)
+        database.needs_recalcuation("location", new_measurements, False)
+        self.assertFalse(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value].any())
+        self.assertEqual(new_measurements[CalculatedColumns.FLAG.value].tolist(), list(range(20)))
+        self.assertEqual(new_measurements[CalculatedColumns.FLAG.value].dtype, np.uint32)
@@ -0,0 +1,151 @@
+import shutil
+import os.path
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.constant import *
+from lib.database import SewageDatabase
+from test.test_vectorized_engine import create_measurements
+
+test_output_folder = 'tmp'
+
+
+class TestSewageDatabase(TestCase):
+
+    def setUp(self) -> None:
+        self.database = SewageDatabase()
+        self.database.output_folder = test_output_folder
+        os.makedirs(test_output_folder, exist_ok=True)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_row_hashes_independent_of_numeric_type(self):
+        measurements = create_measurements(num_samples=5)
+        measurements[Columns.CONDUCTIVITY.value] = np.arange(5)
+        converted_measurements = measurements.copy()
+        converted_measurements[Columns.CONDUCTIVITY.value] = converted_measurements[Columns.CONDUCTIVITY.value].astype(float)
+        self.assertTrue((SewageDatabase.get_row_hashes(measurements) == SewageDatabase.get_row_hashes(converted_measurements)).all())
+
+    def test_only_changed_measurements_need_processing(self):
+        stored_measurements = create_measurements(num_samples=10)
+        stored_measurements[CalculatedColumns.FLAG.value] = np.arange(10)
+        stored_measurements[CalculatedColumns.OUTLIER_REASON.value] = "reason"
+        self.database.add_sewage_location2db("location", stored_measurements)
+        new_measurements = create_measurements(num_samples=10)
+        new_measurements.loc[3, Columns.BIOMARKER_N1.value] = 1234.5
+        self.database.needs_recalcuation("location", new_measurements, False)
+        needs_processing = new_measurements[CalculatedColumns.NEEDS_PROCESSING.value]
+        self.assertEqual(needs_processing[needs_processing].index.tolist(), [3])
+        self.assertEqual(new_measurements[CalculatedColumns.FLAG.value].tolist(), [0, 1, 2, 0, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(new_measurements.loc[2, CalculatedColumns.OUTLIER_REASON.value], "reason")
+        self.assertEqual(new_measurements.loc[3, CalculatedColumns.OUTLIER_REASON.value], "")
+        self.assertEqual(new_measurements[CalculatedColumns.FLAG.value].dtype, np.dtype(CalculatedColumns.FLAG.type))
+
+    def __get_processed_rows(self, new_measurements):
+        num_dependent_measurements = self.database.needs_recalcuation("location", new_measurements, False, True)
+        needs_processing = new_measurements[CalculatedColumns.NEEDS_PROCESSING.value]
+        return num_dependent_measurements, needs_processing[needs_processing].index.tolist()
+
+    def test_dependent_measurements_need_processing(self):
+        stored_measurements = create_measurements(num_samples=10)
+        stored_measurements[CalculatedColumns.FLAG.value] = np.arange(10)
+        self.database.add_sewage_location2db("location", stored_measurements)
+        new_measurements = create_measurements(num_samples=10)
+        self.assertEqual(self.__get_processed_rows(new_measurements.copy()), (0, []))
+        # the flags of the later measurements depend on a corrected measurement, the previous ones are restored
+        changed_measurements = new_measurements.copy()
+        changed_measurements.loc[3, Columns.BIOMARKER_N1.value] = 1234.5
+        self.assertEqual(self.__get_processed_rows(changed_measurements), (6, list(range(3, 10))))
+        self.assertEqual(changed_measurements[CalculatedColumns.FLAG.value].tolist(), [0, 1, 2] + [0] * 7)
+        # removed measurements change the windows of the later measurements
+        removed_measurements = new_measurements.drop(index=5).reset_index(drop=True)
+        self.assertEqual(self.__get_processed_rows(removed_measurements), (4, list(range(5, 9))))
+        # a new last measurement is not within the windows of the previous measurements
+        new_measurement = new_measurements.iloc[[9]].assign(**{Columns.DATE.value: new_measurements[Columns.DATE.value].max() + pd.Timedelta(days=4)})
+        appended_measurements = pd.concat([new_measurements, new_measurement], ignore_index=True)
+        self.assertEqual(self.__get_processed_rows(appended_measurements), (0, [10]))
+
+    def test_reverted_correction_needs_processing(self):
+        measurements = create_measurements(num_samples=10)
+        measurements[CalculatedColumns.FLAG.value] = 1
+        self.database.add_sewage_location2db("location", measurements)
+        corrected_measurements = create_measurements(num_samples=10)
+        corrected_measurements.loc[3, Columns.BIOMARKER_N1.value] = 999.0
+        self.database.needs_recalcuation("location", corrected_measurements, False)
+        corrected_measurements[CalculatedColumns.FLAG.value] = 2
+        self.database.add_sewage_location2db("location", corrected_measurements)
+        # the first version of the measurement is outdated, its flags are not restored
+        reverted_measurements = create_measurements(num_samples=10)
+        self.database.needs_recalcuation("location", reverted_measurements, False)
+        needs_processing = reverted_measurements[CalculatedColumns.NEEDS_PROCESSING.value]
+        self.assertEqual(needs_processing[needs_processing].index.tolist(), [3])
+        self.assertEqual(reverted_measurements[CalculatedColumns.FLAG.value].tolist(), [1, 1, 1, 0] + [1] * 6)
+
+    def test_removed_measurement_processed_once(self):
+        measurements = create_measurements(num_samples=10)
+        self.database.add_sewage_location2db("location", measurements)
+        removed_date = measurements[Columns.DATE.value][3]
+        removed_measurements = measurements.drop(index=3).reset_index(drop=True)
+        for num_dependent_measurements in [6, 0, 0]:
+            new_measurements = removed_measurements.copy()
+            self.assertEqual(self.__get_processed_rows(new_measurements)[0], num_dependent_measurements)
+            self.database.add_sewage_location2db("location", new_measurements)
+        self.assertFalse(self.database.has_removed_measurements("location"))
+        self.database.compact()
+        self.assertEqual(self.__get_processed_rows(removed_measurements.copy()), (0, []))
+        stored_dates = pd.to_datetime(self.database.load_measurements("location")[Columns.DATE.value])
+        self.assertEqual(len(stored_dates), 9)
+        self.assertNotIn(pd.Timestamp(removed_date), stored_dates.tolist())
+
+    def test_removed_last_measurement(self):
+        measurements = create_measurements(num_samples=10)
+        self.database.add_sewage_location2db("location", measurements)
+        removed_measurements = measurements.iloc[:-1].copy()
+        self.assertEqual(self.__get_processed_rows(removed_measurements), (0, []))
+        self.assertTrue(self.database.has_removed_measurements("location"))
+        self.database.add_sewage_location2db("location", removed_measurements)
+        self.assertEqual(self.database.get_last_collection_date("location"), pd.Timestamp(measurements[Columns.DATE.value][8]))
+
+    def test_compact_removes_outdated_versions(self):
+        measurements = create_measurements(num_samples=10)
+        self.database.add_sewage_location2db("location", measurements)
+        corrected_measurements = create_measurements(num_samples=10)
+        corrected_measurements.loc[3, Columns.BIOMARKER_N1.value] = 999.0
+        self.database.needs_recalcuation("location", corrected_measurements, False)
+        self.database.add_sewage_location2db("location", corrected_measurements)
+        self.database.compact()
+        partition_folder = os.path.join(test_output_folder, ".location_sewage_db", "year=2022")
+        partition_files = os.listdir(partition_folder)
+        self.assertEqual(len(partition_files), 1)
+        stored_measurements = pd.read_parquet(os.path.join(partition_folder, partition_files[0]))
+        self.assertEqual(stored_measurements.shape[0], 10)
+        stored_measurements = stored_measurements.sort_values(by=Columns.DATE.value, ignore_index=True)
+        self.assertEqual(stored_measurements[Columns.BIOMARKER_N1.value].tolist()[3], 999.0)
+
+    def test_rerun_all(self):
+        measurements = create_measurements(num_samples=5)
+        self.database.add_sewage_location2db("location", measurements)
+        self.database.needs_recalcuation("location", measurements, True)
+        self.assertTrue(measurements[CalculatedColumns.NEEDS_PROCESSING.value].all())
+
+    def test_append_and_compact_partitions(self):
+        measurements = create_measurements(num_samples=100)
+        self.database.add_sewage_location2db("location", measurements)
+        changed_measurements = create_measurements(num_samples=100)
+        changed_measurements.loc[95, Columns.BIOMARKER_N1.value] = 1234.5
+        self.database.needs_recalcuation("location", changed_measurements, False)
+        changed_measurements[CalculatedColumns.FLAG.value] = 1
+        self.database.add_sewage_location2db("location", changed_measurements)
+        location_folder = os.path.join(test_output_folder, ".location_sewage_db")
+        self.assertEqual(sorted(os.listdir(location_folder)), ["year=2022", "year=2023"])
+        self.assertEqual(len(os.listdir(os.path.join(location_folder, "year=2023"))), 2)
+        self.database.compact()
+        for partition in os.listdir(location_folder):
+            self.assertEqual(len(os.listdir(os.path.join(location_folder, partition))), 1)
+        new_measurements = create_measurements(num_samples=100)
+        new_measurements.loc[95, Columns.BIOMARKER_N1.value] = 1234.5
+        self.database.needs_recalcuation("location", new_measurements, False)
+        self.assertFalse(new_measurements[CalculatedColumns.NEEDS_PROCESSING.value].any())
+        self.assertEqual(new_measurements[CalculatedColumns.FLAG.value].tolist(), [0] * 95 + [1] + [0] * 4)
@@ -0,0 +1,32 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib import constant
+from lib.utils import get_last_N_month_and_days
+from lib.date_window_index import DateWindowIndex
+
+
+class TestDateWindowIndex(TestCase):
+
+    def setUp(self) -> None:
+        dates = pd.to_datetime(["2022-01-31", "2022-02-28", "2022-02-28", "2022-03-01", "2022-03-31",
+                                "2022-04-30", "2022-05-31", "2022-05-31", "2022-06-01"])
+        self.measurements = pd.DataFrame({constant.Columns.DATE.value: dates, "value": np.arange(len(dates), dtype=float)})
+        self.date_window_index = DateWindowIndex(self.measurements[constant.Columns.DATE.value].to_numpy())
+
+    def test_window_equals_last_N_month_and_days(self):
+        for num_month, num_days in [(0, 7), (1, 0), (3, 0), (1, 3)]:
+            for index, current_measurement in self.measurements.iterrows():
+                last_values = get_last_N_month_and_days(self.measurements, current_measurement, "value", num_month, num_days)
+                start, end = self.date_window_index.get_window(index, num_month, num_days)
+                self.assertEqual(last_values.index.tolist(), list(range(start, end)))
+
+    def test_window_without_start_date(self):
+        start, end = self.date_window_index.get_window(4, 1, 0, include_start_date=False)
+        self.assertEqual((start, end), (3, 4))
+        start, end = self.date_window_index.get_window(4, 1, 0)
+        self.assertEqual((start, end), (1, 4))
+
+    def test_unsorted_dates(self):
+        with self.assertRaises(ValueError):
+            DateWindowIndex(pd.to_datetime(["2022-02-01", "2022-01-01"]).to_numpy())
@@ -0,0 +1,30 @@
+import math
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.dry_flow_estimator import DryWeatherFlowEstimator
+
+
+class TestDryWeatherFlowEstimator(TestCase):
+
+    def test_mean_of_smallest_equals_nsmallest(self):
+        rng = np.random.default_rng(3)
+        mean_sewage_flows = rng.integers(50, 80, 200).astype(float)
+        mean_sewage_flows[rng.random(200) < 0.1] = np.NAN
+        dry_flow_estimator = DryWeatherFlowEstimator(mean_sewage_flows)
+        for index, mean_sewage_flow in enumerate(mean_sewage_flows):
+            dry_flow_estimator.add(mean_sewage_flow)
+            previous_flows = pd.Series(mean_sewage_flows[:index + 1])
+            num_smallest = math.ceil(previous_flows.shape[0] * 0.1)
+            expected = np.mean(previous_flows.nsmallest(num_smallest, keep='all'))
+            if np.isnan(expected):
+                self.assertTrue(np.isnan(dry_flow_estimator.get_mean_of_smallest(num_smallest)))
+            else:
+                self.assertAlmostEqual(expected, dry_flow_estimator.get_mean_of_smallest(num_smallest))
+
+    def test_number_of_sewage_flows(self):
+        dry_flow_estimator = DryWeatherFlowEstimator(np.array([3.0, np.NAN, 1.0]))
+        for mean_sewage_flow in [3.0, np.NAN, 1.0]:
+            dry_flow_estimator.add(mean_sewage_flow)
+        self.assertEqual(dry_flow_estimator.num_sewage_flows, 3)
+        self.assertEqual(dry_flow_estimator.get_mean_of_smallest(5), 2.0)
@@ -0,0 +1,45 @@
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.constant import *
+from lib.flag_store import FlagStore
+
+
+class TestFlagStore(TestCase):
+
+    def setUp(self) -> None:
+        self.measurements = pd.DataFrame({CalculatedColumns.FLAG.value: [0, 2, 6],
+                                          "flag_a": [0, 4, 0], "flag_b": [8, 0, 0], "ratio_flag_a_b": [0, 64, 0]})
+        self.flag_store = FlagStore(self.measurements, ["flag_a", "flag_b"], ["ratio_flag_a_b"])
+
+    def test_set_and_clear_flags(self):
+        FlagStore.set_flag(self.flag_store.flag, np.array([True, True, False]), SewageFlag.MISSING_MEAN_SEWAGE_FLOW)
+        self.assertEqual(self.flag_store.flag.tolist(), [2, 2, 6])
+        FlagStore.clear_flag(self.flag_store.flag, np.array([False, False, True]), SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY)
+        self.assertEqual(self.flag_store.flag.tolist(), [2, 2, 2])
+        self.assertEqual(FlagStore.is_flag_set(self.flag_store.biomarker_flags, SewageFlag.BIOMARKER_PROBABLE_OUTLIER).tolist(),
+                         [[False, True], [False, False], [False, False]])
+        self.assertEqual(FlagStore.is_not_flag_set(self.flag_store.biomarker_ratio_flags[:, 0], SewageFlag.BIOMARKER_RATIO_OUTLIER).tolist(),
+                         [True, False, True])
+
+    def test_flag_columns_are_contiguous(self):
+        self.assertEqual(self.flag_store.flag.dtype, np.uint32)
+        self.assertTrue(self.flag_store.biomarker_flags[:, 1].flags['C_CONTIGUOUS'])
+
+    def test_write_back(self):
+        self.flag_store.biomarker_flags[2, 0] |= SewageFlag.BIOMARKER_VALIDATED_OUTLIER.value
+        self.flag_store.write_back(self.measurements)
+        self.assertEqual(self.measurements["flag_a"].tolist(), [0, 4, 16])
+        self.assertEqual(self.measurements[CalculatedColumns.FLAG.value].dtype, np.dtype(CalculatedColumns.FLAG.type))
+
+    def test_write_back_keeps_compact_flags(self):
+        measurements = self.measurements.astype(FlagStore.dtype)
+        self.flag_store.write_back(measurements)
+        self.assertTrue((measurements.dtypes == np.dtype(FlagStore.dtype)).all())
+        self.assertEqual(measurements["ratio_flag_a_b"].tolist(), [0, 64, 0])
+
+    def test_series_without_conversion(self):
+        self.assertEqual(SewageFlag.is_flag_set_for_series(self.flag_store.flag, SewageFlag.MISSING_MEAN_SEWAGE_FLOW).tolist(),
+                         [False, True, True])
+        self.assertEqual(SewageFlag.is_not_flag_set_for_series(self.measurements["flag_a"], SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY).tolist(),
+                         [True, False, True])
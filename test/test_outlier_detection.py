@@ -0,0 +1,84 @@
+import os
+import shutil
+from unittest import TestCase
+import numpy as np
+import pandas as pd
+from lib.utils import detect_outliers, detect_outliers_in_windows, detect_outliers_in_trailing_windows, FittedModelCache
+
+test_output_folder = 'tmp'
+
+
+class TestBatchOutlierDetection(TestCase):
+
+    def setUp(self) -> None:
+        rng = np.random.default_rng(5)
+        self.values = rng.normal(40, 4, 120)
+        self.values[rng.random(120) < 0.1] *= 3
+        self.values[rng.random(120) < 0.1] = np.NAN
+        self.positions = np.arange(10, 120)
+        self.positions = self.positions[~np.isnan(self.values[self.positions])]
+        self.window_starts = np.maximum(self.positions - 35, 0)
+        self.window_ends = self.positions
+
+    def test_windows_equal_detect_outliers(self):
+        for outlier_statistics, isFactor in [(['iqr'], False), (['iqr'], True), (['zscore'], False), (['ci'], False),
+                                             (['iqr', 'lof'], False), (['iqr', 'zscore', 'ci'], False)]:
+            is_outlier = detect_outliers_in_windows(outlier_statistics, self.values, self.window_starts, self.window_ends,
+                                                    self.values[self.positions], isFactor)
+            for position_idx, position in enumerate(self.positions):
+                train_values = pd.Series(self.values[self.window_starts[position_idx]:position]).dropna()
+                expected = detect_outliers(outlier_statistics, train_values, self.values[position], isFactor)
+                self.assertEqual(expected, is_outlier[position_idx], "{} at position {}".format(outlier_statistics, position))
+
+    def test_outliers_are_removed_from_following_windows(self):
+        is_train_value = ~np.isnan(self.values)
+        num_train_values, is_outlier = detect_outliers_in_trailing_windows(['iqr'], self.values, is_train_value, self.positions,
+                                                                           self.window_starts, self.window_ends, 9)
+        self.assertTrue(is_outlier.any())
+        for position_idx, position in enumerate(self.positions):
+            train_values = self.values[self.window_starts[position_idx]:position]
+            train_values = train_values[is_train_value[self.window_starts[position_idx]:position]]
+            self.assertEqual(num_train_values[position_idx], train_values.shape[0])
+            expected = train_values.shape[0] >= 9 and detect_outliers(['iqr'], pd.Series(train_values), self.values[position])
+            self.assertEqual(expected, is_outlier[position_idx])
+            if is_outlier[position_idx]:
+                is_train_value[position] = False
+
+
+class TestFittedModelCache(TestCase):
+
+    def setUp(self) -> None:
+        self.model_cache = FittedModelCache(max_size=2)
+        self.fitted = []
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __fit(self, name):
+        self.fitted.append(name)
+        return name
+
+    def test_hits_and_misses(self):
+        train_values = np.arange(10, dtype=float)
+        self.assertEqual(self.model_cache.get_model('lof', (9, 'auto'), train_values, lambda: self.__fit('a')), 'a')
+        self.assertEqual(self.model_cache.get_model('lof', (9, 'auto'), train_values.copy(), lambda: self.__fit('b')), 'a')
+        self.assertEqual(self.model_cache.get_model('lof', (5, 'auto'), train_values, lambda: self.__fit('c')), 'c')
+        self.assertEqual((self.model_cache.hits, self.model_cache.misses), (1, 2))
+        self.assertEqual(self.fitted, ['a', 'c'])
+
+    def test_least_recently_used_model_is_removed(self):
+        for value in range(3):
+            self.model_cache.get_model('svm', (), np.array([value], dtype=float), lambda: self.__fit(value))
+        self.model_cache.get_model('svm', (), np.array([0], dtype=float), lambda: self.__fit('refit'))
+        self.assertEqual(self.fitted, [0, 1, 2, 'refit'])
+
+    def test_save_and_load(self):
+        os.makedirs(test_output_folder, exist_ok=True)
+        cache_file = os.path.join(test_output_folder, "fitted_models.pkl")
+        self.model_cache.get_model('rf', (), np.ones(3), lambda: self.__fit('model'))
+        self.model_cache.save(cache_file)
+        loaded_model_cache = FittedModelCache()
+        loaded_model_cache.load(cache_file)
+        self.assertEqual(loaded_model_cache.get_model('rf', (), np.ones(3), lambda: self.__fit('refit')), 'model')
+        self.assertEqual(loaded_model_cache.hits, 1)
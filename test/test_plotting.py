@@ -0,0 +1,98 @@
+import os
+import shutil
+from unittest import TestCase
+import pandas as pd
+import matplotlib.pyplot as plt
+from matplotlib.backends.backend_pdf import PdfPages
+import lib.plotting as plotting
+from lib.constant import Columns, CalculatedColumns
+
+test_output_folder = 'tmp'
+
+
+def plot_values(pdf_plotter, measurements_df, sample_location, title):
+    for column in measurements_df.columns:
+        plt.figure(figsize=(10, 5))
+        plt.plot(measurements_df[column])
+        plt.title("{} {} for '{}'".format(title, column, sample_location))
+        pdf_plotter.savefig()
+        plt.close()
+
+
+class TestPlotPages(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.measurements = pd.DataFrame({"a": [1.0, 3.0, 2.0], "b": [5.0, 4.0, 6.0]})
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __create_pdf(self, file_name, render_pickled):
+        pdf_file = os.path.join(test_output_folder, file_name)
+        pdf_pages = PdfPages(pdf_file, metadata={'CreationDate': None})
+        if render_pickled:
+            figures = plotting.render_plot_page(plot_values, self.measurements, "location", "Values")
+            self.assertEqual(len(figures), 2)
+            plotting.save_pickled_figures(pdf_pages, figures)
+        else:
+            plot_values(pdf_pages, self.measurements, "location", "Values")
+        pdf_pages.close()
+        with open(pdf_file, 'rb') as f:
+            return f.read()
+
+    def test_pickled_figures_equal_direct_plotting(self):
+        self.assertEqual(self.__create_pdf("direct.pdf", False), self.__create_pdf("pickled.pdf", True))
+
+
+class TestLabelPlacement(TestCase):
+
+    def setUp(self) -> None:
+        self.labels = [(day, value, "label {}".format(day)) for day, value in enumerate([1.0, 9.0, 2.0, -6.0, 5.0])]
+        self.panel_values = pd.Series([1.0, 1.0, 1.0, 9.0, 2.0, -6.0, 5.0])
+
+    def test_select_most_extreme_labels(self):
+        label_placement = plotting.LabelPlacement("top-2")
+        self.assertEqual(label_placement.select(self.labels, self.panel_values), [self.labels[1], self.labels[3]])
+        self.assertEqual(plotting.LabelPlacement("all").select(self.labels, self.panel_values), self.labels)
+        self.assertEqual(plotting.LabelPlacement("none").select(self.labels, self.panel_values), [])
+
+    def test_invalid_labels(self):
+        with self.assertRaises(ValueError):
+            plotting.LabelPlacement("top")
+
+
+class TestPlotPageCache(TestCase):
+
+    def setUp(self) -> None:
+        self.page_cache = plotting.PlotPageCache(os.path.join(test_output_folder, "cache"))
+        self.measurements = pd.DataFrame({Columns.DATE.value: pd.date_range("2023-01-02", periods=3, freq="7D"),
+                                          Columns.MEAN_SEWAGE_FLOW.value: [10.0, 12.0, 11.0],
+                                          CalculatedColumns.FLAG.value: [0, 0, 0],
+                                          Columns.AMMONIUM.value: [40.0, 41.0, 39.0]})
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __get_fingerprint(self):
+        return self.page_cache.get_fingerprint(plotting.plot_sewage_flow, self.measurements, "location", ())
+
+    def test_fingerprint_of_plotted_columns(self):
+        fingerprint = self.__get_fingerprint()
+        self.measurements[Columns.AMMONIUM.value] = 0.0
+        self.assertEqual(fingerprint, self.__get_fingerprint())
+        self.measurements.loc[2, Columns.MEAN_SEWAGE_FLOW.value] = 20.0
+        self.assertNotEqual(fingerprint, self.__get_fingerprint())
+
+    def test_pages_and_manifest(self):
+        fingerprint = self.__get_fingerprint()
+        self.assertIsNone(self.page_cache.load(fingerprint))
+        self.page_cache.save(fingerprint, [b"figure"])
+        self.page_cache.save("outdated", [b"figure"])
+        self.assertFalse(self.page_cache.is_pdf_unchanged([fingerprint]))
+        self.page_cache.save_manifest([fingerprint])
+        self.assertTrue(self.page_cache.is_pdf_unchanged([fingerprint]))
+        self.assertEqual(self.page_cache.load(fingerprint), [b"figure"])
+        self.assertIsNone(self.page_cache.load("outdated"))
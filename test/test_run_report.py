@@ -0,0 +1,37 @@
+import json
+import shutil
+import os.path
+from unittest import TestCase
+import ssqn
+from benchmark.synthetic_data import generate_sample_locations, write_sample_locations
+
+test_output_folder = 'tmp'
+
+
+class TestRunReport(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        input_file = os.path.join(test_output_folder, "synthetic.parquet")
+        write_sample_locations(generate_sample_locations(num_locations=2, num_years=0.5), input_file)
+        args = ssqn.create_argument_parser().parse_args(["-i", input_file, "-o", os.path.join(test_output_folder, "output"),
+                                                         "-q", "--no-plots", "--engine", "vectorized"])
+        self.sewage_quality = ssqn.create_sewage_quality(args)
+        self.sewage_quality.database.output_folder = os.path.join(test_output_folder, "database")
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_run_report(self):
+        self.sewage_quality.run_quality_control()
+        with open(os.path.join(test_output_folder, "output", "logs", "run_report.json")) as f:
+            run_report = json.load(f)
+        self.assertEqual(sorted(run_report["locations"]), ["synthetic_location_000", "synthetic_location_001"])
+        location = run_report["locations"]["synthetic_location_000"]
+        self.assertEqual(location["measurements"], 52)
+        for stage in ["read_input", "setup", "biomarker_qc", "surrogatevirus_qc", "sewage_flow", "water_quality",
+                      "normalization", "database", "excel_export"]:
+            self.assertIn(stage, location["stages"])
+            self.assertEqual(run_report["stages"][stage]["calls"], 2 * location["stages"][stage]["calls"])
+        self.assertIn("iqr", run_report["detectors"])
@@ -0,0 +1,93 @@
+import shutil
+import os.path
+from unittest import TestCase
+import ssqn
+from benchmark.synthetic_data import generate_sample_locations
+from lib.constant import Columns
+from lib.utils import column_map
+from lib.watch import InputFolderWatcher
+
+test_output_folder = 'tmp'
+input_columns = {column: input_column for input_column, column in column_map.items()}
+
+
+class TestInputFolderWatcher(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.watcher = InputFolderWatcher(test_output_folder)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __write(self, file_name, content):
+        with open(os.path.join(test_output_folder, file_name), "w") as f:
+            f.write(content)
+
+    def test_changed_files(self):
+        self.__write("A-STADT_01.csv", "ANFANG\n")
+        self.__write(".A-STADT_01.csv.tmp", "ANFANG\n")
+        self.__write("~$input.xlsx", "")
+        input_file = os.path.join(test_output_folder, "A-STADT_01.csv")
+        # files are reported once they did not change between two scans, until they are processed
+        self.assertEqual(self.watcher.get_changed_files(), [])
+        self.assertEqual(self.watcher.get_changed_files(), [input_file])
+        self.assertEqual(self.watcher.get_changed_files(), [input_file])
+        self.watcher.mark_processed(input_file)
+        self.assertEqual(self.watcher.get_changed_files(), [])
+        self.__write("A-STADT_01.csv", "ANFANG\n2023-01-02\n")
+        self.assertEqual(self.watcher.get_changed_files(), [])
+        self.__write("A-STADT_01.csv", "ANFANG\n2023-01-02\n2023-01-05\n")
+        self.assertEqual(self.watcher.get_changed_files(), [])
+        self.assertEqual(self.watcher.get_changed_files(), [input_file])
+
+
+class TestServe(TestCase):
+
+    def setUp(self) -> None:
+        self.watch_folder = os.path.join(test_output_folder, "watch")
+        os.makedirs(self.watch_folder, exist_ok=True)
+        self.sample_locations = generate_sample_locations(num_locations=2, num_years=0.5)
+        for sample_location, measurements in self.sample_locations.items():
+            self.__write_input_file(sample_location, measurements.iloc[:-2])
+        args = ssqn.create_argument_parser().parse_args(["serve", "--watch", self.watch_folder, "-o", os.path.join(test_output_folder, "output"),
+                                                         "-q", "--no-plots", "--engine", "vectorized"])
+        self.sewage_quality = ssqn.create_sewage_quality(args)
+        self.sewage_quality.database.output_folder = os.path.join(test_output_folder, "database")
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __write_input_file(self, sample_location, measurements):
+        measurements.rename(columns=input_columns).to_csv(os.path.join(self.watch_folder, sample_location + ".csv"), index=False)
+
+    def __get_processed_measurements(self):
+        return {sample_location: location_statistic.total_samples
+                for sample_location, location_statistic in self.sewage_quality.location_statistics.items()}
+
+    def test_serve(self):
+        self.sewage_quality.serve(self.watch_folder, poll_interval=0, max_polls=2)
+        self.assertEqual(self.__get_processed_measurements(), {"synthetic_location_000": 50, "synthetic_location_001": 50})
+        # only the new measurements of the changed sample location are processed
+        self.__write_input_file("synthetic_location_000", self.sample_locations["synthetic_location_000"])
+        self.sewage_quality.serve(self.watch_folder, poll_interval=0, max_polls=2)
+        self.assertEqual(self.__get_processed_measurements(), {"synthetic_location_000": 2})
+        self.assertTrue(os.path.exists(os.path.join(test_output_folder, "output", "results", "normalized_sewage_synthetic_location_000.xlsx")))
+        # rewritten files with unchanged measurements are skipped
+        self.__write_input_file("synthetic_location_001", self.sample_locations["synthetic_location_001"].iloc[:-2])
+        self.sewage_quality.location_statistics = dict()
+        self.sewage_quality.serve(self.watch_folder, poll_interval=0, max_polls=2)
+        self.assertEqual(self.__get_processed_measurements(), {})
+
+    def test_failed_location(self):
+        # the dates of one sample location can not be parsed, the other sample location is processed
+        measurements = self.sample_locations["synthetic_location_000"].iloc[:-2].astype({Columns.DATE.value: str})
+        self.__write_input_file("synthetic_location_000", measurements.assign(**{Columns.DATE.value: "invalid"}))
+        self.sewage_quality.serve(self.watch_folder, poll_interval=0, max_polls=2)
+        self.assertEqual(self.__get_processed_measurements(), {"synthetic_location_001": 50})
+        # the input of the failed sample location is read again, the processed sample location is skipped
+        self.__write_input_file("synthetic_location_000", measurements)
+        self.sewage_quality.serve(self.watch_folder, poll_interval=0, max_polls=2)
+        self.assertEqual(self.__get_processed_measurements(), {"synthetic_location_000": 50})
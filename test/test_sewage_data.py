@@ -0,0 +1,72 @@
+import shutil
+import pickle
+import os.path
+from unittest import TestCase
+import numpy as np
+from lib.constant import *
+from lib.sewage import SewageSample
+from lib.sewage_data import convert_sewage_data, load_sewage_samples, read_sewage_data
+from lib.utils import read_input_files
+
+test_output_folder = 'tmp'
+sewage_data_file = os.path.join(os.path.dirname(__file__), "..", "data", "sewageData.dat")
+
+
+def create_samples(num_samples):
+    return [SewageSample.from_dict({'name': "A-STADT_01", 'collectionDate': "2023-01-{:02d}".format(i + 1),
+                                    'biomarker_N1': 10.0 + i, 'crassphage': 1000 + i, 'trockentag': "Ja",
+                                    'bem_lab': None if i % 2 else "Probe {}".format(i),
+                                    'flags': [SewageFlag.BIOMARKER_BELOW_THRESHOLD_OR_EMPTY] if i == 2 else []})
+            for i in range(num_samples)]
+
+
+class TestSewageData(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.pickle_file = os.path.join(test_output_folder, "sewageData.dat")
+        self.arrow_file = os.path.join(test_output_folder, "sewageData.arrow")
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_slotted_sample(self):
+        sample = create_samples(3)[2]
+        self.assertFalse(hasattr(sample, "__dict__"))
+        self.assertIsNone(sample.biomarker_N2)
+        self.assertFalse(sample.discarded)
+        self.assertEqual(pickle.loads(pickle.dumps(sample)).as_dict(), sample.as_dict())
+
+    def test_legacy_pickle(self):
+        with open(sewage_data_file, "rb") as f:
+            sewage_samples = pickle.load(f)
+        sample = sewage_samples["AOE_01"][0]
+        self.assertIsInstance(sample, SewageSample)
+        self.assertEqual(sample.collectionDate, "2022-09-01")
+        # attributes missing in older pickles are set to their defaults
+        self.assertIsNone(sample.end_date)
+
+    def test_convert_and_load(self):
+        sewage_samples = {"A-STADT_01": create_samples(5), "B-LAND_01": create_samples(3)}
+        with open(self.pickle_file, "wb") as f:
+            pickle.dump(sewage_samples, f)
+        self.assertEqual(convert_sewage_data(self.pickle_file, self.arrow_file), 8)
+        self.assertFalse(os.path.exists(self.arrow_file + ".tmp"))
+        loaded_samples = load_sewage_samples(self.arrow_file)
+        self.assertEqual(list(loaded_samples), list(sewage_samples))
+        for sample_location, samples in sewage_samples.items():
+            self.assertEqual([s.as_dict() for s in loaded_samples[sample_location]], [s.as_dict() for s in samples])
+
+    def test_read_measurements(self):
+        with open(self.pickle_file, "wb") as f:
+            pickle.dump({"A-STADT_01": create_samples(5), "B-LAND_01": create_samples(3)}, f)
+        convert_sewage_data(self.pickle_file, self.arrow_file)
+        measurements = dict(read_sewage_data(self.arrow_file, ["B-LAND"]))
+        self.assertEqual(list(measurements), ["B-LAND_01"])
+        self.assertEqual(measurements["B-LAND_01"][Columns.BIOMARKER_N1.value].tolist(), [10.0, 11.0, 12.0])
+        self.assertTrue(np.isnan(measurements["B-LAND_01"][Columns.BIOMARKER_N2.value]).all())
+        # the converted file is an input file of the quality control
+        measurements = dict(read_input_files(self.arrow_file))
+        self.assertEqual(measurements["A-STADT_01"][Columns.DATE.value].tolist()[-1], "2023-01-05")
+        self.assertEqual(measurements["A-STADT_01"][Columns.COMMENT_ANALYSIS.value][0], "Probe 0")
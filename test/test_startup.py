@@ -0,0 +1,34 @@
+import os
+import sys
+import json
+import subprocess
+from unittest import TestCase
+
+repository_folder = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds to import ssqn.py without the plotting and outlier detection libraries
+import_time_budget = 2.0
+
+
+class TestStartup(TestCase):
+
+    def __import_ssqn(self):
+        script = ("import sys, time, json\n"
+                  "start = time.perf_counter()\n"
+                  "import ssqn\n"
+                  "print(json.dumps({'seconds': time.perf_counter() - start, 'modules': list(sys.modules)}))\n")
+        output = subprocess.run([sys.executable, "-c", script], cwd=repository_folder, capture_output=True, text=True, check=True)
+        return json.loads(output.stdout.strip().splitlines()[-1])
+
+    def test_heavy_dependencies_are_not_imported(self):
+        modules = self.__import_ssqn()['modules']
+        for module in ["matplotlib", "seaborn", "adjustText", "sklearn", "scipy", "arcgis"]:
+            self.assertNotIn(module, modules)
+
+    def test_import_time_budget(self):
+        self.assertLess(self.__import_ssqn()['seconds'], import_time_budget)
+
+    def test_help(self):
+        output = subprocess.run([sys.executable, "ssqn.py", "--help"], cwd=repository_folder, capture_output=True, text=True)
+        self.assertEqual(output.returncode, 0)
+        self.assertIn("--no-plots", output.stdout)
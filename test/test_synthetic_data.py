@@ -0,0 +1,51 @@
+import shutil
+import os.path
+from unittest import TestCase
+import pandas as pd
+from lib import utils
+from lib.constant import *
+from benchmark.synthetic_data import generate_measurements, generate_sample_locations, write_sample_locations
+from benchmark.benchmarks import find_regressions
+
+test_output_folder = 'tmp'
+
+
+class TestSyntheticData(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_measurements_in_columns_schema(self):
+        measurements = generate_measurements(num_years=1, samples_per_week=3, missing_rate=0.1, seed=1)
+        self.assertEqual(list(measurements.columns), list(utils.column_map.values()))
+        self.assertEqual(measurements.shape[0], 52 * 3)
+        self.assertTrue(pd.to_datetime(measurements[Columns.DATE.value], format="%Y-%m-%d").is_monotonic_increasing)
+        self.assertTrue(measurements[Columns.BIOMARKER_N3.value].isna().all())
+        self.assertTrue(measurements[Columns.BIOMARKER_N1.value].isna().any())
+        self.assertEqual(set(measurements[Columns.TROCKENTAG.value]), {"Ja", "Nein"})
+        pd.testing.assert_frame_equal(measurements, generate_measurements(num_years=1, samples_per_week=3, missing_rate=0.1, seed=1))
+
+    def test_rates(self):
+        measurements = generate_measurements(num_years=1, missing_rate=0, comment_rate=0, outlier_rate=0)
+        self.assertFalse(measurements[Columns.BIOMARKER_N1.value].isna().any())
+        self.assertTrue(measurements[Columns.COMMENT_ANALYSIS.value].isna().all())
+
+    def test_write_and_read_sample_locations(self):
+        sample_locations = generate_sample_locations(num_locations=2, num_years=0.5)
+        input_file = os.path.join(test_output_folder, "synthetic.parquet")
+        write_sample_locations(sample_locations, input_file)
+        read_locations = dict(utils.read_input_files(input_file))
+        self.assertEqual(sorted(read_locations), sorted(sample_locations))
+        for sample_location, measurements in sample_locations.items():
+            self.assertEqual(read_locations[sample_location].shape[0], measurements.shape[0])
+
+    def test_find_regressions(self):
+        baseline = {"a": {"rows_per_second": 100.0}, "b": {"rows_per_second": 100.0}}
+        results = {"a": {"rows_per_second": 90.0}, "b": {"rows_per_second": 70.0}, "c": {"rows_per_second": 1.0}}
+        regressions = find_regressions(results, baseline, 0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertTrue(regressions[0].startswith("b:"))
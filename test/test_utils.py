@@ -0,0 +1,116 @@
+import os
+import shutil
+from unittest import TestCase
+import pandas as pd
+from lib.utils import column_map, read_excel_input_files, read_input_files, ExcelConversionCache, StageTimer
+
+test_output_folder = 'tmp'
+
+
+class TestReadExcelInputFiles(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.input_file = os.path.join(test_output_folder, "input.xlsx")
+        sheet = pd.DataFrame({column: [1.0, 2.0] for column in column_map})
+        sheet['UNUSED'] = "unused"
+        with pd.ExcelWriter(self.input_file) as writer:
+            for sample_location in ["City_A_01", "City_A_02", "City_B_01"]:
+                sheet.to_excel(writer, sheet_name=sample_location, index=False)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def test_read_all_sample_locations(self):
+        sample_locations = [sample_location for sample_location, _ in read_excel_input_files(self.input_file)]
+        self.assertEqual(sample_locations, ["City_A_01", "City_A_02", "City_B_01"])
+
+    def test_read_selected_sample_locations(self):
+        measurements = dict(read_excel_input_files(self.input_file, ["City_A", "B_01"]))
+        self.assertEqual(list(measurements.keys()), ["City_A_01", "City_A_02", "City_B_01"])
+        measurements = dict(read_excel_input_files(self.input_file, ["City_B"]))
+        self.assertEqual(list(measurements.keys()), ["City_B_01"])
+        self.assertEqual(list(measurements["City_B_01"].columns), list(column_map.values()))
+
+    def test_conversion_cache(self):
+        conversion_cache = ExcelConversionCache(os.path.join(test_output_folder, "cache"))
+        expected = dict(read_excel_input_files(self.input_file))
+        for _ in range(2):
+            measurements = dict(read_excel_input_files(self.input_file, conversion_cache=conversion_cache))
+            for sample_location in expected:
+                pd.testing.assert_frame_equal(expected[sample_location], measurements[sample_location])
+        self.assertEqual((conversion_cache.parsed_sheets, conversion_cache.cached_sheets), (3, 3))
+        sheets = pd.read_excel(self.input_file, sheet_name=None)
+        with pd.ExcelWriter(self.input_file) as writer:
+            for sample_location, sheet in sheets.items():
+                if sample_location == "City_A_02":
+                    sheet.loc[0, 'N1_LAB'] = 5.0
+                sheet.to_excel(writer, sheet_name=sample_location, index=False)
+        measurements = dict(read_excel_input_files(self.input_file, conversion_cache=conversion_cache))
+        self.assertEqual(measurements["City_A_02"]['biomarker_N1'].tolist(), [5.0, 2.0])
+        self.assertEqual((conversion_cache.parsed_sheets, conversion_cache.cached_sheets), (4, 5))
+
+
+class TestReadColumnarInputFiles(TestCase):
+
+    def setUp(self) -> None:
+        os.makedirs(test_output_folder, exist_ok=True)
+        self.measurements = pd.DataFrame({column: [1, 2, None] for column in column_map})
+        self.measurements['ANFANG'] = ["2022-09-01", "2022-09-06", "2022-09-08"]
+        self.measurements['TRO_TAG'] = ["Ja", "Nein", None]
+        self.measurements['UNUSED'] = "unused"
+        self.measurements['location'] = ["City_A_01", "City_B_01", "City_A_01"]
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __assert_measurements(self, input_file):
+        measurements = dict(read_input_files(input_file, ["City_A"]))
+        self.assertEqual(list(measurements.keys()), ["City_A_01"])
+        self.assertEqual(list(measurements["City_A_01"].columns), list(column_map.values()))
+        self.assertEqual(measurements["City_A_01"]['collectionDate'].tolist(), ["2022-09-01", "2022-09-08"])
+        self.assertEqual(measurements["City_A_01"]['biomarker_N1'].dtype, float)
+        self.assertTrue(pd.isna(measurements["City_A_01"].loc[1, 'trockentag']))
+
+    def test_read_parquet(self):
+        input_file = os.path.join(test_output_folder, "input.parquet")
+        self.measurements.to_parquet(input_file, index=False)
+        self.__assert_measurements(input_file)
+
+    def test_read_partitioned_parquet_dataset(self):
+        input_folder = os.path.join(test_output_folder, "input")
+        self.measurements.to_parquet(input_folder, index=False, partition_cols=['location'])
+        self.__assert_measurements(input_folder)
+
+    def test_read_feather(self):
+        input_file = os.path.join(test_output_folder, "input.feather")
+        self.measurements.to_feather(input_file)
+        self.__assert_measurements(input_file)
+
+    def test_read_csv_folder(self):
+        input_folder = os.path.join(test_output_folder, "input")
+        os.makedirs(input_folder)
+        for sample_location, measurements in self.measurements.groupby('location'):
+            measurements.drop(columns=['location']).to_csv(os.path.join(input_folder, sample_location + ".csv"), index=False)
+        self.__assert_measurements(input_folder)
+
+
+class TestStageTimer(TestCase):
+
+    def test_measure_and_add_timings(self):
+        timer = StageTimer()
+        with timer.measure("stage_a"):
+            pass
+        with timer.measure("stage_a"):
+            pass
+        timer.add("stage_b", 2.0)
+        self.assertEqual(list(timer.to_dict()), ["stage_a", "stage_b"])
+        self.assertEqual(timer.to_dict()["stage_a"]["calls"], 2)
+        total_timer = StageTimer()
+        total_timer.add_timings(timer.to_dict())
+        total_timer.add_timings(timer.to_dict())
+        self.assertEqual(total_timer.to_dict()["stage_b"], {"seconds": 4.0, "calls": 2})
+        timer.reset()
+        self.assertEqual(timer.to_dict(), {})
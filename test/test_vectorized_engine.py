@@ -0,0 +1,155 @@
+import itertools
+import shutil
+import os.path
+from unittest import TestCase
+from pandas.testing import *
+import numpy as np
+import pandas as pd
+from lib import constant
+from lib import statistics
+from lib.biomarkerQC import BiomarkerQC
+from lib.surrogatevirusQC import SurrogateVirusQC
+from lib.sewage_flow import SewageFlow
+from lib.water_quality import WaterQuality
+from lib.normalization import SewageNormalization
+from lib.measurement_arrays import MeasurementArrays
+from lib.compact_dtypes import compact_measurements
+from benchmark.synthetic_data import generate_measurements
+
+test_output_folder = 'tmp'
+
+
+def create_measurements(num_samples=50, seed=1) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    measurements = pd.DataFrame()
+    measurements[constant.Columns.DATE.value] = pd.date_range("2022-01-03", periods=num_samples, freq="4D")
+    measurements[constant.Columns.COMMENT_ANALYSIS.value] = np.where(rng.random(num_samples) < 0.05, "comment", "")
+    measurements[constant.Columns.COMMENT_OPERATION.value] = ""
+    for biomarker in constant.Columns.get_biomarker_columns():
+        values = rng.lognormal(3, 0.3, num_samples)
+        values[rng.random(num_samples) < 0.1] = np.NAN
+        values[rng.random(num_samples) < 0.05] *= 20
+        measurements[biomarker] = values
+    for column, mean in [(constant.Columns.AMMONIUM.value, 40), (constant.Columns.CONDUCTIVITY.value, 1200),
+                         (constant.Columns.MEAN_SEWAGE_FLOW.value, 100), (constant.Columns.CRASSPHAGE.value, 1e5),
+                         (constant.Columns.PMMOV.value, 1e6)]:
+        values = rng.normal(mean, mean * 0.1, num_samples)
+        values[rng.random(num_samples) < 0.08] *= 4
+        values[rng.random(num_samples) < 0.05] = np.NAN
+        measurements[column] = values
+    measurements[constant.Columns.TROCKENTAG.value] = np.where(rng.random(num_samples) < 0.8, "Ja", "Nein")
+    initialize_calculated_columns(measurements)
+    return measurements
+
+
+def create_synthetic_measurements(num_years=1, seed=0) -> pd.DataFrame:
+    """ Returns the measurements of 'generate_measurements' with parsed dates and initialized calculated columns """
+    measurements = generate_measurements(num_years=num_years, seed=seed)
+    measurements[constant.Columns.DATE.value] = pd.to_datetime(measurements[constant.Columns.DATE.value])
+    for column in [constant.Columns.COMMENT_ANALYSIS.value, constant.Columns.COMMENT_OPERATION.value]:
+        measurements[column] = measurements[column].fillna("")
+    initialize_calculated_columns(measurements)
+    return measurements
+
+
+def initialize_calculated_columns(measurements: pd.DataFrame):
+    for biomarker in constant.Columns.get_biomarker_columns():
+        measurements[constant.CalculatedColumns.get_biomarker_flag(biomarker)] = 0
+    for biomarker1, biomarker2 in itertools.combinations(constant.Columns.get_biomarker_columns(), 2):
+        measurements[biomarker1 + "/" + biomarker2] = np.NAN
+        measurements[constant.CalculatedColumns.get_biomaker_ratio_flag(biomarker1, biomarker2)] = 0
+    for c in constant.CalculatedColumns:
+        if c.type == bool:
+            measurements[c.value] = c == constant.CalculatedColumns.NEEDS_PROCESSING
+        elif c.type == str:
+            measurements[c.value] = ""
+        else:
+            measurements[c.value] = 0
+        measurements[c.value] = measurements[c.value].astype(c.type)
+
+
+class TestVectorizedEngine(TestCase):
+
+    def setUp(self) -> None:
+        self.__create_steps(['iqr'])
+
+    def __create_steps(self, outlier_detection_methods):
+        self.sewageStat = statistics.SewageStat()
+        self.biomarkerQC = BiomarkerQC(test_output_folder, self.sewageStat, outlier_detection_methods, 1.5, 9, 50, 2)
+        self.surrogateQC = SurrogateVirusQC(self.sewageStat, 4, 9, outlier_detection_methods, test_output_folder)
+        self.sewage_flow = SewageFlow(test_output_folder, self.sewageStat, dict(), 0.1, 5, 2.0, 1.5, 9.0)
+        self.water_quality = WaterQuality(test_output_folder, self.sewageStat, 4, 9, outlier_detection_methods)
+        self.normalization = SewageNormalization(self.sewageStat, 2, 2, 3.8, 7, test_output_folder)
+
+    def tearDown(self) -> None:
+        if os.path.exists(test_output_folder):
+            shutil.rmtree(test_output_folder)
+
+    def __run_row_wise(self, measurements: pd.DataFrame) -> str:
+        self.sewageStat.set_sample_location_and_total_number('', measurements.shape[0])
+        self.biomarkerQC.standardize_biomarker_values('', measurements)
+        for index, current_measurement in measurements.iterrows():
+            if constant.CalculatedColumns.needs_processing(current_measurement):
+                self.biomarkerQC.check_comments('', measurements, index)
+                self.biomarkerQC.check_mean_sewage_flow_present('', measurements, index)
+                self.biomarkerQC.biomarker_below_threshold_or_empty('', measurements, index)
+                self.biomarkerQC.calculate_biomarker_ratios('', measurements, index)
+                self.biomarkerQC.detect_outliers('', measurements, index)
+                self.biomarkerQC.assign_biomarker_outliers_based_on_ratio_flags('', measurements, index)
+                self.biomarkerQC.analyze_usable_biomarkers('', measurements, index)
+                self.surrogateQC.filter_dry_days_time_frame('', measurements, index)
+                self.surrogateQC.is_surrogatevirus_outlier('', measurements, index)
+                self.sewage_flow.sewage_flow_quality_control('', measurements, index)
+                self.water_quality.check_water_quality('', measurements, index)
+                self.normalization.normalize_biomarker_values('', measurements, index)
+                self.normalization.decide_biomarker_usable_based_on_flags('', measurements, index)
+        return self.sewageStat.print_statistics()
+
+    def __run_vectorized(self, measurements: pd.DataFrame) -> str:
+        self.sewageStat.set_sample_location_and_total_number('', measurements.shape[0])
+        self.biomarkerQC.standardize_biomarker_values('', measurements)
+        arrays = MeasurementArrays(measurements)
+        self.biomarkerQC.process_location('', arrays)
+        self.surrogateQC.process_location('', arrays)
+        self.sewage_flow.process_location('', arrays)
+        self.water_quality.process_location('', arrays)
+        self.normalization.process_location('', arrays)
+        arrays.write_back(measurements)
+        return self.sewageStat.print_statistics()
+
+    def test_flags_identical_to_row_wise_processing(self):
+        row_wise_measurements = create_measurements()
+        vectorized_measurements = row_wise_measurements.copy()
+        row_wise_statistics = self.__run_row_wise(row_wise_measurements)
+        vectorized_statistics = self.__run_vectorized(vectorized_measurements)
+        assert_frame_equal(row_wise_measurements, vectorized_measurements, check_exact=True)
+        self.assertEqual(row_wise_statistics, vectorized_statistics)
+
+    def test_flags_identical_for_outlier_detection_methods(self):
+        for outlier_detection_methods in [['zscore'], ['ci'], ['lof'], ['svm'], ['iqr', 'lof']]:
+            with self.subTest(outlier_detection_methods=outlier_detection_methods):
+                self.__create_steps(outlier_detection_methods)
+                row_wise_measurements = create_synthetic_measurements()
+                vectorized_measurements = row_wise_measurements.copy()
+                row_wise_statistics = self.__run_row_wise(row_wise_measurements)
+                vectorized_statistics = self.__run_vectorized(vectorized_measurements)
+                assert_frame_equal(row_wise_measurements, vectorized_measurements, check_exact=True)
+                self.assertEqual(row_wise_statistics, vectorized_statistics)
+
+    def test_flags_identical_with_compact_dtypes(self):
+        row_wise_measurements = create_synthetic_measurements()
+        compact_measurements(row_wise_measurements)
+        vectorized_measurements = row_wise_measurements.copy()
+        row_wise_statistics = self.__run_row_wise(row_wise_measurements)
+        vectorized_statistics = self.__run_vectorized(vectorized_measurements)
+        assert_frame_equal(row_wise_measurements, vectorized_measurements, check_exact=True)
+        self.assertEqual(row_wise_statistics, vectorized_statistics)
+
+    def test_only_rows_needing_processing(self):
+        row_wise_measurements = create_measurements(num_samples=40, seed=2)
+        row_wise_measurements.loc[:20, constant.CalculatedColumns.NEEDS_PROCESSING.value] = False
+        vectorized_measurements = row_wise_measurements.copy()
+        self.__run_row_wise(row_wise_measurements)
+        self.__run_vectorized(vectorized_measurements)
+        assert_frame_equal(row_wise_measurements, vectorized_measurements, check_exact=True)
+        self.assertTrue((vectorized_measurements.loc[:20, constant.CalculatedColumns.FLAG.value] == 0).all())